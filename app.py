@@ -15,8 +15,37 @@ import plotly.express as px # For interactive charts
 from openai import OpenAI # For Perplexity AI
 import re           # For cleaning markdown
 import numpy as np  # For generating sample sonar data (e.g., spectrograms)
-from PIL import Image # For handling image uploads
-import io # For handling file streams
+import os # For the on-disk scan store location
+import hashlib # For spectrogram version fingerprints
+import tempfile # For spill directories and archive temp files
+import uuid # For per-session upload store keys
+import weakref # For per-array fingerprint caching
+import atexit # For removing the upload spill directory on shutdown
+import threading # For per-thread partial file names
+from sonar_hub.synthesis import SpectrogramRecipe # Vectorized, seeded spectrogram engine
+from sonar_hub.simulation import detect_scan_targets, simulate_scan, simulation_key, simulation_scan_id, sweep_grid, run_sweep, scan_summary_row # Deterministic simulation core and sweeps
+from sonar_hub.parallel import default_workers # Shared process pool for CPU-bound work
+from sonar_hub.registry import ScanRegistry # Lazy, metadata-first scan catalog
+from sonar_hub.target_catalog import TargetCatalog # Columnar, indexed catalog of all detected targets
+from sonar_hub.scan_stats import ScanStats # Incrementally maintained dashboard aggregates
+from sonar_hub.scan_store import ScanStore # Persistent, memory-mapped scan storage
+from sonar_hub.sources import SOURCE_ERRORS, InMemoryScanSource, HttpScanSource, ChainedScanSource # Async scan backends with prefetch
+from sonar_hub.cache import LRUCache # Bounded caches shared across sessions
+from sonar_hub.lod import LodPyramid, REDUCTIONS # Level-of-detail downsampling for rendering
+from sonar_hub.raster import encode_png # Colormapped PNG previews for fast triage
+from sonar_hub.hyperbola import detect_hyperbolas # Hough hyperbola fits for GPR utility lines
+from sonar_hub.denoise import apply_chain, make_chain # Tiled noise-reduction filter chains
+from sonar_hub.export import EXPORT_FORMATS, available_formats, export_scan, import_scan # Binary scan export / re-import
+from sonar_hub.archive import ARCHIVE_FORMATS, estimate_archive_bytes, select_scans, write_archive # Streaming zip/tar export of the whole catalog
+from sonar_hub.fusion import DEFAULT_FEATHER, MIN_ALIGNMENT_PEAK_RATIO, fuse_scans # Aligned, tiled mosaics of overlapping scans
+from sonar_hub.chat_context import ConversationContext, truncate_to_tokens # Token-budgeted chat history
+from sonar_hub.response_cache import ResponseCache, make_cache_key # Persistent cache for repeated AI questions
+from sonar_hub.ingest import ingest_csv # Chunked CSV ingestion for large uploaded logs
+from sonar_hub.upload_store import UploadStore, decode_image # Thumbnails in session, full-resolution uploads spilled to disk
+from sonar_hub.parse_cache import ParseCache, content_digest # Parsed uploads shared by content hash
+from sonar_hub.stft import STFT_SCALES, STFT_WINDOWS, stft_from_csv # Streaming STFT of uploaded time series
+from sonar_hub.binary_formats import (BINARY_EXTENSIONS, RAW_EXTENSIONS, SIDECAR_EXTENSIONS, open_binary_scan,
+                                      parse_sidecar) # Memory-mapped raw / SEG-Y / XTF readers
 
 # --- Early Configuration: MUST BE FIRST STREAMLIT COMMAND ---
 st.set_page_config(
@@ -31,10 +60,14 @@ st.set_page_config(
 # Example structure in secrets.toml:
 # [perplexity_api]
 # api_key = "YOUR_PERPLEXITY_API_KEY" 
+# context_token_budget = 6000 # Optional: max prompt tokens per chat request (older turns are summarized)
+# response_cache_path = "/var/lib/sonar-hub/responses.sqlite3" # Optional: shared AI response cache file
 # # Note: The Perplexity API key might start with "pplx-"
-# [sonar_data_api] # Placeholder for potential future API
+# [sonar_data_api] # Optional remote scan API, listed alongside local scans in "Explore Scan Data"
 # base_url = "YOUR_SONAR_DATA_API_ENDPOINT"
 # api_key = "YOUR_SONAR_DATA_API_KEY"
+# [scan_store] # Optional: where simulated/imported scans are persisted (shared by all sessions and processes)
+# path = "/var/lib/sonar-hub/scans"
 
 try:
     PERPLEXITY_API_KEY = st.secrets["perplexity_api"]["api_key"]
@@ -42,10 +75,14 @@ except (AttributeError, KeyError, TypeError): # Added TypeError for st.secrets b
     st.error("🚨 **Config Error:** Perplexity API Key (`perplexity_api.api_key`) missing. Perplexity AI Assistant disabled.", icon="⚙️")
     PERPLEXITY_API_KEY = None
 
-# Placeholder for future Sonar Data API config
+# Remote Sonar Data API config (optional; see sonar_hub.sources for the expected endpoints)
 SONAR_API_BASE_URL = st.secrets.get("sonar_data_api", {}).get("base_url")
 SONAR_API_KEY = st.secrets.get("sonar_data_api", {}).get("api_key")
 
+# Persistent scan store (index.json + one .npy per spectrogram). Env var wins over secrets so worker processes can share it.
+SCAN_STORE_DIR = os.environ.get("SONAR_SCAN_STORE_DIR") or st.secrets.get("scan_store", {}).get("path") \
+    or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sonar_scan_store")
+
 
 # --- System Instruction for Perplexity AI (Sonar Focus) ---
 APP_LOAD_TIME_STR = datetime.now().strftime('%A, %B %d, %Y')
@@ -363,74 +400,17 @@ st.markdown(
 
 # --- Global Variables &  Data ---
 
-def generate__spectrogram(target_type="clear", height=128, width=256):
-    """Generates a simple noisy spectrogram with a potential target signature."""
-    data = np.random.rand(height, width) * 0.3 # Background noise
-    if target_type == "object_strong": # Large, clear object
-        y_center, x_center = height // 2, width // 2
-        y_range, x_range = height // 7, width // 5 # Made slightly larger
-        data[y_center - y_range : y_center + y_range, x_center - x_range : x_center + x_range] += np.random.rand(2*y_range, 2*x_range) * 0.75 # Stronger signal
-        # Add some seabed reflection if applicable (e.g., sea context)
-        if height > 50 and "Sea" in st.session_state.get("current_sim_type",""): # check context if available
-             data[int(height*0.8):int(height*0.95), :] += 0.25 + np.random.rand(int(height*0.15), width)*0.1
-    elif target_type == "object_faint": # Smaller, less distinct object
-        y_center, x_center = height // rnd_choice([2,3,4]), width // rnd_choice([2,3,4]) # Randomized position
-        y_range, x_range = height // rnd_choice([10,12,15]), width // rnd_choice([6,8,10]) # Smaller size
-        data[y_center - y_range : y_center + y_range, x_center - x_range : x_center + x_range] += np.random.rand(2*y_range, 2*x_range) * 0.35 # Fainter signal
-    elif target_type == "layered_gpr": # GPR layers
-        for i in range(np.random.randint(2,5)): # 2 to 4 layers
-            layer_depth = int(height * (0.2 + i*0.2 + np.random.uniform(-0.05, 0.05)))
-            thickness = int(height * (0.04 + np.random.rand()*0.06))
-            if layer_depth + thickness < height and layer_depth >=0:
-                 data[layer_depth:layer_depth+thickness, :] += 0.25 + np.random.rand(thickness, width)*0.2
-    elif target_type == "utility_gpr": # GPR hyperbolic signatures for utilities
-        num_utilities = np.random.randint(1, 4)
-        for _ in range(num_utilities):
-            center_x = np.random.randint(width // 4, 3 * width // 4)
-            apex_y = np.random.randint(height // 4, height // 2)
-            # Simple hyperbolic shape
-            for x_offset in range(-width // 8, width // 8):
-                y_val = apex_y + int(0.05 * (x_offset**2) / (width/32)) # Exaggerate hyperbola for visibility
-                if 0 <= center_x + x_offset < width and 0 <= y_val < height:
-                    data[y_val, center_x + x_offset] = min(1, data[y_val, center_x + x_offset] + 0.6)
-                    if y_val+1 < height: data[y_val+1, center_x + x_offset] = min(1, data[y_val+1, center_x + x_offset] + 0.4) # Thicken
-    elif target_type == "small_objects_sea": # Multiple small, faint objects
-        num_objects = np.random.randint(3,7)
-        for _ in range(num_objects):
-            y_center, x_center = np.random.randint(0, height), np.random.randint(0,width)
-            y_r, x_r = height // np.random.randint(18,30), width // np.random.randint(12,20) # very small
-            y_start, y_end = max(0, y_center-y_r), min(height, y_center+y_r)
-            x_start, x_end = max(0, x_center-x_r), min(width, x_center+x_r)
-            if y_start < y_end and x_start < x_end:
-                 data[y_start:y_end, x_start:x_end] += np.random.rand(y_end-y_start, x_end-x_start) * np.random.uniform(0.25, 0.45)
-    elif target_type == "cluttered_air": # Multiple faint reflections for air sonar
-        num_echoes = np.random.randint(5,15)
-        for _ in range(num_echoes):
-            y_c, x_c = np.random.randint(height//4, height), np.random.randint(width//4, width) # Avoid edge
-            y_r, x_r = height // np.random.randint(15,25), width // np.random.randint(10,18)
-            y_s,y_e = max(0,y_c-y_r), min(height,y_c+y_r)
-            x_s,x_e = max(0,x_c-x_r), min(width,x_c+x_r)
-            if y_s < y_e and x_s < x_e:
-                data[y_s:y_e, x_s:x_e] += np.random.rand(y_e-y_s, x_e-x_s) * np.random.uniform(0.2, 0.4)
-    return np.clip(data, 0, 1)
-
-def rnd_choice(options): # Helper for variety in spectrograms
-    return np.random.choice(options)
-
-_SONAR_DATA = {
+# Metadata plus a spectrogram recipe. Targets and summaries come from running the detectors once at startup; after that
+# arrays are only built when a scan is opened
+_PRELOADED_SCANS = {
     "SEA001": {
         "scan_id": "SEA001",
         "sonar_type": "Sea (Side-Scan Sonar)",
         "timestamp": (datetime.now(timezone.utc) - timedelta(days=2, hours=5)).strftime("%Y-%m-%d %H:%M UTC"),
         "location_": "Coastal Region A1 - Seabed Survey",
         "parameters": {"frequency_khz": 400, "range_m": 150, "depth_m": 45, "operator": "Dr. Sonar"},
-        "spectrogram_data": generate__spectrogram("object_strong", height=150, width=300),
-        "color_scale": "Viridis",
-        "detected_targets": [
-            {"id": "TGT001", "type": "Man-Made Object (Possible Wreck)", "confidence": 0.78, "range_m": 75, "size_m_approx": "5x2", "details": "Strong acoustic signature, rectangular shape."},
-            {"id": "TGT002", "type": "Natural Rock Formation", "confidence": 0.95, "range_m": 110, "size_m_approx": "8x5", "details": "Irregular shape, matches seabed geology."}
-        ],
-        "summary": "Scan SEA001 shows a significant man-made object and a large natural rock formation. Seabed appears to be sandy with some undulation."
+        "spectrogram_recipe": SpectrogramRecipe("object_strong", height=150, width=300, seed=1001),
+        "color_scale": "Viridis"
     },
     "LAND001": {
         "scan_id": "LAND001",
@@ -438,13 +418,8 @@ _SONAR_DATA = {
         "timestamp": (datetime.now(timezone.utc) - timedelta(days=1, hours=2)).strftime("%Y-%m-%d %H:%M UTC"),
         "location_": "Site B - Archeological Dig Area 3",
         "parameters": {"frequency_mhz": 250, "depth_m_max": 5, "survey_line": "L004"},
-        "spectrogram_data": generate__spectrogram("layered_gpr", height=200, width=400), # Radargram
-        "color_scale": "Plasma",
-        "detected_targets": [
-            {"id": "TGT003", "type": "Buried Structure (Foundation Wall)", "confidence": 0.82, "depth_m_approx": 1.5, "material_guess": "Stone/Brick", "details": "Linear feature with strong reflection."},
-            {"id": "TGT004", "type": "Utility Pipe", "confidence": 0.70, "depth_m_approx": 0.8, "material_guess": "PVC/Metal", "details": "Hyperbolic reflection signature, small diameter."}
-        ],
-        "summary": "GPR Scan LAND001 reveals a potential buried foundation wall at ~1.5m and a utility pipe closer to the surface."
+        "spectrogram_recipe": SpectrogramRecipe("layered_gpr", height=200, width=400, seed=1002), # Radargram
+        "color_scale": "Plasma"
     },
     "AIR001": {
         "scan_id": "AIR001",
@@ -452,13 +427,8 @@ _SONAR_DATA = {
         "timestamp": (datetime.now(timezone.utc) - timedelta(hours=3)).strftime("%Y-%m-%d %H:%M UTC"),
         "location_": "Indoor Test Environment - Chamber 2",
         "parameters": {"frequency_khz": 40, "scan_angle_deg": 90, "max_range_m": 10},
-        "spectrogram_data": generate__spectrogram("object_faint", height=100, width=200),
-        "color_scale": "Cividis",
-        "detected_targets": [
-            {"id": "TGT005", "type": "Flat Surface (Wall)", "confidence": 0.98, "distance_m": 5.2, "orientation_deg": 0, "details": "Consistent echo across multiple sensors."},
-            {"id": "TGT006", "type": "Small Obstacle", "confidence": 0.65, "distance_m": 2.1, "size_m_approx": "0.3x0.3", "details": "Localized echo, possibly cylindrical."}
-        ],
-        "summary": "Airborne ultrasonic scan AIR001 mapped a wall at 5.2m and detected a small obstacle at 2.1m."
+        "spectrogram_recipe": SpectrogramRecipe("object_faint", height=100, width=200, seed=1003),
+        "color_scale": "Cividis"
     },
     "SEA002": {
         "scan_id": "SEA002",
@@ -466,13 +436,8 @@ _SONAR_DATA = {
         "timestamp": (datetime.now(timezone.utc) - timedelta(days=5, hours=10)).strftime("%Y-%m-%d %H:%M UTC"),
         "location_": "Shallow Reef Zone - Small Target Search",
         "parameters": {"frequency_khz": 600, "range_m": 75, "depth_m": 20, "operator": "Ops Team Bravo"},
-        "spectrogram_data": generate__spectrogram("small_objects_sea", height=120, width=280),
-        "color_scale": "Inferno",
-        "detected_targets": [
-            {"id": "TGT007", "type": "Small Debris Field", "confidence": 0.65, "range_m": 40, "size_m_approx": " Scattered <1m pieces", "details": "Multiple small, weak acoustic signatures."},
-            {"id": "TGT008", "type": "Seabed Scour", "confidence": 0.80, "range_m": 55, "size_m_approx": "3m length", "details": "Linear depression on seabed."}
-        ],
-        "summary": "High-frequency scan SEA002 identified a scattered debris field and seabed scour marks in the shallow reef zone. Several minor anomalies present."
+        "spectrogram_recipe": SpectrogramRecipe("small_objects_sea", height=120, width=280, seed=1004),
+        "color_scale": "Inferno"
     },
     "LAND002": {
         "scan_id": "LAND002",
@@ -480,13 +445,8 @@ _SONAR_DATA = {
         "timestamp": (datetime.now(timezone.utc) - timedelta(days=3, hours=7)).strftime("%Y-%m-%d %H:%M UTC"),
         "location_": "Urban Area - Utility Mapping Project",
         "parameters": {"frequency_mhz": 400, "depth_m_max": 3, "survey_line": "U007B"},
-        "spectrogram_data": generate__spectrogram("utility_gpr", height=180, width=350),
-        "color_scale": "Magma", 
-        "detected_targets": [
-            {"id": "TGT009", "type": "Suspected Gas Line", "confidence": 0.85, "depth_m_approx": 1.2, "material_guess": "Metal/PE", "details": "Clear hyperbolic reflection, medium diameter."},
-            {"id": "TGT010", "type": "Possible Conduit/Cable", "confidence": 0.70, "depth_m_approx": 0.6, "material_guess": "Unknown", "details": "Fainter, smaller hyperbolic signature."}
-        ],
-        "summary": "GPR Scan LAND002 for utility mapping detected a probable gas line at 1.2m and another shallower linear anomaly, possibly a conduit."
+        "spectrogram_recipe": SpectrogramRecipe("utility_gpr", height=180, width=350, seed=1005),
+        "color_scale": "Magma"
     },
     "AIR002": {
         "scan_id": "AIR002",
@@ -494,18 +454,55 @@ _SONAR_DATA = {
         "timestamp": (datetime.now(timezone.utc) - timedelta(hours=8)).strftime("%Y-%m-%d %H:%M UTC"),
         "location_": "Cluttered Warehouse Aisle 3",
         "parameters": {"frequency_khz": 50, "scan_angle_deg": 120, "max_range_m": 5},
-        "spectrogram_data": generate__spectrogram("cluttered_air", height=110, width=220),
-        "color_scale": "Turbo",
-        "detected_targets": [
-            {"id": "TGT011", "type": "Pallet Rack Shelf", "confidence": 0.90, "distance_m": 2.5, "orientation_deg": -15, "details": "Strong planar reflection."},
-            {"id": "TGT012", "type": "Stacked Boxes", "confidence": 0.75, "distance_m": 1.5, "size_m_approx": "1.0x0.8", "details": "Multiple intermittent echoes, irregular shape."},
-            {"id": "TGT013", "type": "Overhead Pipe", "confidence": 0.60, "distance_m": 3.8, "size_m_approx": "0.1 diameter", "details": "Weak, localized echo from above scan center."}
-        ],
-        "summary": "Ultrasonic scan AIR002 in a cluttered warehouse identified a pallet rack, stacked boxes, and a potential overhead pipe."
+        "spectrogram_recipe": SpectrogramRecipe("cluttered_air", height=110, width=220, seed=1006),
+        "color_scale": "Turbo"
     }
 }
 
 
+MAX_CACHED_SPECTROGRAMS = 8 # Built spectrograms kept in memory; older ones are rebuilt from their recipe on demand
+
+@st.cache_resource
+def load_scan_registry(store_dir):
+    """Builds the process-wide scan registry once; Streamlit reruns reuse it instead of regenerating every spectrogram.
+    Pre-loaded scans get their targets from the same detectors as simulated scans."""
+    registry = ScanRegistry(max_cached_spectrograms=MAX_CACHED_SPECTROGRAMS, store=ScanStore(store_dir))
+    for scan_meta in _PRELOADED_SCANS.values():
+        scan_meta = dict(scan_meta)
+        recipe = scan_meta.pop("spectrogram_recipe")
+        params = scan_meta["parameters"]
+        scan_depth_range = next((params[k] for k in ("range_m", "depth_m_max", "max_range_m") if params.get(k)), None)
+        spectrogram = recipe()
+        targets = detect_scan_targets(scan_meta["sonar_type"], spectrogram, scan_depth_range, id_prefix=f"TGT_{scan_meta['scan_id']}")
+        scan_meta["spectrogram_shape"] = list(spectrogram.shape) # Lets the catalog archive estimate its size without rebuilding it
+        scan_meta["spectrogram_dtype"] = spectrogram.dtype.str
+        target_types = sorted({target["type"] for target in targets})
+        scan_meta["detected_targets"] = targets
+        scan_meta["summary"] = (f"Scan {scan_meta['scan_id']} of {scan_meta['location_']}: {len(targets)} target(s) detected"
+                                + (f" ({', '.join(target_types)})." if target_types else "."))
+        registry.register(scan_meta, recipe) # The detection array is not kept; opening the scan rebuilds it
+    return registry
+
+@st.cache_resource
+def load_target_catalog(_registry):
+    """Process-wide target catalog, kept in step with the registry through its change listener."""
+    catalog = TargetCatalog()
+    catalog.follow(_registry)
+    return catalog
+
+@st.cache_resource
+def load_scan_stats(_registry):
+    """Process-wide dashboard statistics, updated by the registry's change listener instead of recounted per rerun."""
+    stats = ScanStats()
+    stats.follow(_registry)
+    return stats
+
+_SONAR_DATA = load_scan_registry(SCAN_STORE_DIR)
+_TARGET_CATALOG = load_target_catalog(_SONAR_DATA)
+_SCAN_STATS = load_scan_stats(_SONAR_DATA)
+_SONAR_DATA.sync() # Pick up scans saved by other sessions/processes since the last rerun
+
+
 SONAR_TECHNOLOGIES_INFO = [
     {
         "name": "Side-Scan Sonar (SSS)",
@@ -572,119 +569,131 @@ def configure_perplexity_client(api_key):
         print(f"Error configuring Perplexity client: {e}")
         return None
 
+CHAT_STREAM_REFRESH_S = 0.05 # Minimum interval between placeholder redraws while tokens stream in
+
+CHAT_MODEL = "sonar-pro"
+CHAT_TEMPERATURE = 0.7
+
+def stream_chat_completion(client, messages, placeholder, model=CHAT_MODEL, temperature=CHAT_TEMPERATURE):
+    """Streams a chat completion into `placeholder` token by token; returns (final cleaned text, finish_reason)."""
+    stream = client.chat.completions.create(
+        model=model, # Or "sonar-medium-online", "sonar-small-online"
+        messages=messages,
+        temperature=temperature, # Perplexity default, or adjust (e.g. 0.5)
+        stream=True,
+    )
+    streamed_parts = []
+    finish_reason = None
+    last_redraw = 0.0
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.delta is not None and choice.delta.content:
+            streamed_parts.append(choice.delta.content)
+            if time.monotonic() - last_redraw >= CHAT_STREAM_REFRESH_S:
+                placeholder.markdown(clean_markdown("".join(streamed_parts)) + " ▌")
+                last_redraw = time.monotonic()
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+
+    raw_txt = "".join(streamed_parts)
+    if raw_txt:
+        cleaned_txt = clean_markdown(raw_txt)
+        if finish_reason and finish_reason != "stop":
+            cleaned_txt += f"\n\n*(Note: Response may have been truncated. Finish reason: {finish_reason})*"
+    else:
+        cleaned_txt = "⚠️ No valid response content received from AI."
+        print(f"Perplexity AI stream returned no content (finish reason: {finish_reason}).")
+    placeholder.markdown(cleaned_txt)
+    return cleaned_txt, finish_reason
+
+# Response cache for repeated questions: TTL + LRU limited, shared by all sessions/processes via one SQLite file
+RESPONSE_CACHE_PATH = st.secrets.get("perplexity_api", {}).get("response_cache_path") \
+    or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sonar_response_cache", "responses.sqlite3")
+RESPONSE_CACHE_TTL_S = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+
+@st.cache_resource
+def load_response_cache(path):
+    """Opens the on-disk AI response cache once per process."""
+    return ResponseCache(path, ttl_s=RESPONSE_CACHE_TTL_S, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+response_cache = load_response_cache(RESPONSE_CACHE_PATH)
+
+# Conversation context: last N turns verbatim, older turns folded into a cached summary, total under a token budget
+CHAT_CONTEXT_TOKEN_BUDGET = int(st.secrets.get("perplexity_api", {}).get("context_token_budget", 6000))
+CHAT_CONTEXT_KEEP_TURNS = 6
+CHAT_SUMMARY_MODEL = "sonar" # Smaller model is enough for summarizing
+
+def summarize_chat_history(previous_summary, messages, max_tokens):
+    """Folds older chat turns into the running summary with one short, non-streamed Perplexity call."""
+    transcript = "\n".join(f"{m['role'].capitalize()}: {truncate_to_tokens(m['content'], 400, keep='head')}" for m in messages)
+    response = perplexity_client.chat.completions.create(
+        model=CHAT_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "You maintain a concise running summary of a conversation between a user and a sonar analysis assistant. Keep facts, user goals, file names and open questions. Reply with the updated summary only."},
+            {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns to fold in:\n{transcript}"},
+        ],
+        temperature=0.2,
+        max_tokens=max_tokens,
+    )
+    return response.choices[0].message.content
+
 perplexity_client = None # Initialize
 if PERPLEXITY_API_KEY:
     perplexity_client = configure_perplexity_client(PERPLEXITY_API_KEY)
 
 
-@st.cache_data(ttl=600) # Cache for 10 minutes
+@st.cache_resource
+def load_scan_source(base_url, api_key, _registry):
+    """Builds the ScanSource behind get__scan_details: the local registry, chained with the remote scan API when configured."""
+    local_source = InMemoryScanSource(_registry)
+    if not base_url:
+        return local_source
+    try:
+        return ChainedScanSource(local_source, HttpScanSource(base_url, api_key))
+    except ImportError as e_source:
+        print(f"Remote scan API disabled: {e_source}")
+        return local_source
+
+scan_source = load_scan_source(SONAR_API_BASE_URL, SONAR_API_KEY, _SONAR_DATA)
+
 def get__scan_details(scan_id):
-    """Simulates fetching sonar scan information."""
-    print(f"Simulating fetching data for Scan ID: {scan_id}")
-    time.sleep(0.5) # Simulate network delay
-    return _SONAR_DATA.get(scan_id.upper())
-
-@st.cache_data(ttl=300) # Cache for 5 minutes
-def run_new_scan_(sonar_type, area_name, primary_frequency, scan_depth_range, custom_notes):
-    """Simulates running a new sonar scan and generating basic results, ensuring targets are created."""
-    print(f"Simulating new scan for: Type: {sonar_type}, Area: {area_name}")
-    time.sleep(0.7) # Simulate processing delay
-
-    scan_id = f"SIM{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
-
-    st.session_state.current_sim_type = sonar_type # For spectrogram generator context
-    targets = [] # Initialize targets list
-
-    if "Sea" in sonar_type or "SSS" in sonar_type:
-        base_type = "Sea (Side-Scan Sonar)"
-        spectrogram_data = generate__spectrogram(np.random.choice(["object_strong", "object_faint", "clear", "small_objects_sea"]))
-        color_scale = "Viridis"
-        params = {"frequency_khz": primary_frequency or 300, "range_m": scan_depth_range or 100, "sim_operator": "AutoSim"}
-        # --- Generate 1 to 3 targets for Sea scans ---
-        num_targets = np.random.randint(1, 4)
-        for i in range(num_targets):
-            target_types_sea = ["Potential Wreckage Fragment", "Unknown Anomaly", "Seabed Feature", "Submerged Object"]
-            target_type = np.random.choice(target_types_sea)
-            range_val = round(np.random.uniform(20, (scan_depth_range or 100) * 0.9), 1)
-            size_approx = f"{round(np.random.uniform(0.5, 5),1)}x{round(np.random.uniform(0.5, 3),1)}"
-            targets.append({
-                "id": f"SIM_TGT_S{i+1:02d}",
-                "type": target_type,
-                "confidence": round(np.random.uniform(0.55, 0.92), 2),
-                "range_m": range_val,
-                "size_m_approx": size_approx,
-                "details": f"Auto-generated target. Acoustic signature suggests {target_type.lower()} at approx. {range_val}m."
-            })
-
-    elif "Land" in sonar_type or "GPR" in sonar_type:
-        base_type = "Land (Ground Penetrating Radar - GPR)"
-        spectrogram_data = generate__spectrogram(np.random.choice(["layered_gpr", "object_faint", "utility_gpr"]))
-        color_scale = "Plasma"
-        params = {"frequency_mhz": primary_frequency or 200, "depth_m_max": scan_depth_range or 5, "survey_line": "SIM_L001"}
-        # --- Generate 1 to 3 targets for Land scans ---
-        num_targets = np.random.randint(1, 4)
-        for i in range(num_targets):
-            target_types_land = ["Buried Utility Line", "Subsurface Void", "Foundation Remnant", "Geological Layer Change"]
-            target_type = np.random.choice(target_types_land)
-            depth_val = round(np.random.uniform(0.3, (scan_depth_range or 5) * 0.85), 1)
-            targets.append({
-                "id": f"SIM_TGT_L{i+1:02d}",
-                "type": target_type,
-                "confidence": round(np.random.uniform(0.65, 0.88), 2),
-                "depth_m_approx": depth_val,
-                "material_guess": np.random.choice(["Concrete/Metal", "Soil Disturbance", "Clay/Rock", "Unknown"]),
-                "details": f"Auto-generated GPR target. Reflection indicates {target_type.lower()} at ~{depth_val}m depth."
-            })
-
-    elif "Air" in sonar_type or "Ultrasonic" in sonar_type:
-        base_type = "Air (Ultrasonic Array Sensor)"
-        spectrogram_data = generate__spectrogram(np.random.choice(["object_faint", "cluttered_air"]))
-        color_scale = "Cividis"
-        params = {"frequency_khz": primary_frequency or 40, "max_range_m": scan_depth_range or 8, "scan_angle_deg": 90}
-        # --- Generate 1 to 2 targets for Air scans ---
-        num_targets = np.random.randint(1, 3)
-        for i in range(num_targets):
-            target_types_air = ["Nearby Obstacle", "Reflective Surface", "Moving Object Signature"]
-            target_type = np.random.choice(target_types_air)
-            distance_val = round(np.random.uniform(0.5, (scan_depth_range or 8) * 0.9), 1)
-            targets.append({
-                "id": f"SIM_TGT_A{i+1:02d}",
-                "type": target_type,
-                "confidence": round(np.random.uniform(0.75, 0.99), 2),
-                "distance_m": distance_val,
-                "details": f"Auto-generated airborne target. Echo suggests {target_type.lower()} at {distance_val}m."
-            })
-    else:
-        base_type = "Generic Sonar"
-        spectrogram_data = generate__spectrogram("clear")
-        color_scale = "Gray"
-        params = {"frequency_generic": primary_frequency or 100, "range_generic": scan_depth_range or 50}
-        # --- Default target for Generic if others fail ---
-        targets.append({
-            "id": "SIM_TGT_GEN01",
-            "type": "Generic Anomaly",
-            "confidence": round(np.random.uniform(0.5, 0.8), 2),
-            "range_generic": round(np.random.uniform(10, (scan_depth_range or 50) * 0.8), 1),
-            "details": "Auto-generated generic target."
-        })
+    """Fetches sonar scan information through the configured ScanSource. Prefetched scans return immediately.
+    Not wrapped in st.cache_data: pickling would copy memory-mapped arrays, and sources cache scans themselves.
+    Returns None for an unknown scan, and {} if the source failed (the error is already shown)."""
+    print(f"Fetching data for Scan ID: {scan_id}")
+    try:
+        return scan_source.fetch(scan_id)
+    except SOURCE_ERRORS as e_fetch:
+        print(f"Fetching scan {scan_id} failed: {e_fetch!r}")
+        st.error(f"Could not fetch scan '{scan_id}' from the scan source ({type(e_fetch).__name__}: {e_fetch}). Please try again.", icon="🔌")
+        return {}
+
+def prefetch_adjacent_scans(scan_id, scan_ids, radius=1):
+    """Starts background fetches for the scans next to `scan_id` in the Explore list, so stepping through them feels instant."""
+    if scan_id not in scan_ids:
+        return
+    idx = scan_ids.index(scan_id)
+    scan_source.prefetch([scan_ids[i] for i in range(max(0, idx - radius), min(len(scan_ids), idx + radius + 1)) if i != idx])
 
-    if "current_sim_type" in st.session_state:
-        del st.session_state.current_sim_type # Clean up
+SIM_SONAR_TYPES = ["Sea (Side-Scan Sonar type)", "Land (GPR type)", "Air (Ultrasonic type)", "Generic Sonar "]
+MAX_SWEEP_RUNS = 500 # Upper bound on simulations per parameter sweep
+
+@st.cache_resource
+def load_simulation_cache():
+    """Simulation results shared by all sessions, keyed by the content hash of their inputs; bounded by count and bytes."""
+    return LRUCache(max_entries=256, max_bytes=256 * 1024 ** 2)
+
+def run_new_scan_(sonar_type, area_name, primary_frequency, scan_depth_range, custom_notes, seed=0):
+    """Simulates a new sonar scan (see sonar_hub.simulation); identical inputs are served from the shared cache."""
+    key = simulation_key(sonar_type, area_name, primary_frequency, scan_depth_range, custom_notes, seed)
+    def simulate():
+        print(f"Simulating new scan for: Type: {sonar_type}, Area: {area_name}, Seed: {seed}")
+        return simulate_scan(sonar_type, area_name, primary_frequency, scan_depth_range, custom_notes, seed)
+    return load_simulation_cache().get_or_create(key, simulate)
 
-    return {
-        "scan_id": scan_id,
-        "sonar_type": base_type,
-        "timestamp": timestamp,
-        "location_": area_name or "Simulated Area", 
-        "parameters": params,
-        "spectrogram_data": spectrogram_data,
-        "color_scale": color_scale,
-        "detected_targets": targets, 
-        "summary": f"Simulated scan {scan_id} completed for {area_name}. Found {len(targets)} potential target(s). Notes: {custom_notes}" if custom_notes else f"Simulated scan {scan_id} completed for {area_name}. Found {len(targets)} potential target(s).",
-        "notes_user": custom_notes
-    }
-    
 def prepare_data_for_json_export(scan_data_dict):
     """Prepares scan data for JSON export, removing or converting large arrays."""
     serializable_data = scan_data_dict.copy()
@@ -699,8 +708,441 @@ def prepare_data_for_json_export(scan_data_dict):
     return serializable_data
 
 
-def display__result_block(scan_result_data, context_key_suffix=""):
-    """Displays the details, spectrogram, and targets for a given scan result."""
+@st.cache_resource
+def load_export_cache():
+    """Process-wide cache of built export files, keyed by (scan, data version, format)."""
+    return LRUCache(max_entries=32, max_bytes=256 * 1024 ** 2)
+
+def build_scan_export(scan_data, fmt):
+    """Export bytes of a scan: "json" (metadata and targets only) or a binary format from sonar_hub.export (full spectrogram)."""
+    if fmt == "json":
+        return json.dumps(prepare_data_for_json_export(scan_data.copy()), indent=4).encode("utf-8")
+    return export_scan(scan_data, fmt)
+
+def render_export_buttons(scan_data, key_suffix):
+    """Download buttons for every export format; files are only built when a button is clicked, then cached per scan version."""
+    scan_id = scan_data["scan_id"]
+    export_cache = load_export_cache() # Fetched here: the deferred callables run outside the script thread
+    version = scan_data_version(scan_data) if isinstance(scan_data.get("spectrogram_data"), np.ndarray) else scan_data.get("data_version")
+    formats = [("json", ".json", "application/json", "JSON")] + \
+              [(fmt, EXPORT_FORMATS[fmt][0], EXPORT_FORMATS[fmt][1], fmt.upper()) for fmt in available_formats()]
+    for export_col, (fmt, ext, mime, label) in zip(st.columns(len(formats)), formats):
+        with export_col:
+            st.download_button(
+                label=f"📥 {label}",
+                data=lambda fmt=fmt: export_cache.get_or_create((scan_id, version, fmt), lambda: build_scan_export(scan_data, fmt)),
+                file_name=f"{scan_id}_export{ext}",
+                mime=mime,
+                key=f"download_{fmt}_{scan_id}_{key_suffix}",
+                help="Metadata and targets only" if fmt == "json" else "Full spectrogram with metadata and targets; re-import it from the Upload tab",
+                use_container_width=True
+            )
+
+ARCHIVE_MAX_BYTES = 512 * 1024 ** 2 # Streamlit serves downloads from memory, so in-app archives are capped; the CLI is not
+
+def build_catalog_archive(registry, scan_ids, archive_format, member_format):
+    """Streams the scans into a temporary file (one spectrogram in memory at a time) and returns its bytes.
+    Raises ArchiveTooLarge past ARCHIVE_MAX_BYTES."""
+    with tempfile.TemporaryFile() as archive_file:
+        write_archive(archive_file, registry.get, scan_ids, archive_format, member_format, max_bytes=ARCHIVE_MAX_BYTES)
+        archive_file.seek(0)
+        data = archive_file.read()
+    print(f"Built {archive_format} catalog archive of {len(scan_ids)} scan(s), {len(data) / 1024 ** 2:.1f} MB")
+    return data
+
+def render_catalog_archive(registry):
+    """'Download all' controls: filter the catalog by sonar type and date, then download it as one zip/tar archive."""
+    metadata = list(registry.iter_metadata()) # Metadata only; spectrograms are built while the archive is written
+    sonar_types = sorted({meta.get("sonar_type", "") for meta in metadata})
+    filter_col, date_col = st.columns(2)
+    with filter_col:
+        selected_types = st.multiselect("Sonar types:", sonar_types, key="archive_types", help="Leave empty for all types.")
+    with date_col:
+        date_range = st.date_input("Scan dates (UTC):", value=(), key="archive_dates", help="Leave empty for all dates.")
+    format_col, member_col = st.columns(2)
+    with format_col:
+        archive_format = st.radio("Archive:", list(ARCHIVE_FORMATS), horizontal=True, key="archive_format")
+    with member_col:
+        member_format = st.selectbox("Scan file format:", available_formats(), key="archive_member_format")
+
+    since = until = None
+    if len(date_range) >= 1:
+        since = datetime.combine(date_range[0], datetime.min.time(), tzinfo=timezone.utc)
+        until = datetime.combine(date_range[-1], datetime.max.time(), tzinfo=timezone.utc)
+    scan_ids = select_scans(metadata, selected_types, since, until)
+    selected_ids = set(scan_ids)
+    estimated_bytes = estimate_archive_bytes(meta for meta in metadata if meta["scan_id"] in selected_ids)
+    too_large = estimated_bytes > ARCHIVE_MAX_BYTES # Checked up front: an error inside the deferred download only shows as a generic failure
+    cli_command = f"python -m sonar_hub.archive --store {SCAN_STORE_DIR} --out catalog.zip"
+    if too_large:
+        st.warning(f"The {len(scan_ids)} selected scan(s) need up to {estimated_bytes / 1024 ** 2:,.0f} MB, over the "
+                   f"{ARCHIVE_MAX_BYTES // 1024 ** 2} MB in-app limit. Narrow the filters, or run `{cli_command}` "
+                   f"(with `--type`/`--since`/`--until` as needed).", icon="📦")
+    else:
+        st.caption(f"{len(scan_ids)} of {len(metadata)} scan(s) match, up to {estimated_bytes / 1024 ** 2:,.1f} MB. "
+                   f"Archives downloaded here are limited to {ARCHIVE_MAX_BYTES // 1024 ** 2} MB; for larger catalogs run `{cli_command}`.")
+    ext, mime = ARCHIVE_FORMATS[archive_format]
+    st.download_button(
+        label=f"📦 Download {len(scan_ids)} scan(s)",
+        data=lambda: build_catalog_archive(registry, scan_ids, archive_format, member_format),
+        file_name=f"sonar_catalog_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M')}{ext}",
+        mime=mime,
+        key="download_catalog_archive",
+        disabled=not scan_ids or too_large,
+        help="Each scan is a full export file (re-importable from the Upload tab), plus a manifest.json of all metadata.",
+        use_container_width=True
+    )
+
+DASHBOARD_CHARTS = ["Scans per sonar type", "Targets per type", "Confidence distribution", "Scans per day"]
+DASHBOARD_FAMILY_COLORS = {"Sea": "#00AEEF", "Land (GPR)": "#FFA500", "Air (Ultrasonic)": "#33CC33", "Other": "#A0A0A0"}
+
+@st.cache_resource
+def load_dashboard_chart_cache():
+    """Process-wide cache of dashboard figures, keyed by chart and statistics version."""
+    return LRUCache(max_entries=16)
+
+def build_dashboard_chart(chart, stats):
+    """Plotly figure for one dashboard chart, from a ScanStats snapshot."""
+    if chart == "Targets per type":
+        df_chart = pd.DataFrame(sorted(stats["targets_by_type"].items(), key=lambda item: -item[1]), columns=["Target Type", "Number of Targets"])
+        fig = px.bar(df_chart, x="Target Type", y="Number of Targets", title="Detected Targets by Type", template="plotly_dark")
+    elif chart == "Confidence distribution":
+        edges = stats["confidence_edges"]
+        df_chart = pd.DataFrame({"Confidence": [f"{lo:.1f}-{hi:.1f}" for lo, hi in zip(edges[:-1], edges[1:])],
+                                 "Number of Targets": stats["confidence_counts"]})
+        fig = px.bar(df_chart, x="Confidence", y="Number of Targets", title="Target Confidence Distribution", template="plotly_dark")
+    elif chart == "Scans per day":
+        df_chart = pd.DataFrame(list(stats["scans_per_day"].items()), columns=["Day (UTC)", "Number of Scans"])
+        fig = px.bar(df_chart, x="Day (UTC)", y="Number of Scans", title="Scans per Day", template="plotly_dark")
+    else:
+        df_chart = pd.DataFrame([(family, count) for family, count in stats["scans_by_family"].items() if count or family != "Other"],
+                                columns=["Sonar Type", "Number of Scans"])
+        fig = px.bar(df_chart, x="Sonar Type", y="Number of Scans", title="Distribution of Scan Types",
+                     color="Sonar Type", color_discrete_map=DASHBOARD_FAMILY_COLORS, template="plotly_dark")
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+        title_font_color='#E0E0E0', font_color='#C0C0C0'
+    )
+    return fig
+
+TARGET_CATALOG_MAX_ROWS = 1000 # Rows shown in the catalog table; counts cover every match
+TARGET_CATALOG_PERIODS = {"Any time": None, "Last 24 hours": 1, "Last week": 7, "Last 30 days": 30}
+TARGET_CATALOG_ORDER = {"Confidence (high first)": ("confidence", True), "Range (near first)": ("range_m", False),
+                        "Newest first": ("time", True)}
+
+def render_target_catalog(catalog):
+    """Filters for the global target catalog and a table of the best matches."""
+    type_col, sonar_col = st.columns(2)
+    with type_col:
+        target_types = st.multiselect("Target types:", catalog.target_types(), key="catalog_types", help="Leave empty for all types.")
+    with sonar_col:
+        sonar_types = st.multiselect("Sonar types:", catalog.sonar_types(), key="catalog_sonar_types", help="Leave empty for all types.")
+    conf_col, period_col, order_col = st.columns(3)
+    with conf_col:
+        confidence_range = st.slider("Confidence:", 0.0, 1.0, (0.0, 1.0), 0.05, key="catalog_confidence")
+    with period_col:
+        period = st.selectbox("Scanned:", list(TARGET_CATALOG_PERIODS), key="catalog_period")
+    with order_col:
+        order = st.selectbox("Order by:", list(TARGET_CATALOG_ORDER), key="catalog_order")
+    min_range_col, max_range_col = st.columns(2)
+    with min_range_col:
+        min_range = st.number_input("Min range / depth / distance (m):", min_value=0.0, value=None, key="catalog_min_range")
+    with max_range_col:
+        max_range = st.number_input("Max range / depth / distance (m):", min_value=0.0, value=None, key="catalog_max_range")
+
+    days = TARGET_CATALOG_PERIODS[period]
+    order_by, descending = TARGET_CATALOG_ORDER[order]
+    query_start = time.perf_counter()
+    rows = catalog.select(types=target_types or None, sonar_types=sonar_types or None,
+                          min_confidence=confidence_range[0] if confidence_range[0] > 0 else None,
+                          max_confidence=confidence_range[1] if confidence_range[1] < 1 else None,
+                          min_range=min_range, max_range=max_range,
+                          since=datetime.now(timezone.utc) - timedelta(days=days) if days else None,
+                          order_by=order_by, descending=descending)
+    query_ms = (time.perf_counter() - query_start) * 1000
+    st.caption(f"{len(rows):,} of {len(catalog):,} target(s) match ({query_ms:.1f} ms)"
+               + (f"; showing the first {TARGET_CATALOG_MAX_ROWS:,}." if len(rows) > TARGET_CATALOG_MAX_ROWS else "."))
+    if len(rows):
+        st.dataframe(catalog.frame(rows[:TARGET_CATALOG_MAX_ROWS]), use_container_width=True, hide_index=True)
+
+MOSAIC_DIR = os.path.join(tempfile.gettempdir(), "sonar_hub_mosaics")
+MOSAIC_MAX_CELLS = 16 * 1024 ** 2 # 64 MB of float32; finer inputs are mosaicked on coarser cells
+MOSAIC_DIR_MAX_FILES = 16 # Mosaics kept on disk; the least recently used are deleted beyond this
+MOSAIC_DIR_MAX_BYTES = 2 * 1024 ** 3
+
+def prune_mosaic_dir(keep_path):
+    """Deletes the least recently used mosaics (and their metadata) until MOSAIC_DIR is within its file and byte limits.
+    `keep_path` is never deleted. Sessions still holding a deleted mosaic keep reading it through their open memory map."""
+    mosaics = []
+    for name in os.listdir(MOSAIC_DIR):
+        path = os.path.join(MOSAIC_DIR, name)
+        if name.endswith(".npy") and ".partial" not in name:
+            try:
+                mosaics.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except FileNotFoundError: # Pruned by another session meanwhile
+                pass
+    mosaics.sort() # Oldest first
+    count, total_bytes = len(mosaics), sum(size for _, size, _ in mosaics)
+    for _, size, path in mosaics:
+        if count <= MOSAIC_DIR_MAX_FILES and total_bytes <= MOSAIC_DIR_MAX_BYTES:
+            break
+        if path == keep_path:
+            continue
+        for stale in (path, path[:-len(".npy")] + ".json"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        count, total_bytes = count - 1, total_bytes - size
+        print(f"Evicted mosaic {os.path.basename(path)} ({size / 1024 ** 2:.1f} MB) from {MOSAIC_DIR}")
+
+def build_scan_mosaic(registry, scan_ids, align, feather):
+    """Aligns and mosaics the scans into a memory-mapped .npy under MOSAIC_DIR (reused if the same inputs were fused before).
+    Returns the mosaic scan dict."""
+    scans = [registry.get(scan_id) for scan_id in scan_ids]
+    versions = [scan_data_version(scan) for scan in scans]
+    mosaic_key = hashlib.sha1(repr((list(scan_ids), versions, align, feather)).encode("utf-8")).hexdigest()
+    # Uncovered cells get the darkest input value, so rendering and previews never see NaN
+    fill = min(float(np.nanmin(scan["spectrogram_data"])) for scan in scans)
+    os.makedirs(MOSAIC_DIR, exist_ok=True)
+    mosaic_path = os.path.join(MOSAIC_DIR, f"{mosaic_key}.npy")
+    meta_path = os.path.join(MOSAIC_DIR, f"{mosaic_key}.json")
+    if not (os.path.exists(mosaic_path) and os.path.exists(meta_path)):
+        # Renamed into place, so readers never see a half-written mosaic; per process and thread, since sessions are threads
+        partial_suffix = f"{os.getpid()}.{threading.get_ident()}.partial"
+        partial_path = f"{mosaic_path}.{partial_suffix}.npy"
+        _, grid, placements, alignments = fuse_scans(scans, align=align, out_path=partial_path, feather=feather, fill=fill,
+                                                    max_cells=MOSAIC_MAX_CELLS)
+        fusion_meta = {
+            "grid": {"origin_m": list(grid[0]), "cell_m": list(grid[1]), "shape": list(grid[2])},
+            "placements": [{"scan_id": p.scan_id, "origin_m": [round(float(v), 3) for v in p.origin_m],
+                            "cell_m": list(p.cell_m), "shape": list(p.shape)} for p in placements],
+            "alignment_peaks": [round(a.peak, 4) for a in alignments] if alignments else None,
+            # Scans whose correlation peak was too weak to trust; they are placed by their stored geometry instead
+            "alignment_rejected": [p.scan_id for p, a in zip(placements, alignments) if not a.accepted] if alignments else [],
+        }
+        with open(f"{meta_path}.{partial_suffix}", "w") as f:
+            json.dump(fusion_meta, f)
+        os.replace(f"{meta_path}.{partial_suffix}", meta_path)
+        os.replace(partial_path, mosaic_path)
+        print(f"Fused {len(scans)} scans into a {grid[2][0]}x{grid[2][1]} mosaic ({mosaic_key[:10]})")
+        prune_mosaic_dir(mosaic_path)
+    else:
+        os.utime(mosaic_path) # Reused: most recently used for pruning
+    with open(meta_path) as f:
+        fusion_meta = json.load(f)
+    mosaic = np.load(mosaic_path, mmap_mode="r")
+    grid_shape = fusion_meta["grid"]["shape"]
+    return {
+        "scan_id": f"MOS-{mosaic_key[:10].upper()}",
+        "sonar_type": scans[0].get("sonar_type", "Generic Sonar"),
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC"),
+        "location_": f"Mosaic of {', '.join(scan_ids)}",
+        "parameters": dict(fusion_meta, source_scans=list(scan_ids), aligned=align, feather_cells=feather),
+        "spectrogram_data": mosaic,
+        "color_scale": scans[0].get("color_scale", "Viridis"),
+        "detected_targets": [],
+        "summary": f"{'Aligned mosaic' if align else 'Mosaic'} of {len(scans)} scans on a {grid_shape[0]}x{grid_shape[1]} grid "
+                   f"({fusion_meta['grid']['cell_m'][1]:.3g} m range cells); overlaps blended over {feather} cells.",
+        "data_version": f"mosaic-{mosaic_key[:12]}",
+    }
+
+def render_scan_mosaic(registry):
+    """Fuse controls: pick overlapping scans, align them by phase correlation and blend them into one mosaic scan."""
+    scan_ids = registry.ids()
+    with st.form("mosaic_form"):
+        selected_ids = st.multiselect("Scans to fuse (the first is the reference):", scan_ids, key="mosaic_scan_ids")
+        align_col, feather_col = st.columns(2)
+        with align_col:
+            mosaic_align = st.toggle("Align by phase correlation", value=True, key="mosaic_align",
+                                     help="Estimates each scan's offset against the first; off: use each scan's stored geometry.")
+        with feather_col:
+            mosaic_feather = st.slider("Overlap feathering (cells)", 0, 64, DEFAULT_FEATHER, key="mosaic_feather")
+        mosaic_submitted = st.form_submit_button("🧩 Fuse Scans", use_container_width=True)
+    if mosaic_submitted:
+        if len(selected_ids) < 2:
+            st.warning("Select at least two scans to fuse.", icon="⚠️")
+            return
+        try:
+            with st.spinner(f"Aligning and mosaicking {len(selected_ids)} scans..."):
+                st.session_state.mosaic_scan = build_scan_mosaic(registry, selected_ids, mosaic_align, mosaic_feather)
+        except Exception as e_mosaic:
+            st.error(f"Could not fuse scans: {e_mosaic}")
+            return
+
+LOD_MAX_ROWS, LOD_MAX_COLS = 450, 1000 # Cell budget per rendered spectrogram, roughly the plot's pixel size
+
+@st.cache_resource
+def load_pyramid_cache():
+    """Process-wide cache of LOD pyramids, bounded by count and bytes."""
+    return LRUCache(max_entries=16, max_bytes=512 * 1024 ** 2)
+
+FINGERPRINT_BLOCK_BYTES = 16 * 1024 ** 2 # Rows hashed per step, so non-contiguous or memory-mapped arrays are never copied whole
+
+@st.cache_resource
+def load_fingerprint_cache():
+    """id(array) -> (weak reference to the array, fingerprint); entries go when their array is garbage-collected."""
+    return {}
+
+def scan_data_version(scan_data):
+    """Version tag of a scan's spectrogram: the registry/store version, or for unregistered scans a hash of the whole
+    array, computed once per array object (arrays are treated as immutable once displayed)."""
+    if scan_data.get("data_version"):
+        return scan_data["data_version"]
+    arr = scan_data["spectrogram_data"]
+    fingerprints = load_fingerprint_cache()
+    cached = fingerprints.get(id(arr))
+    if cached is not None and cached[0]() is arr:
+        return cached[1]
+    digest = hashlib.sha1(f"{arr.shape} {arr.dtype.str}".encode("utf-8"))
+    rows_per_block = max(1, FINGERPRINT_BLOCK_BYTES // max(1, arr[:1].nbytes))
+    for start in range(0, arr.shape[0], rows_per_block):
+        digest.update(np.ascontiguousarray(arr[start:start + rows_per_block]).data)
+    fingerprint = digest.hexdigest()[:16]
+    fingerprints[id(arr)] = (weakref.ref(arr), fingerprint)
+    weakref.finalize(arr, fingerprints.pop, id(arr), None)
+    return fingerprint
+
+def get_lod_pyramid(scan_data):
+    """Returns the (cached) LOD pyramid for a scan's spectrogram, building it once per scan version."""
+    key = (scan_data.get("scan_id"), scan_data_version(scan_data))
+    return load_pyramid_cache().get_or_create(key, lambda: LodPyramid(scan_data["spectrogram_data"]))
+
+@st.cache_resource
+def load_figure_cache():
+    """Process-wide cache of built spectrogram figures; entries are sized by the view arrays they hold."""
+    return LRUCache(max_entries=64, max_bytes=256 * 1024 ** 2)
+
+def build_spectrogram_figure(scan_data, rows, cols, reduction):
+    """Builds the Plotly figure for one window of a scan's spectrogram at the pyramid level that fits the plot."""
+    view = get_lod_pyramid(scan_data).view(LOD_MAX_ROWS, LOD_MAX_COLS, rows=rows, cols=cols, reduction=reduction)
+    fig_spec = px.imshow(view.data, x=view.x, y=view.y,
+                         color_continuous_scale=scan_data.get("color_scale", "Viridis"),
+                         aspect="auto",
+                         labels=dict(x="Range/Time Bins", y="Beam/Depth Bins", color="Intensity"))
+    title_text = f"Visualisation for {scan_data.get('scan_id', 'N/A')}"
+    if view.level > 0:
+        title_text += f" (downsampled 1:{view.factor[0]}x{view.factor[1]}, {reduction})"
+    fig_spec.update_layout(
+        title_text=title_text,
+        plot_bgcolor='#2a2a2e', paper_bgcolor='#2a2a2e',
+        font_color='#E0E0E0',
+        coloraxis_colorbar_title_font_color='#E0E0E0',
+        coloraxis_colorbar_tickfont_color='#E0E0E0'
+    )
+    return fig_spec, view
+
+def render_spectrogram(scan_data, key_prefix):
+    """Plots a scan's spectrogram, sending only the pyramid level that fits the plot; zooming in loads finer levels.
+    Built figures are cached per (scan, data version, color scale, window), so reruns of an unchanged scan reuse them."""
+    pyramid = get_lod_pyramid(scan_data)
+    height, width = pyramid.shape
+    rows, cols, reduction = (0, height), (0, width), "max"
+    if pyramid.level_for(LOD_MAX_ROWS, LOD_MAX_COLS) > 0: # Only large scans need zoom controls
+        with st.expander("🔍 Zoom / level of detail", expanded=False):
+            cols = st.slider("Range/Time bins", 0, width, (0, width), key=f"{key_prefix}_lod_cols")
+            rows = st.slider("Beam/Depth bins", 0, height, (0, height), key=f"{key_prefix}_lod_rows")
+            reduction = st.radio("Cell reduction when zoomed out", REDUCTIONS, horizontal=True, key=f"{key_prefix}_lod_reduction",
+                                 help="'max' keeps strong echoes visible; 'mean' shows average intensity; 'min' highlights shadows.")
+    rows = (rows[0], max(rows[1], rows[0] + 1))
+    cols = (cols[0], max(cols[1], cols[0] + 1))
+    figure_key = (scan_data.get("scan_id"), scan_data_version(scan_data), scan_data.get("color_scale", "Viridis"), rows, cols, reduction)
+    fig_spec, _ = load_figure_cache().get_or_create(figure_key, lambda: build_spectrogram_figure(scan_data, rows, cols, reduction))
+    st.plotly_chart(fig_spec, use_container_width=True, key=f"{key_prefix}_spectrogram")
+
+@st.cache_resource
+def load_preview_cache():
+    """Process-wide cache of encoded PNG previews."""
+    return LRUCache(max_entries=256, max_bytes=128 * 1024 ** 2)
+
+def render_fast_preview(scan_data):
+    """Shows a scan as a colormapped PNG (palette LUT per color scale) instead of a Plotly heatmap; encoded once per scan version."""
+    color_scale = scan_data.get("color_scale", "Viridis")
+    key = (scan_data.get("scan_id"), scan_data_version(scan_data), color_scale)
+    png_bytes = load_preview_cache().get_or_create(
+        key, lambda: encode_png(get_lod_pyramid(scan_data).view(LOD_MAX_ROWS, LOD_MAX_COLS).data, color_scale))
+    st.image(png_bytes, caption=f"Fast preview of {scan_data.get('scan_id', 'N/A')} ({color_scale})", use_container_width=True)
+
+@st.cache_resource
+def load_hyperbola_cache():
+    """Process-wide cache of hyperbola fits per (scan, data version)."""
+    return LRUCache(max_entries=64)
+
+def render_hyperbola_fits(scan_data, key_suffix):
+    """On-demand hyperbola (utility line) fitting for GPR scans; long lines are fitted in parallel windows."""
+    scan_id = scan_data.get("scan_id")
+    if not st.toggle("〰️ Fit utility hyperbolas", value=False, key=f"hyperbola_{scan_id}_{key_suffix}",
+                     help="Hough transform over candidate wave velocities; reports each apex, its depth and the fit quality."):
+        return
+    with st.spinner("Fitting hyperbolas..."):
+        fits = load_hyperbola_cache().get_or_create((scan_id, scan_data_version(scan_data)),
+                                                    lambda: detect_hyperbolas(scan_data["spectrogram_data"], max_fits=50))
+    if not fits:
+        st.info("No hyperbolic reflections found in this scan.")
+        return
+    depth_max = scan_data.get("parameters", {}).get("depth_m_max")
+    m_per_row = depth_max / scan_data["spectrogram_data"].shape[0] if depth_max else None
+    st.dataframe(pd.DataFrame([{
+        "apex_trace": fit.apex_col,
+        "apex_sample": fit.apex_row,
+        "depth_m_approx": round((fit.apex_row + 0.5) * m_per_row, 2) if m_per_row else None,
+        "asymptote_slope": fit.scale,
+        "fit_quality": round(fit.quality, 2),
+    } for fit in fits]), use_container_width=True)
+
+DENOISE_DEFAULTS = {"spectral": False, "spectral_strength": 1.0, "median": False, "median_size": 3,
+                    "gaussian": False, "gaussian_sigma": 1.0, "tvg": False, "tvg_spreading": 1.0, "tvg_absorption_db": 0.0}
+
+@st.cache_resource
+def load_denoise_cache():
+    """Process-wide cache of filtered spectrograms per (scan, data version, filter chain)."""
+    return LRUCache(max_entries=32, max_bytes=512 * 1024 ** 2)
+
+def render_denoise_controls(key_suffix):
+    """Noise-reduction filter choices; returns the filter chain (empty for none). Choices persist per context across scans."""
+    pref_key = f"denoise_{key_suffix}"
+    prefs = st.session_state.setdefault(pref_key, dict(DENOISE_DEFAULTS))
+    with st.expander("🧹 Noise reduction", expanded=any(prefs[name] for name in ("spectral", "median", "gaussian", "tvg"))):
+        denoise_col1, denoise_col2 = st.columns(2)
+        with denoise_col1:
+            prefs["spectral"] = st.checkbox("Spectral subtraction (Wiener-style)", value=prefs["spectral"], key=f"{pref_key}_spectral")
+            prefs["spectral_strength"] = st.slider("Subtraction strength", 0.5, 3.0, prefs["spectral_strength"], 0.25,
+                                                   key=f"{pref_key}_spectral_strength", disabled=not prefs["spectral"])
+            prefs["median"] = st.checkbox("Median despeckle", value=prefs["median"], key=f"{pref_key}_median")
+            prefs["median_size"] = st.select_slider("Median window", [3, 5, 7], prefs["median_size"],
+                                                    key=f"{pref_key}_median_size", disabled=not prefs["median"])
+        with denoise_col2:
+            prefs["gaussian"] = st.checkbox("Gaussian smoothing", value=prefs["gaussian"], key=f"{pref_key}_gaussian")
+            prefs["gaussian_sigma"] = st.slider("Gaussian sigma (cells)", 0.5, 5.0, prefs["gaussian_sigma"], 0.5,
+                                                key=f"{pref_key}_gaussian_sigma", disabled=not prefs["gaussian"])
+            prefs["tvg"] = st.checkbox("Time-varying gain", value=prefs["tvg"], key=f"{pref_key}_tvg",
+                                       help="Boosts deeper/farther rows to compensate spreading and absorption losses.")
+            prefs["tvg_spreading"] = st.slider("Spreading exponent", 0.0, 2.0, prefs["tvg_spreading"], 0.25,
+                                               key=f"{pref_key}_tvg_spreading", disabled=not prefs["tvg"])
+            prefs["tvg_absorption_db"] = st.slider("Absorption (dB over full range)", 0.0, 40.0, prefs["tvg_absorption_db"], 2.0,
+                                                   key=f"{pref_key}_tvg_absorption_db", disabled=not prefs["tvg"])
+    stages = []
+    if prefs["spectral"]:
+        stages.append(("spectral_subtraction", {"strength": prefs["spectral_strength"]}))
+    if prefs["median"]:
+        stages.append(("median", {"size": prefs["median_size"]}))
+    if prefs["gaussian"]:
+        stages.append(("gaussian", {"sigma": prefs["gaussian_sigma"]}))
+    if prefs["tvg"]:
+        stages.append(("tvg", {"spreading": prefs["tvg_spreading"], "absorption_db": prefs["tvg_absorption_db"]}))
+    return make_chain(*stages)
+
+def denoised_scan(scan_data, chain):
+    """The scan with its spectrogram filtered by `chain`; filtered arrays are cached, so toggling filters back is instant.
+    The returned scan gets its own data_version, so pyramids, figures and previews are cached separately too."""
+    version = scan_data_version(scan_data)
+    filtered = load_denoise_cache().get_or_create((scan_data.get("scan_id"), version, chain),
+                                                  lambda: apply_chain(scan_data["spectrogram_data"], chain))
+    chain_tag = hashlib.sha1(repr(chain).encode("utf-8")).hexdigest()[:8]
+    return dict(scan_data, spectrogram_data=filtered, data_version=f"{version}-dn{chain_tag}")
+
+def display__result_block(scan_result_data, context_key_suffix="", simulated=True):
+    """Displays the details, spectrogram, and targets for a given scan result (a simulation, or a catalog scan with simulated=False)."""
     st.markdown(f"<div class='scan-result-container'>", unsafe_allow_html=True)
     if not isinstance(scan_result_data, dict):
         st.error(f"Error: Expected a dictionary for scan_result_data, but got {type(scan_result_data)}.", icon="❌")
@@ -709,14 +1151,14 @@ def display__result_block(scan_result_data, context_key_suffix=""):
 
     scan_id = scan_result_data.get('scan_id', 'N/A')
     sonar_type = scan_result_data.get('sonar_type', 'N/A')
-    st.subheader(f"Results for Scan: {scan_id} ({sonar_type})")
+    st.subheader(f"{'Results for Scan' if simulated else 'Scan Details'}: {scan_id} ({sonar_type})")
 
     sim_meta_col1, sim_meta_col2 = st.columns(2)
     with sim_meta_col1:
         timestamp = scan_result_data.get('timestamp', 'N/A')
         st.markdown(f"**Timestamp:** {timestamp}")
         location = scan_result_data.get('location_', 'N/A - Key Missing!')
-        st.markdown(f"**Location (Simulated):** {location}")
+        st.markdown(f"**{'Location (Simulated)' if simulated else 'Location'}:** {location}")
         if location == 'N/A - Key Missing!':
             st.warning("Debug: The key 'location_' was missing from the scan data.", icon="⚠️")
 
@@ -741,15 +1183,7 @@ def display__result_block(scan_result_data, context_key_suffix=""):
 
     try:
         if all(k in scan_result_data for k in ['scan_id', 'timestamp']): 
-            sim_data_for_json = prepare_data_for_json_export(scan_result_data.copy()) 
-            json_export_sim_data = json.dumps(sim_data_for_json, indent=4)
-            st.download_button(
-                label="📥 Download Scan Data (JSON)",
-                data=json_export_sim_data,
-                file_name=f"{scan_id}_export.json", 
-                mime="application/json",
-                key=f"download_sim_{scan_id}_{context_key_suffix}"
-            )
+            render_export_buttons(scan_result_data, context_key_suffix)
         else:
             st.error("Cannot generate download link: Essential data missing from scan result.", icon="⚠️")
     except Exception as e_json_sim:
@@ -757,22 +1191,22 @@ def display__result_block(scan_result_data, context_key_suffix=""):
 
     st.markdown("---")
 
-    st.subheader("Simulated Sonar Image / Spectrogram")
+    st.subheader("Simulated Sonar Image / Spectrogram" if simulated else "Sonar Image / Spectrogram / Radargram")
     spectrogram_data = scan_result_data.get("spectrogram_data")
     if spectrogram_data is not None and isinstance(spectrogram_data, np.ndarray):
+        # Remembered per context outside the widget, so the mode sticks while flipping through scans
+        preview_pref_key = f"fast_preview_{context_key_suffix}"
+        fast_preview = st.toggle("⚡ Fast preview", value=st.session_state.get(preview_pref_key, False), key=f"{preview_pref_key}_toggle",
+                                 help="Static colormapped image instead of the interactive heatmap; much quicker for triage.")
+        st.session_state[preview_pref_key] = fast_preview
         try:
-            fig_sim_spec = px.imshow(spectrogram_data,
-                                     color_continuous_scale=scan_result_data.get("color_scale", "Viridis"),
-                                     aspect="auto",
-                                     labels=dict(x="Range/Time Bins", y="Beam/Depth Bins", color="Intensity"))
-            fig_sim_spec.update_layout(
-                title_text=f"Visualisation for {scan_id}",
-                plot_bgcolor='#2a2a2e', paper_bgcolor='#2a2a2e',
-                font_color='#E0E0E0',
-                coloraxis_colorbar_title_font_color='#E0E0E0',
-                coloraxis_colorbar_tickfont_color='#E0E0E0'
-            )
-            st.plotly_chart(fig_sim_spec, use_container_width=True)
+            denoise_chain = render_denoise_controls(context_key_suffix)
+            with st.spinner("Applying noise reduction..."):
+                display_scan = denoised_scan(scan_result_data, denoise_chain) if denoise_chain else scan_result_data
+            if fast_preview:
+                render_fast_preview(display_scan)
+            else:
+                render_spectrogram(display_scan, key_prefix=f"sim_{scan_id}_{context_key_suffix}")
         except Exception as e_plot_sim:
             st.error(f"Could not plot spectrogram for : {e_plot_sim}")
     else:
@@ -781,7 +1215,7 @@ def display__result_block(scan_result_data, context_key_suffix=""):
             st.warning("Debug: The key 'spectrogram_data' was missing from the scan data.", icon="⚠️")
 
     st.markdown("---")
-    st.subheader("Simulated Detected Targets")
+    st.subheader("Simulated Detected Targets" if simulated else "Detected Targets (Classification)")
     detected_targets = scan_result_data.get("detected_targets")
     if detected_targets: 
         sim_targets_df = pd.DataFrame(detected_targets)
@@ -791,7 +1225,205 @@ def display__result_block(scan_result_data, context_key_suffix=""):
         if 'detected_targets' not in scan_result_data and not detected_targets == []: 
              st.warning("Debug: The key 'detected_targets' was missing from the scan data.", icon="⚠️")
 
+    if isinstance(spectrogram_data, np.ndarray) and ("GPR" in sonar_type or "Land" in sonar_type):
+        try:
+            render_hyperbola_fits(scan_result_data, context_key_suffix)
+        except Exception as e_hyperbola:
+            st.error(f"Hyperbola fitting failed: {e_hyperbola}")
+
     st.markdown(f"</div>", unsafe_allow_html=True)
+
+TEXT_PREVIEW_BYTES = 8192
+MAX_SESSION_DIGESTS = 32 # Upload digests remembered per session
+
+@st.cache_resource
+def load_parse_cache():
+    """Process-wide cache of parsed uploads (CSV summaries, text previews, image thumbnails), keyed by content hash."""
+    return ParseCache(max_entries=64, max_bytes=256 * 1024 ** 2)
+
+def upload_digest(uploaded_file):
+    """Content hash of an upload, computed once per session and file; identical files from any session share it."""
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        if len(digests) >= MAX_SESSION_DIGESTS:
+            digests.pop(next(iter(digests)))
+        digests[uploaded_file.file_id] = content_digest(uploaded_file)
+    return digests[uploaded_file.file_id]
+
+def parse_uploaded_text(uploaded_file):
+    """UTF-8 head of an uploaded text file (only the head is ever shown or sent), cached by content hash."""
+    def read_head():
+        uploaded_file.seek(0)
+        return uploaded_file.read(TEXT_PREVIEW_BYTES).decode("utf-8", errors="ignore")
+    return load_parse_cache().get_or_create(("text", upload_digest(uploaded_file), TEXT_PREVIEW_BYTES), read_head)
+
+def ingest_uploaded_csv(uploaded_file):
+    """Parses an uploaded CSV in chunks, showing the preview as soon as the first chunk is in.
+    Summaries are cached by content hash, so reruns and other sessions uploading the same file skip the parse."""
+    parse_key = ("csv", upload_digest(uploaded_file))
+    parse_cache = load_parse_cache()
+    csv_summary = parse_cache.get(parse_key)
+    if csv_summary is not None:
+        st.dataframe(csv_summary.preview.head(10))
+    else:
+        preview_placeholder = st.empty()
+        progress_bar = st.progress(0.0, text="Parsing file...")
+        total_bytes = max(uploaded_file.size, 1)
+
+        def parse():
+            uploaded_file.seek(0)
+            return ingest_csv(
+                uploaded_file,
+                on_preview=lambda preview: preview_placeholder.dataframe(preview.head(10)),
+                on_progress=lambda rows, bytes_read: progress_bar.progress(
+                    min(1.0, (bytes_read or 0) / total_bytes), text=f"Parsed {rows:,} rows..."))
+
+        csv_summary = parse_cache.get_or_create(parse_key, parse)
+        if csv_summary.error: # Truncated statistics are not shared; the next upload of this file parses it again
+            parse_cache.pop(parse_key)
+        progress_bar.empty()
+        preview_placeholder.dataframe(csv_summary.preview.head(10)) # Also covers waiting on another session's parse
+    if csv_summary.rows > 10:
+        st.caption(f"Showing first 10 rows of {csv_summary.rows:,} total rows (parsed with {csv_summary.engine}).")
+    return csv_summary
+
+BINARY_SONAR_TYPES = {"Sea (Side-Scan Sonar)": "Viridis", "Land (Ground Penetrating Radar - GPR)": "Plasma",
+                      "Air (Ultrasonic Array Sensor)": "Cividis", "Generic Sonar": "Gray"}
+STFT_SIZES = [64, 128, 256, 512, 1024, 2048, 4096]
+STFT_OVERLAPS = {"0%": 0.0, "50%": 0.5, "75%": 0.75, "87.5%": 0.875}
+
+def render_stft_builder(uploaded_file, csv_summary):
+    """Turns a numeric column of an uploaded CSV (a recorded time series) into a spectrogram scan via a streaming STFT."""
+    numeric_columns = [name for name, dtype in csv_summary.dtypes.items() if dtype.startswith(("int", "uint", "float"))]
+    if not numeric_columns:
+        return
+    with st.expander("📈 Build a spectrogram from a sample column (STFT)", expanded=False):
+        with st.form("stft_form"):
+            stft_col1, stft_col2, stft_col3 = st.columns(3)
+            with stft_col1:
+                stft_column = st.selectbox("Sample column", numeric_columns)
+                stft_rate = st.number_input("Sample rate (Hz)", min_value=1.0, value=48000.0, step=1000.0)
+            with stft_col2:
+                stft_size = st.select_slider("FFT size (samples per frame)", STFT_SIZES, value=256)
+                stft_overlap = st.selectbox("Frame overlap", list(STFT_OVERLAPS), index=1)
+            with stft_col3:
+                stft_window = st.selectbox("Window", list(STFT_WINDOWS))
+                stft_scale = st.selectbox("Scale", STFT_SCALES)
+            stft_type = st.selectbox("Sonar type", list(BINARY_SONAR_TYPES))
+            stft_submitted = st.form_submit_button("Compute STFT", use_container_width=True)
+    if stft_submitted:
+        hop = max(1, int(round(stft_size * (1 - STFT_OVERLAPS[stft_overlap]))))
+        progress_bar = st.progress(0.0, text="Computing STFT...")
+        total_rows = max(csv_summary.rows, 1)
+        try:
+            uploaded_file.seek(0)
+            spectrogram, stft_info = stft_from_csv(
+                uploaded_file, stft_column, stft_rate, stft_size, hop, stft_window, stft_scale,
+                on_progress=lambda samples, frames: progress_bar.progress(min(1.0, samples / total_rows),
+                                                                         text=f"{samples:,} samples, {frames:,} frames..."))
+        except Exception as e_stft:
+            st.error(f"STFT failed: {e_stft}")
+            return
+        finally:
+            progress_bar.empty()
+        stft_key = hashlib.sha1(repr((uploaded_file.file_id, stft_column, stft_rate, stft_size, hop, stft_window, stft_scale)).encode("utf-8")).hexdigest()
+        st.session_state.stft_scan = (uploaded_file.file_id, {
+            "scan_id": f"STFT-{stft_key[:10].upper()}",
+            "sonar_type": stft_type,
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC"),
+            "location_": f"Uploaded time series {uploaded_file.name}",
+            "parameters": stft_info,
+            "spectrogram_data": spectrogram,
+            "color_scale": BINARY_SONAR_TYPES[stft_type],
+            "detected_targets": [],
+            "summary": f"STFT of column '{stft_column}' in '{uploaded_file.name}': {stft_info['frames']:,} frames of "
+                       f"{stft_size} samples, {stft_info['frequency_resolution_hz']:.2f} Hz resolution up to {stft_info['max_frequency_hz']:,.0f} Hz.",
+            "data_version": f"stft-{stft_key[:12]}",
+        })
+        print(f"STFT of {uploaded_file.name}[{stft_column}]: {spectrogram.shape[0]} bins x {spectrogram.shape[1]} frames")
+    stft_file_id, stft_scan = st.session_state.get("stft_scan") or (None, None)
+    if stft_scan and stft_file_id == uploaded_file.file_id: # Shown outside the expander: the result block has expanders of its own
+        if stft_scan["parameters"]["missing_samples"]:
+            st.warning(f"{stft_scan['parameters']['missing_samples']:,} missing or non-numeric samples were treated as 0.", icon="⚠️")
+        display__result_block(stft_scan, context_key_suffix="stft", simulated=False)
+        if st.button(f"➕ Add {stft_scan['scan_id']} to 'Explore Scan Data'", key="stft_add_btn"):
+            _SONAR_DATA.add(stft_scan)
+            st.success(f"Scan {stft_scan['scan_id']} is now available in the 'Explore Scan Data' tab.", icon="✅")
+
+UPLOAD_SPILL_DIR = os.path.join(tempfile.gettempdir(), "sonar_hub_uploads")
+UPLOAD_SESSION_QUOTA = 256 * 1024 ** 2 # Spilled bytes (decoded images, binary file copies) kept on disk per session
+UPLOAD_GLOBAL_QUOTA = 2 * 1024 ** 3 # ... and across all sessions; least recently used uploads are evicted first
+UPLOAD_DETAIL_SIZE = 512 # Side of the 1:1 full-resolution crop
+
+@st.cache_resource
+def load_upload_store():
+    """Process-wide store of spilled uploads (full-resolution images, binary files), bounded per session and globally.
+    Its spill directory is removed at exit; ones left by crashed processes are removed when the next store starts."""
+    store = UploadStore(UPLOAD_SPILL_DIR, session_quota=UPLOAD_SESSION_QUOTA, global_quota=UPLOAD_GLOBAL_QUOTA)
+    atexit.register(store.close)
+    return store
+
+def render_uploaded_image(uploaded_file):
+    """Decodes an image upload once per content hash: the thumbnail is shared through the parse cache and kept in session
+    state, full-resolution pixels go to the upload store. Reruns only redisplay the thumbnail."""
+    store = load_upload_store()
+    session_id = st.session_state.upload_session_id
+    digest = upload_digest(uploaded_file)
+    preview = st.session_state.get("uploaded_image_preview")
+    if not preview or preview["upload_key"] != digest:
+        if preview:
+            store.discard(session_id, preview["upload_key"])
+
+        def decode():
+            uploaded_file.seek(0)
+            thumbnail, pixels, mode = decode_image(uploaded_file)
+            store.put_pixels(session_id, digest, uploaded_file.name, pixels, mode)
+            return {"thumbnail": thumbnail, "shape": pixels.shape, "nbytes": pixels.nbytes}
+
+        # Same content from any session: one decode; later sessions just reference the spilled pixels
+        parsed = load_parse_cache().get_or_create(("image", digest), decode)
+        if store.attach(session_id, digest) is None and parsed["nbytes"] <= min(store.session_quota, store.global_quota):
+            uploaded_file.seek(0) # Thumbnail cached but the pixels were evicted: decode them again for this session
+            _, pixels, mode = decode_image(uploaded_file)
+            store.put_pixels(session_id, digest, uploaded_file.name, pixels, mode)
+        preview = {"upload_key": digest, "name": uploaded_file.name, "thumbnail": parsed["thumbnail"]}
+        st.session_state.uploaded_image_preview = preview
+    st.image(preview["thumbnail"], caption=f"Uploaded Image: {uploaded_file.name}", use_container_width=True)
+    full_resolution = store.load(st.session_state.upload_session_id, preview["upload_key"])
+    if full_resolution is None:
+        st.caption("Preview only: the full-resolution image is over the upload quota or was evicted; re-upload it to inspect details.")
+        return
+    height, width = full_resolution.shape[:2]
+    with st.expander(f"🔍 Full-resolution detail ({width}x{height} px)", expanded=False):
+        detail_col1, detail_col2 = st.columns(2)
+        center_x = detail_col1.slider("Horizontal position (%)", 0, 100, 50, key="upload_detail_x")
+        center_y = detail_col2.slider("Vertical position (%)", 0, 100, 50, key="upload_detail_y")
+        x0 = max(0, min(width - UPLOAD_DETAIL_SIZE, int(center_x / 100 * width) - UPLOAD_DETAIL_SIZE // 2))
+        y0 = max(0, min(height - UPLOAD_DETAIL_SIZE, int(center_y / 100 * height) - UPLOAD_DETAIL_SIZE // 2))
+        crop = np.array(full_resolution[y0:y0 + UPLOAD_DETAIL_SIZE, x0:x0 + UPLOAD_DETAIL_SIZE]) # Only the crop is read from disk
+        if crop.dtype != np.uint8: # 16-bit / float scans: stretch to 8 bits for display
+            crop = crop.astype(np.float32)
+            crop = ((crop - crop.min()) / max(float(crop.max() - crop.min()), 1e-12) * 255).astype(np.uint8)
+        st.image(crop, caption=f"Pixels x {x0}-{x0 + crop.shape[1]}, y {y0}-{y0 + crop.shape[0]} at 1:1")
+
+def spill_upload_to_disk(uploaded_file):
+    """Copies a binary upload into the upload store once, so binary readers can memory-map it instead of holding another
+    copy. The copy counts against the session and global upload quotas; returns its path, or None if it does not fit."""
+    key = ("binary", uploaded_file.file_id)
+    entry = load_upload_store().put_file(st.session_state.upload_session_id, key, uploaded_file.name, uploaded_file, uploaded_file.size)
+    if entry is None:
+        return None
+    st.session_state.setdefault("binary_upload_keys", set()).add(key)
+    return entry.path
+
+def release_binary_uploads(uploaded_files):
+    """Drops this session's spilled copies of binary uploads no longer in the upload widget."""
+    current_keys = {("binary", f.file_id) for f in uploaded_files or []}
+    spilled_keys = st.session_state.get("binary_upload_keys", set())
+    for key in spilled_keys - current_keys:
+        load_upload_store().discard(st.session_state.upload_session_id, key)
+    st.session_state.binary_upload_keys = spilled_keys & current_keys
+
 # --- END OF Helper Functions ---
 
 # --- Streamlit App Layout ---
@@ -802,6 +1434,8 @@ if "last_uploaded_image" not in st.session_state:
     st.session_state.last_uploaded_image = None
 if "last_uploaded_data_file" not in st.session_state:
     st.session_state.last_uploaded_data_file = None
+if "upload_session_id" not in st.session_state:
+    st.session_state.upload_session_id = uuid.uuid4().hex
 
 # --- Sidebar ---
 with st.sidebar:
@@ -834,8 +1468,12 @@ with st.sidebar:
     else:
         if "sonar_messages" not in st.session_state:
             st.session_state.sonar_messages = [
-                {"role": "assistant", "content": "Hello! I'm the Sonar AI Assistant. Explore the hub or ask me about sonar. If you upload a file in the 'Upload' tab, you can ask me about it here (e.g., 'analyze the uploaded image' or 'what about the CSV file I uploaded?')."}
+                {"role": "assistant", "notice": True, "content": "Hello! I'm the Sonar AI Assistant. Explore the hub or ask me about sonar. If you upload a file in the 'Upload' tab, you can ask me about it here (e.g., 'analyze the uploaded image' or 'what about the CSV file I uploaded?')."}
             ]
+        if "chat_context" not in st.session_state:
+            st.session_state.chat_context = ConversationContext(SONAR_SYSTEM_INSTRUCTION, budget_tokens=CHAT_CONTEXT_TOKEN_BUDGET,
+                                                                keep_last_turns=CHAT_CONTEXT_KEEP_TURNS)
+        st.session_state.chat_context.summarizer = summarize_chat_history # Rebind to this run's client
 
         MAX_CHAT_HISTORY_DISPLAY = 30
         chat_display_container = st.container()
@@ -877,62 +1515,54 @@ with st.sidebar:
 
             if perplexity_client:
                 try:
-                    with st.spinner("AI is thinking..."):
-                        # Construct messages for Perplexity API
-                        api_messages = [{"role": "system", "content": SONAR_SYSTEM_INSTRUCTION}]
-                        for msg_data in st.session_state.sonar_messages: # Add history
-                            if msg_data["role"] in ["user", "assistant"]: # Ensure roles are correct
-                                api_messages.append({"role": msg_data["role"], "content": str(msg_data.get("content", ""))})
-                        # The last user message (current prompt with context) is already in sonar_messages,
-                        # so no need to append user_prompt_content_for_api separately if sonar_messages is used directly.
-                        # However, to ensure the *very latest* prompt (with potential context modifications not yet in sonar_messages)
-                        # is the one being sent as the current user turn, we can build it carefully:
-                        
-                        # Create a temporary list for the API call, including the last user message with context
-                        current_call_messages = [{"role": "system", "content": SONAR_SYSTEM_INSTRUCTION}]
-                        # Add all but the last message from session_state (which is the raw prompt)
-                        for msg_data in st.session_state.sonar_messages[:-1]:
-                             if msg_data["role"] in ["user", "assistant"]:
-                                current_call_messages.append({"role": msg_data["role"], "content": str(msg_data.get("content", ""))})
-                        # Add the current user prompt with any appended context
-                        current_call_messages.append({"role": "user", "content": user_prompt_content_for_api})
-
-
-                        response = perplexity_client.chat.completions.create(
-                            model="sonar-pro", # Or "sonar-medium-online", "sonar-small-online"
-                            messages=current_call_messages,
-                            temperature=0.7, # Perplexity default, or adjust (e.g. 0.5)
-                            # top_p=0.9 # Optional
-                        )
-                        
-                        ai_response_content = "⚠️ Response generation issue."
-                        if response.choices and response.choices[0].message and response.choices[0].message.content:
-                            raw_txt = response.choices[0].message.content
-                            cleaned_txt = clean_markdown(raw_txt)
-                            finish_reason = response.choices[0].finish_reason
-                            if finish_reason and finish_reason != "stop":
-                                 cleaned_txt += f"\n\n*(Note: Response may have been truncated. Finish reason: {finish_reason})*"
-                        else:
-                            cleaned_txt = "⚠️ No valid response content received from AI."
-                            print(f"Perplexity AI response issue: {response}")
-                    
+                    # Construct messages for Perplexity API: system prompt + summary of older turns + recent turns,
+                    # skipping app notices, then the current user prompt with any appended context.
+                    # All but the last message from session_state are history (the last one is the raw prompt).
+                    current_call_messages = st.session_state.chat_context.build(st.session_state.sonar_messages[:-1], user_prompt_content_for_api)
+                    print(f"Chat request: {len(current_call_messages)} messages, ~{st.session_state.chat_context.last_request_tokens} tokens.")
+
+                    # Show the new turn right away and stream the answer into it as tokens arrive
+                    with chat_display_container:
+                        with st.chat_message("user", avatar="🧑‍💻"):
+                            st.markdown(clean_markdown(prompt), unsafe_allow_html=False)
+                        with st.chat_message("assistant", avatar="📡"):
+                            response_placeholder = st.empty()
+                            response_placeholder.markdown("_AI is thinking..._")
+                            # Repeated questions in the same context are answered from the cache; upload-context queries bypass it
+                            cache_key = None
+                            if not uploaded_context_sent_to_api:
+                                cache_context = current_call_messages[1:-1] + [{"role": "summary", "content": st.session_state.chat_context.summary}]
+                                cache_key = make_cache_key(prompt, cache_context, CHAT_MODEL, CHAT_TEMPERATURE)
+                            cached_txt = response_cache.get(cache_key) if cache_key else None
+                            if cached_txt is not None:
+                                cleaned_txt = cached_txt
+                                response_placeholder.markdown(cleaned_txt)
+                            else:
+                                cleaned_txt, finish_reason = stream_chat_completion(perplexity_client, current_call_messages, response_placeholder)
+                                if cache_key and finish_reason == "stop": # Never cache truncated or empty answers
+                                    response_cache.put(cache_key, cleaned_txt, model=CHAT_MODEL)
+
                     st.session_state.sonar_messages.append({"role": "assistant", "content": cleaned_txt})
                     if uploaded_context_sent_to_api: # If context was sent or referred to
-                        st.session_state.sonar_messages.append({"role": "assistant", "content": "(Context from the uploaded file/image reference has now been cleared for the next query. To re-analyze, please upload or refer to it again if needed.)"})
+                        st.session_state.sonar_messages.append({"role": "assistant", "notice": True, "content": "(Context from the uploaded file/image reference has now been cleared for the next query. To re-analyze, please upload or refer to it again if needed.)"})
 
                 except Exception as e_ai:
                     error_msg_ai = str(e_ai)
                     st.error(f"Sorry, an AI Assistant Error occurred: {error_msg_ai[:150]}...", icon="🔥")
                     print(f"Error during Perplexity AI interaction: {e_ai}")
-                    st.session_state.sonar_messages.append({"role": "assistant", "content": f"Sorry, an error occurred with the AI: {error_msg_ai}. Please try again."})
+                    st.session_state.sonar_messages.append({"role": "assistant", "notice": True, "content": f"Sorry, an error occurred with the AI: {error_msg_ai}. Please try again."})
                 st.rerun()
             else:
                 st.warning("AI Assistant client not available. Cannot send message.", icon="⚙️")
                 st.rerun()
 
+        cache_stats = response_cache.stats()
+        st.caption(f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['entries']} stored answers)")
+
         if st.button("Clear Chat History", key="clear_sonar_chat", use_container_width=True, type="secondary"):
             initial_assistant_message = "Chat history cleared. How can I help you?"
-            st.session_state.sonar_messages = [{"role": "assistant", "content": initial_assistant_message}]
+            st.session_state.sonar_messages = [{"role": "assistant", "notice": True, "content": initial_assistant_message}]
+            st.session_state.chat_context.reset()
             st.session_state.last_uploaded_image = None
             st.session_state.last_uploaded_data_file = None
             print("Chat history and uploaded file context cleared.")
@@ -975,33 +1605,20 @@ with tabs[0]:
 
     st.markdown("---")
     st.subheader(" Data Overview")
-    col1, col2, col3 = st.columns(3)
-    current_sea_scans = len([s for s_id, s in _SONAR_DATA.items() if "Sea" in s["sonar_type"]])
-    current_land_scans = len([s for s_id, s in _SONAR_DATA.items() if "Land" in s["sonar_type"]])
-    current_air_scans = len([s for s_id, s in _SONAR_DATA.items() if "Air" in s["sonar_type"]])
-    
-    col1.metric(" Sea Scans", f"{current_sea_scans}", "Side-Scan & MBES Concepts")
-    col2.metric(" Land Scans (GPR)", f"{current_land_scans}", "Subsurface Imaging")
-    col3.metric(" Air Scans (Ultrasonic)", f"{current_air_scans}", "Ranging & Detection")
-    
+    col1, col2, col3, col4 = st.columns(4)
+    dashboard_stats = _SCAN_STATS.snapshot() # Precomputed aggregates; no pass over the catalog
+    scans_by_family = dashboard_stats["scans_by_family"]
+
+    col1.metric(" Sea Scans", f"{scans_by_family['Sea']}", "Side-Scan & MBES Concepts")
+    col2.metric(" Land Scans (GPR)", f"{scans_by_family['Land (GPR)']}", "Subsurface Imaging")
+    col3.metric(" Air Scans (Ultrasonic)", f"{scans_by_family['Air (Ultrasonic)']}", "Ranging & Detection")
+    col4.metric(" Detected Targets", f"{dashboard_stats['targets']:,}", f"across {dashboard_stats['scans']:,} scans")
+
     if st.checkbox("Show Sonar Types Distribution Chart", True, key="dash_chart_toggle"):
-        sonar_types_counts = {
-            "Sea": current_sea_scans,
-            "Land (GPR)": current_land_scans,
-            "Air (Ultrasonic)": current_air_scans
-        }
-        df_types = pd.DataFrame(list(sonar_types_counts.items()), columns=['Sonar Type', 'Number of Scans'])
-        
-        fig = px.bar(df_types, x="Sonar Type", y="Number of Scans", 
-                     title="Distribution of Scan Types",
-                     color="Sonar Type", color_discrete_map={
-                         "Sea": "#00AEEF", "Land (GPR)": "#FFA500", "Air (Ultrasonic)": "#33CC33"
-                     },
-                     template="plotly_dark")
-        fig.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
-            title_font_color='#E0E0E0', font_color='#C0C0C0'
-        )
+        dashboard_chart = st.radio("Chart:", list(DASHBOARD_CHARTS), horizontal=True, key="dash_chart_kind")
+        # Built once per statistics version; reruns with unchanged data reuse the figure
+        fig = load_dashboard_chart_cache().get_or_create((dashboard_chart, dashboard_stats["version"]),
+                                                         lambda: build_dashboard_chart(dashboard_chart, dashboard_stats))
         st.plotly_chart(fig, use_container_width=True)
 
     st.markdown('</div>', unsafe_allow_html=True)
@@ -1012,126 +1629,65 @@ with tabs[1]:
     st.markdown("<p class='tab-description'>Select a Scan ID to view its details, spectrogram/radargram, and detected targets. You can also download the scan data.</p>", unsafe_allow_html=True)
     st.markdown('<div class="scrollable-tab-content">', unsafe_allow_html=True)
 
-    available_scan_ids = list(_SONAR_DATA.keys()) 
+    try:
+        available_scan_ids = scan_source.list_ids() # Never waits on the remote API: its list is refreshed in the background
+    except Exception as e_list:
+        st.warning(f"Scan source unavailable ({e_list}). Showing local scans only.", icon="🔌")
+        available_scan_ids = _SONAR_DATA.ids()
+    if scan_source.listing_error is not None:
+        st.warning(f"Remote scan API unavailable ({scan_source.listing_error}). Showing local and last known remote scans; retrying in the background.", icon="🔌")
     scan_id_input = st.selectbox("Select Scan ID:", options=available_scan_ids, index=0, key="scan_id_explore",
-                                 help="Choose from pre-loaded or newly simulated scans available in this session.")
-
-    if st.button("Load Scan Data", key="load_scan_btn", use_container_width=True):
-        if scan_id_input:
-            with st.spinner(f"Loading data for scan: {scan_id_input}..."):
-                scan_data = get__scan_details(scan_id_input) 
-
-            if scan_data:
-                st.session_state.current_loaded_scan_id = scan_id_input 
-                st.markdown(f"<div class='scan-result-container'>", unsafe_allow_html=True)
-                st.subheader(f"Scan Details: {scan_data['scan_id']} ({scan_data['sonar_type']})")
-                
-                meta_col1, meta_col2 = st.columns(2)
-                with meta_col1:
-                    st.markdown(f"**Timestamp:** {scan_data['timestamp']}")
-                    st.markdown(f"**Location:** {scan_data['location_']}")
-                with meta_col2:
-                    st.markdown(f"**Parameters:**")
-                    st.json(scan_data['parameters'], expanded=False)
-                
-                st.markdown(f"**Scan Summary:** {scan_data.get('summary', 'N/A')}")
-
-                try:
-                    scan_data_for_json = prepare_data_for_json_export(scan_data)
-                    json_export_data = json.dumps(scan_data_for_json, indent=4)
-                    st.download_button(
-                        label="📥 Download Scan Data (JSON)",
-                        data=json_export_data,
-                        file_name=f"{scan_data['scan_id']}_export.json",
-                        mime="application/json",
-                        key=f"download_{scan_data['scan_id']}"
-                    )
-                except Exception as e_json:
-                    st.error(f"Error preparing data for download: {e_json}")
-
-                st.markdown("---")
-
-                st.subheader("Sonar Image / Spectrogram / Radargram")
-                if scan_data.get("spectrogram_data") is not None and isinstance(scan_data["spectrogram_data"], np.ndarray):
-                    try:
-                        fig_spec = px.imshow(scan_data["spectrogram_data"],
-                                             color_continuous_scale=scan_data.get("color_scale", "Viridis"),
-                                             aspect="auto",
-                                             labels=dict(x="Range/Time Bins", y="Beam/Depth Bins", color="Intensity"))
-                        fig_spec.update_layout(
-                            title_text=f"Visualisation for {scan_data['scan_id']}",
-                            plot_bgcolor='#2a2a2e', paper_bgcolor='#2a2a2e', 
-                            font_color='#E0E0E0',
-                            coloraxis_colorbar_title_font_color='#E0E0E0',
-                            coloraxis_colorbar_tickfont_color='#E0E0E0'
-                        )
-                        st.plotly_chart(fig_spec, use_container_width=True)
-                    except Exception as e_plot:
-                        st.error(f"Could not plot spectrogram: {e_plot}")
-                else:
-                    st.info("No spectrogram data available or data is not in expected format for this scan.")
-
-                st.markdown("---")
-                st.subheader("Detected Targets (Classification)")
-                if scan_data.get("detected_targets"):
-                    targets_df = pd.DataFrame(scan_data["detected_targets"])
-                    st.dataframe(targets_df, use_container_width=True)
-                else:
-                    st.info("No specific targets detected or listed for this scan.")
-                st.markdown(f"</div>", unsafe_allow_html=True) 
-            else:
-                st.error(f"Scan ID '{scan_id_input}' not found. Please select a valid ID.", icon="❌")
-        else:
-            st.warning("Please select a Scan ID.", icon="⚠️")
+                                 help="Choose from pre-loaded scans or simulations saved to the shared scan store.")
+
+    load_scan_clicked = st.button("Load Scan Data", key="load_scan_btn", use_container_width=True)
+    if load_scan_clicked and not scan_id_input:
+        st.warning("Please select a Scan ID.", icon="⚠️")
+    elif load_scan_clicked or st.session_state.get("current_loaded_scan_id") == scan_id_input:
+        # One rendering path for the first load and every later rerun; the figure cache makes reruns cheap
+        with st.spinner(f"Loading data for scan: {scan_id_input}..."):
+            scan_data = get__scan_details(scan_id_input)
+        if scan_data:
+            st.session_state.current_loaded_scan_id = scan_id_input
+            prefetch_adjacent_scans(scan_id_input, available_scan_ids)
+            display__result_block(scan_data, context_key_suffix="explore", simulated=False)
+        elif load_scan_clicked and scan_data is None:
+            st.error(f"Scan ID '{scan_id_input}' not found. Please select a valid ID.", icon="❌")
     
-    elif 'current_loaded_scan_id' in st.session_state and st.session_state.current_loaded_scan_id == scan_id_input:
-        scan_data = get__scan_details(st.session_state.current_loaded_scan_id)
-        if scan_data: 
-            st.markdown(f"<div class='scan-result-container'>", unsafe_allow_html=True)
-            st.subheader(f"Scan Details: {scan_data['scan_id']} ({scan_data['sonar_type']})")
-            meta_col1, meta_col2 = st.columns(2)
-            with meta_col1:
-                st.markdown(f"**Timestamp:** {scan_data['timestamp']}")
-                st.markdown(f"**Location:** {scan_data['location_']}")
-            with meta_col2:
-                st.markdown(f"**Parameters:**"); st.json(scan_data['parameters'], expanded=False)
-            st.markdown(f"**Scan Summary:** {scan_data.get('summary', 'N/A')}")
-            try:
-                scan_data_for_json = prepare_data_for_json_export(scan_data)
-                json_export_data = json.dumps(scan_data_for_json, indent=4)
-                st.download_button(label="📥 Download Scan Data (JSON)",data=json_export_data,file_name=f"{scan_data['scan_id']}_export.json",mime="application/json",key=f"download_{scan_data['scan_id']}_rerun")
-            except Exception as e_json: st.error(f"Error preparing data for download: {e_json}")
-            st.markdown("---")
-            st.subheader("Sonar Image / Spectrogram / Radargram")
-            if scan_data.get("spectrogram_data") is not None and isinstance(scan_data["spectrogram_data"], np.ndarray):
-                try:
-                    fig_spec = px.imshow(scan_data["spectrogram_data"],color_continuous_scale=scan_data.get("color_scale", "Viridis"),aspect="auto",labels=dict(x="Range/Time Bins", y="Beam/Depth Bins", color="Intensity"))
-                    fig_spec.update_layout(title_text=f"Visualisation for {scan_data['scan_id']}",plot_bgcolor='#2a2a2e', paper_bgcolor='#2a2a2e',font_color='#E0E0E0',coloraxis_colorbar_title_font_color='#E0E0E0',coloraxis_colorbar_tickfont_color='#E0E0E0')
-                    st.plotly_chart(fig_spec, use_container_width=True)
-                except Exception as e_plot: st.error(f"Could not plot spectrogram: {e_plot}")
-            else: st.info("No spectrogram data.")
-            st.markdown("---")
-            st.subheader("Detected Targets ( Classification)")
-            if scan_data.get("detected_targets"): st.dataframe(pd.DataFrame(scan_data["detected_targets"]), use_container_width=True)
-            else: st.info("No specific targets.")
-            st.markdown(f"</div>", unsafe_allow_html=True)
-
     st.markdown("---")
     st.subheader("Example Scan IDs available:")
     st.code("\n".join(available_scan_ids))
 
+    with st.expander("🎯 Target Catalog (all scans)"):
+        render_target_catalog(_TARGET_CATALOG)
+
+    with st.expander("📦 Download Scan Catalog Archive"):
+        render_catalog_archive(_SONAR_DATA)
+
+    with st.expander("🧩 Fuse / Mosaic Scans"):
+        render_scan_mosaic(_SONAR_DATA)
+    mosaic_scan = st.session_state.get("mosaic_scan")
+    if mosaic_scan: # Shown outside the expander: the result block has expanders of its own
+        rejected = mosaic_scan["parameters"].get("alignment_rejected")
+        if rejected:
+            st.warning(f"Phase correlation found no reliable match for {', '.join(rejected)} (peak under "
+                       f"{MIN_ALIGNMENT_PEAK_RATIO:.0f}x noise; too little overlap?). Placed by stored geometry instead, so check the mosaic.", icon="🧩")
+        display__result_block(mosaic_scan, context_key_suffix="mosaic", simulated=False)
+        if st.button(f"➕ Add {mosaic_scan['scan_id']} to the catalog", key="mosaic_add_btn"):
+            _SONAR_DATA.add(mosaic_scan)
+            st.success(f"Scan {mosaic_scan['scan_id']} is now available in the scan list above.", icon="✅")
+
     st.markdown('</div>', unsafe_allow_html=True) 
 
 # --- Tab: Simulate New Scan ---
 with tabs[2]:
     st.header("Simulate a New Sonar Scan")
-    st.markdown("<p class='tab-description'>Configure parameters to generate a new sonar scan. Results can be added to the 'Explore Scan Data' list for this session and downloaded.</p>", unsafe_allow_html=True)
+    st.markdown("<p class='tab-description'>Configure parameters to generate a new sonar scan. Results can be saved to the shared 'Explore Scan Data' list (persisted on disk) and downloaded.</p>", unsafe_allow_html=True)
     st.markdown('<div class="scrollable-tab-content">', unsafe_allow_html=True)
 
     with st.form("new_scan_form"):
         st.subheader("Scan Configuration")
         sim_sonar_type = st.selectbox("Sonar Type for Simulation*",
-                                      options=["Sea (Side-Scan Sonar type)", "Land (GPR type)", "Air (Ultrasonic type)", "Generic Sonar "],
+                                      options=SIM_SONAR_TYPES,
                                       help="Select the type of sonar environment to simulate.")
         sim_area_name = st.text_input("Simulated Area Name/Identifier *", placeholder="e.g., Test Site Alpha, Seabed Sector X")
 
@@ -1144,6 +1700,8 @@ with tabs[2]:
                                               help="Effective range or depth for the simulation.")
 
         sim_custom_notes = st.text_area("Custom Notes for Simulation", placeholder="e.g., Testing for small object detection, high clutter environment.")
+        sim_seed = st.number_input("Random Seed", min_value=0, value=0, step=1,
+                                   help="The same parameters and seed always give the same scan (and scan ID). Change it for another realization.")
 
         submitted_ = st.form_submit_button("Run New Simulation", use_container_width=True)
 
@@ -1157,7 +1715,8 @@ with tabs[2]:
                     sim_area_name,
                     sim_frequency,
                     sim_range_depth,
-                    sim_custom_notes
+                    sim_custom_notes,
+                    int(sim_seed)
                 )
             st.success(f"New scan simulation {_scan_result['scan_id']} completed!", icon="✅")
             st.session_state.last__scan_result = _scan_result 
@@ -1165,7 +1724,7 @@ with tabs[2]:
             display__result_block(_scan_result, context_key_suffix="new")
 
             add_to_explore_key = f"add_sim_{_scan_result['scan_id']}_on_creation"
-            if st.checkbox("Add this simulation to 'Explore Scan Data' list for this session?", True, key=add_to_explore_key):
+            if st.checkbox("Add this simulation to 'Explore Scan Data' (saved to the shared scan store)?", True, key=add_to_explore_key):
                 if _scan_result['scan_id'] not in _SONAR_DATA:
                     _SONAR_DATA[_scan_result['scan_id']] = _scan_result
                     st.info(f"Scan {_scan_result['scan_id']} is now available in the 'Explore Scan Data' tab.", icon="ℹ️")
@@ -1195,12 +1754,77 @@ with tabs[2]:
             del _SONAR_DATA[_scan_result['scan_id']]
             st.info(f"Scan {_scan_result['scan_id']} has been removed from the 'Explore Scan Data' tab.", icon="ℹ️")
 
+    st.markdown("---")
+    st.subheader("Parameter Sweep")
+    st.caption(f"Runs every combination below on a pool of {default_workers()} worker process(es); results appear as they finish.")
+    with st.form("sweep_form"):
+        sweep_types = st.multiselect("Sonar Types*", options=SIM_SONAR_TYPES, default=SIM_SONAR_TYPES[:1])
+        sweep_area_name = st.text_input("Area Name/Identifier", value="Sweep Area")
+        sweep_col1, sweep_col2, sweep_col3 = st.columns(3)
+        with sweep_col1:
+            sweep_freq_min = st.number_input("Frequency from", min_value=10, value=100, step=10)
+            sweep_range_min = st.number_input("Range/Depth from (m)", min_value=1, value=20, step=5)
+        with sweep_col2:
+            sweep_freq_max = st.number_input("Frequency to", min_value=10, value=400, step=10)
+            sweep_range_max = st.number_input("Range/Depth to (m)", min_value=1, value=100, step=5)
+        with sweep_col3:
+            sweep_freq_steps = st.number_input("Frequency steps", min_value=1, max_value=50, value=4)
+            sweep_range_steps = st.number_input("Range/Depth steps", min_value=1, max_value=50, value=3)
+        sweep_seed_col, sweep_repeats_col = st.columns(2)
+        sweep_repeats = sweep_repeats_col.number_input("Repeats per combination", min_value=1, max_value=50, value=2)
+        sweep_seed = sweep_seed_col.number_input("Base Seed", min_value=0, value=0, step=1, help="Repeat r of each combination uses seed base + r.")
+        sweep_submitted = st.form_submit_button("Run Sweep", use_container_width=True)
+
+    if sweep_submitted:
+        sweep_frequencies = sorted({int(round(v)) for v in np.linspace(sweep_freq_min, max(sweep_freq_min, sweep_freq_max), int(sweep_freq_steps))})
+        sweep_ranges = sorted({int(round(v)) for v in np.linspace(sweep_range_min, max(sweep_range_min, sweep_range_max), int(sweep_range_steps))})
+        sweep_specs = sweep_grid(sweep_types, sweep_frequencies, sweep_ranges, int(sweep_repeats),
+                                 area_name=sweep_area_name or "Sweep Area", seed=int(sweep_seed))
+        if not sweep_types:
+            st.error("Please select at least one sonar type.", icon="❗")
+        elif len(sweep_specs) > MAX_SWEEP_RUNS:
+            st.error(f"This sweep has {len(sweep_specs)} runs; the limit is {MAX_SWEEP_RUNS}. Reduce steps or repeats.", icon="❗")
+        else:
+            sweep_progress = st.progress(0.0, text="Starting worker processes...")
+            sweep_table = st.empty()
+            sweep_rows, sweep_failures = [], []
+            sweep_started = last_table_draw = time.time()
+            try:
+                for runs_done, (run_index, sweep_scan, run_error) in enumerate(run_sweep(sweep_specs), start=1):
+                    if run_error is not None:
+                        sweep_failures.append(f"Run {run_index + 1} ({sweep_specs[run_index]['sonar_type']}): {run_error}")
+                    else:
+                        load_simulation_cache().put(simulation_key(**sweep_specs[run_index]), sweep_scan)
+                        sweep_rows.append(scan_summary_row(sweep_scan))
+                    elapsed = max(time.time() - sweep_started, 1e-6)
+                    sweep_progress.progress(runs_done / len(sweep_specs), text=f"{runs_done}/{len(sweep_specs)} scans ({runs_done / elapsed:.1f} scans/s)")
+                    if time.time() - last_table_draw > 0.25 or runs_done == len(sweep_specs): # Throttle table redraws
+                        sweep_table.dataframe(pd.DataFrame(sweep_rows), use_container_width=True)
+                        last_table_draw = time.time()
+                # Only the seeded specs and summary rows are kept; saving takes scans from the shared cache or re-simulates them.
+                st.session_state.sweep_result = {"specs": sweep_specs, "rows": sorted(sweep_rows, key=lambda row: row["scan_id"])}
+                st.success(f"Sweep finished: {len(sweep_rows)} scans in {time.time() - sweep_started:.1f}s.", icon="✅")
+            except Exception as e_sweep:
+                st.error(f"Sweep failed: {e_sweep}")
+            if sweep_failures:
+                st.warning(f"{len(sweep_failures)} run(s) failed: " + "; ".join(sweep_failures[:5]), icon="⚠️")
+    elif st.session_state.get("sweep_result"):
+        st.dataframe(pd.DataFrame(st.session_state.sweep_result["rows"]), use_container_width=True)
+
+    if st.session_state.get("sweep_result") and st.button(f"Save all {len(st.session_state.sweep_result['rows'])} sweep scans to 'Explore Scan Data'", key="save_sweep_btn"):
+        with st.spinner("Saving sweep scans..."):
+            saved_ids = {row["scan_id"] for row in st.session_state.sweep_result["rows"]}
+            for spec in st.session_state.sweep_result["specs"]:
+                if simulation_scan_id(simulation_key(**spec)) in saved_ids:
+                    _SONAR_DATA.add(run_new_scan_(**spec))
+        st.success(f"{len(saved_ids)} sweep scans are now available in the 'Explore Scan Data' tab.", icon="ℹ️")
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 # --- Tab: Upload & Analyze Sonar Data ---
 with tabs[3]:
     st.header("⬆️ Upload & Analyze Sonar Data")
-    st.markdown("<p class='tab-description'>Upload your sonar images (PNG, JPG) or data files (CSV, TXT). Then, use the sidebar AI Assistant to ask questions about the uploaded content (e.g., 'Analyze the uploaded image' or 'Tell me about the data file I uploaded called X.csv').</p>", unsafe_allow_html=True)
+    st.markdown("<p class='tab-description'>Upload your sonar images (PNG, JPG), data files (CSV, TXT) or binary ping files (raw, SEG-Y, XTF). Then, use the sidebar AI Assistant to ask questions about the uploaded content (e.g., 'Analyze the uploaded image' or 'Tell me about the data file I uploaded called X.csv').</p>", unsafe_allow_html=True)
     st.markdown('<div class="scrollable-tab-content">', unsafe_allow_html=True)
 
     st.subheader("Upload Sonar Image")
@@ -1208,15 +1832,17 @@ with tabs[3]:
 
     if uploaded_image_file is not None:
         try:
-            image = Image.open(uploaded_image_file)
-            st.image(image, caption=f"Uploaded Image: {uploaded_image_file.name}", use_column_width=True)
-            st.session_state.last_uploaded_image = {"name": uploaded_image_file.name, "image_obj": image} # image_obj stored for display, not sent to AI
+            render_uploaded_image(uploaded_image_file)
+            st.session_state.last_uploaded_image = {"name": uploaded_image_file.name, "upload_key": upload_digest(uploaded_image_file)} # Pixels live in the upload store, not in session
             st.session_state.last_uploaded_data_file = None 
             st.success(f"Image '{uploaded_image_file.name}' loaded. You can now ask the AI Assistant in the sidebar to discuss it.", icon="🖼️")
             st.info(f"Example prompt for AI: \"What might typical features in a sonar image like '{uploaded_image_file.name}' represent?\" or \"Discuss the uploaded image named {uploaded_image_file.name}\".", icon="💡")
         except Exception as e_img:
             st.error(f"Error processing image: {e_img}")
             st.session_state.last_uploaded_image = None
+    elif st.session_state.get("uploaded_image_preview"): # Upload removed: release its spilled pixels and thumbnail
+        load_upload_store().discard(st.session_state.upload_session_id, st.session_state.uploaded_image_preview["upload_key"])
+        st.session_state.uploaded_image_preview = None
 
     st.markdown("---")
     st.subheader("Upload Sonar Data File")
@@ -1228,13 +1854,16 @@ with tabs[3]:
         content_preview_for_ai = None
         try:
             if uploaded_data_file.type == "text/csv":
-                df = pd.read_csv(uploaded_data_file)
-                st.dataframe(df.head(10)) 
-                if len(df) > 10: st.caption(f"Showing first 10 rows of {len(df)} total rows.")
-                content_preview_for_ai = df.head(20).to_string() 
+                csv_summary = ingest_uploaded_csv(uploaded_data_file)
+                if csv_summary.error:
+                    st.warning(f"{csv_summary.error}. Statistics cover the rows read so far.", icon="⚠️")
+                with st.expander("Column Statistics", expanded=False):
+                    st.dataframe(csv_summary.stats, use_container_width=True)
+                render_stft_builder(uploaded_data_file, csv_summary)
+                content_preview_for_ai = csv_summary.preview.head(20).to_string() + \
+                    f"\n\nTotal rows: {csv_summary.rows}\nColumn statistics:\n{csv_summary.stats.to_string(index=False)}"
             elif uploaded_data_file.type == "text/plain":
-                stringio = io.StringIO(uploaded_data_file.getvalue().decode("utf-8"))
-                text_content = stringio.read()
+                text_content = parse_uploaded_text(uploaded_data_file)
                 st.text_area("File Content (first 1000 chars):", text_content[:1000], height=200)
                 content_preview_for_ai = text_content[:2000] 
             
@@ -1248,6 +1877,77 @@ with tabs[3]:
             st.session_state.last_uploaded_data_file = None
         st.markdown(f"</div>", unsafe_allow_html=True)
 
+    st.markdown("---")
+    st.subheader("Import Scan Export")
+    uploaded_export_file = st.file_uploader("Choose a scan exported from the hub (NPZ, Parquet or Arrow)", type=["npz", "parquet", "arrow"], key="scan_export_upload")
+    if uploaded_export_file is not None:
+        try:
+            imported_scan = import_scan(uploaded_export_file.getvalue())
+            display__result_block(imported_scan, context_key_suffix="import", simulated=False)
+            if st.button(f"➕ Add {imported_scan['scan_id']} to 'Explore Scan Data'", key="import_scan_add_btn"):
+                _SONAR_DATA.add(imported_scan)
+                st.success(f"Scan {imported_scan['scan_id']} is now available in the 'Explore Scan Data' tab.", icon="✅")
+        except Exception as e_import:
+            st.error(f"Error importing scan export: {e_import}")
+
+    st.markdown("---")
+    st.subheader("Upload Binary Sonar Data")
+    uploaded_binary_files = st.file_uploader(
+        "Choose binary ping files: raw float32/int16 matrices (with an optional .json/.hdr sidecar), SEG-Y or XTF",
+        type=[ext.lstrip(".") for ext in BINARY_EXTENSIONS + SIDECAR_EXTENSIONS], accept_multiple_files=True, key="sonar_binary_upload")
+
+    release_binary_uploads(uploaded_binary_files)
+    if uploaded_binary_files:
+        # Sidecars match "<name>.raw.json" or "<stem>.json"
+        sidecar_uploads = {os.path.splitext(f.name)[0]: f for f in uploaded_binary_files if os.path.splitext(f.name)[1].lower() in SIDECAR_EXTENSIONS}
+        for binary_file in uploaded_binary_files:
+            binary_ext = os.path.splitext(binary_file.name)[1].lower()
+            if binary_ext not in BINARY_EXTENSIONS:
+                continue
+            binary_key = hashlib.sha1(binary_file.file_id.encode("utf-8")).hexdigest()[:8]
+            st.markdown(f"<div class='scan-result-container'>", unsafe_allow_html=True)
+            st.subheader(f"Binary File: {binary_file.name}")
+            try:
+                reader_kwargs = {}
+                if binary_ext in RAW_EXTENSIONS:
+                    sidecar_file = sidecar_uploads.get(binary_file.name) or sidecar_uploads.get(os.path.splitext(binary_file.name)[0])
+                    if sidecar_file is not None:
+                        reader_kwargs["sidecar"] = parse_sidecar(sidecar_file.getvalue().decode("utf-8"), os.path.splitext(sidecar_file.name)[1])
+                    else:
+                        st.caption("No sidecar header uploaded for this file; describe its layout:")
+                        raw_col1, raw_col2, raw_col3 = st.columns(3)
+                        reader_kwargs["samples"] = int(raw_col1.number_input("Samples per ping", min_value=1, value=512, key=f"bin_samples_{binary_key}"))
+                        reader_kwargs["dtype"] = raw_col2.selectbox("Sample type", ["float32", "int16", "uint16", "float64"],
+                                                                    index=1 if binary_ext == ".i16" else 0, key=f"bin_dtype_{binary_key}")
+                        reader_kwargs["byte_order"] = raw_col3.selectbox("Byte order", ["little", "big"], key=f"bin_order_{binary_key}")
+                binary_path = spill_upload_to_disk(binary_file)
+                if binary_path is None:
+                    raise ValueError(f"{binary_file.size / 1024 ** 2:.0f} MB exceeds the upload quota of {UPLOAD_SESSION_QUOTA // 1024 ** 2} MB per session")
+                binary_scan = open_binary_scan(binary_path, **reader_kwargs)
+                st.caption(f"{binary_scan.info['pings']:,} pings x {binary_scan.info['samples']:,} samples ({binary_scan.info['dtype']}, "
+                           f"{'converted in memory' if binary_scan.info['copied'] else 'memory-mapped'}).")
+                binary_sonar_type = st.selectbox("Sonar type", list(BINARY_SONAR_TYPES), key=f"bin_type_{binary_key}")
+                uploaded_scan = {
+                    "scan_id": f"UPL-{re.sub(r'[^A-Za-z0-9]+', '', os.path.splitext(binary_file.name)[0])[:16].upper()}-{binary_key[:4].upper()}",
+                    "sonar_type": binary_sonar_type,
+                    "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC"),
+                    "location_": f"Uploaded file {binary_file.name}",
+                    "parameters": binary_scan.info,
+                    "spectrogram_data": binary_scan.data,
+                    "color_scale": BINARY_SONAR_TYPES[binary_sonar_type],
+                    "detected_targets": [],
+                    "summary": f"Binary {binary_scan.info['format'].upper()} upload '{binary_file.name}' with {binary_scan.info['pings']:,} pings.",
+                    "data_version": f"upload-{binary_key}",
+                }
+                render_spectrogram(uploaded_scan, key_prefix=f"bin_{binary_key}")
+                if st.button("➕ Add to 'Explore Scan Data'", key=f"bin_add_{binary_key}"):
+                    with st.spinner("Copying the scan into the shared scan store..."):
+                        _SONAR_DATA.add(uploaded_scan) # Copied out of the spilled upload, which the quota may evict; shared with every session
+                    st.success(f"Scan {uploaded_scan['scan_id']} added. Select it in the 'Explore Scan Data' tab.", icon="✅")
+            except Exception as e_binary:
+                st.error(f"Error reading binary file '{binary_file.name}': {e_binary}")
+            st.markdown(f"</div>", unsafe_allow_html=True)
+
     st.markdown("---")
     if st.session_state.last_uploaded_image:
         st.write(f"🗣️ **Ready for AI:** Image '{st.session_state.last_uploaded_image['name']}' is active for discussion via sidebar chat.")
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Sonar Analysis Hub core package.
+Numerical engines used by app.py. Modules here never import Streamlit so they can run in worker processes and batch jobs.
+"""
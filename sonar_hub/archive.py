@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming archive export of the scan catalog.
+Scans are serialized one at a time straight into a zip or tar stream (each as a sonar_hub.export file), followed by a
+manifest.json of their metadata, so peak memory is one scan regardless of catalog size. The output may be any
+writable file object, including a non-seekable one such as stdout.
+
+CLI (archives a ScanStore directory):
+    python -m sonar_hub.archive --store .sonar_scan_store --out catalog.zip --type Sea --since 2026-01-01
+"""
+
+import argparse
+import io
+import json
+import sys
+import tarfile
+import time
+import zipfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+from sonar_hub.export import EXPORT_FORMATS, export_scan
+from sonar_hub.scan_store import ScanStore, json_default
+from sonar_hub.timestamps import parse_timestamp
+
+ARCHIVE_FORMATS = {"zip": (".zip", "application/zip"), "tar": (".tar", "application/x-tar")}
+
+
+class ArchiveTooLarge(ValueError):
+    """The archive would exceed write_archive's max_bytes."""
+
+
+class _LimitedWriter:
+    """Write-through wrapper that raises ArchiveTooLarge once more than `max_bytes` have been written."""
+
+    def __init__(self, fileobj, max_bytes):
+        self._fileobj = fileobj
+        self.max_bytes = max_bytes
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if self.written > self.max_bytes:
+            raise ArchiveTooLarge(f"Archive exceeds the {self.max_bytes:,}-byte limit")
+        return self._fileobj.write(data)
+
+    def __getattr__(self, name): # tell/seek/flush of the underlying file, where it has them
+        return getattr(self._fileobj, name)
+
+
+def select_scans(metadata, sonar_types=None, since=None, until=None):
+    """scan_ids from an iterable of metadata dicts matching the filters.
+    `sonar_types` entries match as substrings ("Sea" matches "Sea (Side-Scan Sonar)"); since/until are aware datetimes,
+    and scans without a parseable timestamp are excluded only when a time filter is set."""
+    selected = []
+    for meta in metadata:
+        sonar_type = meta.get("sonar_type", "")
+        if sonar_types and not any(wanted in sonar_type for wanted in sonar_types):
+            continue
+        if since is not None or until is not None:
+            when = parse_timestamp(meta.get("timestamp"))
+            if when is None or (since is not None and when < since) or (until is not None and when > until):
+                continue
+        selected.append(meta["scan_id"])
+    return selected
+
+
+def estimate_archive_bytes(metadata):
+    """Upper bound on the size of an archive of the scans behind these metadata dicts, without loading any of them:
+    raw spectrogram bytes from "spectrogram_shape"/"spectrogram_dtype" (members are compressed, so they come out
+    smaller) plus metadata. Scans without a recorded shape count their metadata only."""
+    total = 0
+    for meta in metadata:
+        shape = meta.get("spectrogram_shape")
+        if shape:
+            total += int(np.prod(shape)) * np.dtype(meta.get("spectrogram_dtype") or "float64").itemsize
+        total += 2 * len(json.dumps(meta, default=json_default)) + 1024 # Member + manifest copies, headers
+    return total
+
+
+def _member_name(scan_id, member_format):
+    safe_id = "".join(c if c.isalnum() or c in "-_." else "_" for c in scan_id)
+    return f"scans/{safe_id}{EXPORT_FORMATS[member_format][0]}"
+
+
+def _add_member(archive, archive_format, name, data):
+    if archive_format == "zip":
+        with archive.open(name, "w") as member: # Members are already compressed, so they are stored as-is
+            member.write(data)
+    else:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        archive.addfile(info, io.BytesIO(data))
+
+
+def write_archive(fileobj, get_scan, scan_ids, archive_format="zip", member_format="npz", on_progress=None,
+                  max_bytes=None):
+    """Streams the scans `get_scan(scan_id)` returns into `fileobj` as a zip or tar archive; returns the manifest.
+    Missing scans are skipped; `on_progress(done, total)` is called after each scan. With `max_bytes`, writing stops
+    with ArchiveTooLarge as soon as the output would exceed it."""
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format: {archive_format}")
+    if max_bytes is not None:
+        fileobj = _LimitedWriter(fileobj, max_bytes)
+    if archive_format == "zip":
+        archive = zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+    else:
+        archive = tarfile.open(fileobj=fileobj, mode="w|") # Stream mode: never seeks
+    manifest = []
+    try:
+        for done, scan_id in enumerate(scan_ids, start=1):
+            scan = get_scan(scan_id)
+            if scan is not None:
+                name = _member_name(scan_id, member_format)
+                _add_member(archive, archive_format, name, export_scan(scan, member_format))
+                manifest.append(dict({k: v for k, v in scan.items() if k != "spectrogram_data"}, archive_member=name))
+            if on_progress is not None:
+                on_progress(done, len(scan_ids))
+        _add_member(archive, archive_format, "manifest.json",
+                    json.dumps({"scans": manifest, "member_format": member_format}, indent=2, default=json_default).encode("utf-8"))
+    finally:
+        archive.close()
+    return manifest
+
+
+def _parse_day(value, end_of_day=False):
+    day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return day.replace(hour=23, minute=59) if end_of_day else day
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive scans from a scan store directory into a zip or tar file.")
+    parser.add_argument("--store", required=True, metavar="DIR", help="ScanStore directory")
+    parser.add_argument("--out", required=True, help="Output file ('-' for stdout); .tar selects tar, anything else zip")
+    parser.add_argument("--type", action="append", dest="sonar_types", help="Sonar type substring filter (repeatable)")
+    parser.add_argument("--since", help="Earliest scan date, YYYY-MM-DD")
+    parser.add_argument("--until", help="Latest scan date, YYYY-MM-DD")
+    parser.add_argument("--member-format", default="npz", choices=sorted(EXPORT_FORMATS))
+    parser.add_argument("--format", choices=sorted(ARCHIVE_FORMATS), help="Archive format (default: from --out)")
+    args = parser.parse_args()
+
+    store = ScanStore(args.store)
+    ids = select_scans(store.iter_metadata(), args.sonar_types,
+                       _parse_day(args.since) if args.since else None, _parse_day(args.until, True) if args.until else None)
+    fmt = args.format or ("tar" if args.out.endswith(".tar") else "zip")
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    try:
+        written = write_archive(out, store.get, ids, fmt, args.member_format,
+                                on_progress=lambda done, total: print(f"{done}/{total}", end="\r", file=sys.stderr))
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"Archived {len(written)} scan(s) to {args.out}", file=sys.stderr)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped readers for binary ping formats.
+Each reader maps the file read-only and returns a BinaryScan whose `data` is a NumPy view over the mapping, oriented
+like every other spectrogram in the hub: rows are samples (range/depth bins), columns are pings/traces. Nothing is
+copied unless the on-disk sample format has no NumPy equivalent (IBM floats in SEG-Y), which is flagged in `info`.
+
+Formats:
+- Raw matrices (.raw/.bin/.dat/.f32/.i16): consecutive pings of `samples` values each, described by a sidecar
+  JSON ({"samples": 512, "dtype": "float32", "byte_order": "little", "header_bytes": 0}) or ENVI-style .hdr
+  ("samples = 512", "data type = 4", "byte order = 0", "header offset = 0") file.
+- SEG-Y (.sgy/.segy): 3200-byte text + 400-byte binary file header, then fixed-size traces (240-byte header + samples).
+- XTF (.xtf): sonar ping packets of one channel; uniformly spaced packets are mapped as a strided view.
+- Any other fixed-record layout via `open_uniform_records`.
+"""
+
+import json
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+RAW_EXTENSIONS = (".raw", ".bin", ".dat", ".f32", ".i16")
+SEGY_EXTENSIONS = (".sgy", ".segy")
+XTF_EXTENSIONS = (".xtf",)
+SIDECAR_EXTENSIONS = (".json", ".hdr")
+BINARY_EXTENSIONS = RAW_EXTENSIONS + SEGY_EXTENSIONS + XTF_EXTENSIONS
+
+# data: (samples x pings) NumPy view; info: JSON-friendly description (format, dtype, shape, copied, ...)
+BinaryScan = namedtuple("BinaryScan", "data info")
+
+_EXTENSION_DTYPES = {".f32": "float32", ".i16": "int16"}
+_ENVI_DTYPES = {1: "uint8", 2: "int16", 3: "int32", 4: "float32", 5: "float64", 12: "uint16", 13: "uint32"}
+_SEGY_FORMATS = {1: "ibm32", 2: "i4", 3: "i2", 5: "f4", 6: "f8", 8: "i1", 9: "i8", 10: "u4", 11: "u2", 16: "u1"}
+_XTF_SAMPLE_DTYPES = {1: "u1", 2: "<u2", 4: "<u4"}
+
+
+class BinaryFormatError(ValueError):
+    """Raised when a file does not match the layout its extension or header promises."""
+
+
+def _sized_dtype(dtype, byte_order="little"):
+    dtype = np.dtype(dtype)
+    return dtype if dtype.itemsize == 1 else dtype.newbyteorder("<" if byte_order in ("little", "<", 0, "0") else ">")
+
+
+# --- Sidecar headers for raw matrices ---
+
+def parse_sidecar(text, kind="json"):
+    """Parses a raw-matrix header (JSON or ENVI-style .hdr text) into {"samples", "dtype", "byte_order", "header_bytes", "pings"}."""
+    if kind.lstrip(".") == "json":
+        raw = json.loads(text)
+        header = {
+            "samples": raw.get("samples") or raw.get("samples_per_ping") or raw.get("cols"),
+            "pings": raw.get("pings") or raw.get("rows"),
+            "dtype": raw.get("dtype"),
+            "byte_order": raw.get("byte_order", "little"),
+            "header_bytes": raw.get("header_bytes", 0),
+        }
+    else:
+        fields = {}
+        for line in text.splitlines():
+            match = re.match(r"\s*([^=]+?)\s*=\s*(.+?)\s*$", line)
+            if match:
+                fields[match.group(1).lower()] = match.group(2)
+        data_type = int(fields["data type"]) if "data type" in fields else None
+        header = {
+            "samples": fields.get("samples"),
+            "pings": fields.get("lines"),
+            "dtype": _ENVI_DTYPES.get(data_type) if data_type is not None else None,
+            "byte_order": "big" if fields.get("byte order", "0").strip() == "1" else "little",
+            "header_bytes": fields.get("header offset", 0),
+        }
+    for key in ("samples", "pings", "header_bytes"):
+        if header[key] is not None:
+            header[key] = int(header[key])
+    return header
+
+
+def find_sidecar(path):
+    """Returns the parsed sidecar next to `path` (<file>.json, <stem>.json, <file>.hdr or <stem>.hdr), or None."""
+    stem = os.path.splitext(path)[0]
+    for candidate in (path + ".json", stem + ".json", path + ".hdr", stem + ".hdr"):
+        if os.path.isfile(candidate):
+            with open(candidate, "r", encoding="utf-8") as f:
+                return parse_sidecar(f.read(), os.path.splitext(candidate)[1])
+    return None
+
+
+# --- Readers ---
+
+def open_raw_matrix(path, samples=None, dtype=None, byte_order=None, header_bytes=None, pings=None, sidecar=None):
+    """Maps a raw ping matrix. Missing arguments come from `sidecar` (a parse_sidecar dict), a sidecar file next to
+    `path`, or (dtype only) the file extension; byte order defaults to little-endian."""
+    sidecar = sidecar or find_sidecar(path) or {}
+    samples = samples or sidecar.get("samples")
+    dtype = dtype or sidecar.get("dtype") or _EXTENSION_DTYPES.get(os.path.splitext(path)[1].lower())
+    byte_order = byte_order or sidecar.get("byte_order") or "little"
+    header_bytes = header_bytes if header_bytes is not None else sidecar.get("header_bytes") or 0
+    if not samples or not dtype:
+        raise BinaryFormatError(f"{os.path.basename(path)}: samples per ping and dtype are required (pass them or add a .json/.hdr sidecar).")
+    dtype = _sized_dtype(dtype, byte_order)
+    available = (os.path.getsize(path) - header_bytes) // (samples * dtype.itemsize)
+    pings = min(pings or sidecar.get("pings") or available, available)
+    if pings < 1:
+        raise BinaryFormatError(f"{os.path.basename(path)}: file is smaller than one ping of {samples} x {dtype}.")
+    data = np.memmap(path, dtype=dtype, mode="r", offset=header_bytes, shape=(pings, samples))
+    info = {"format": "raw", "dtype": str(dtype), "pings": int(pings), "samples": int(samples), "copied": False}
+    return BinaryScan(data.T, info)
+
+
+def open_uniform_records(path, samples, dtype, record_bytes=None, header_bytes=0, record_header_bytes=0, records=None):
+    """Maps fixed-size records (optional per-record header, then `samples` values) as a strided (samples x records) view."""
+    dtype = np.dtype(dtype)
+    record_bytes = record_bytes or record_header_bytes + samples * dtype.itemsize
+    if record_bytes < record_header_bytes + samples * dtype.itemsize:
+        raise BinaryFormatError("record_bytes is smaller than the record header plus its samples.")
+    available = (os.path.getsize(path) - header_bytes - record_header_bytes - samples * dtype.itemsize) // record_bytes + 1
+    records = min(records or available, available)
+    if records < 1:
+        raise BinaryFormatError(f"{os.path.basename(path)}: no complete record found.")
+    raw = np.memmap(path, dtype=np.uint8, mode="r")
+    data = np.ndarray(shape=(records, samples), dtype=dtype, buffer=raw,
+                      offset=header_bytes + record_header_bytes, strides=(record_bytes, dtype.itemsize))
+    info = {"format": "records", "dtype": str(dtype), "pings": int(records), "samples": int(samples), "copied": False}
+    return BinaryScan(data.T, info)
+
+
+def ibm_to_float32(words, chunk_rows=4096):
+    """Converts big-endian IBM System/360 floats (a 2-D uint32 array) to IEEE float32, a block of rows at a time."""
+    out = np.empty(words.shape, dtype=np.float32)
+    for start in range(0, words.shape[0], chunk_rows):
+        w = np.asarray(words[start:start + chunk_rows], dtype=np.uint32)
+        sign = np.where(w >> 31, -1.0, 1.0)
+        exponent = ((w >> 24) & 0x7F).astype(np.int32) - 64
+        mantissa = (w & 0x00FFFFFF).astype(np.float64) / float(1 << 24)
+        out[start:start + chunk_rows] = sign * mantissa * np.power(16.0, exponent)
+    return out
+
+
+def open_segy(path):
+    """Maps a SEG-Y file as a structured array of (240-byte header, samples) traces and returns the sample view."""
+    with open(path, "rb") as f:
+        head = f.read(3600)
+    if len(head) < 3600:
+        raise BinaryFormatError(f"{os.path.basename(path)}: too short for a SEG-Y file header.")
+    for endian in (">", "<"): # Big-endian per the standard; SEG-Y rev 2 also allows little-endian
+        sample_interval_us, samples, format_code = (int(np.frombuffer(head, dtype=endian + "u2", count=1, offset=o)[0]) for o in (3216, 3220, 3224))
+        if format_code in _SEGY_FORMATS and samples > 0:
+            break
+    else:
+        raise BinaryFormatError(f"{os.path.basename(path)}: unsupported SEG-Y sample format code {format_code}.")
+    extended_headers = max(0, int(np.frombuffer(head, dtype=endian + "i2", count=1, offset=3504)[0]))
+    data_offset = 3600 + 3200 * extended_headers
+    sample_code = _SEGY_FORMATS[format_code]
+    sample_dtype = np.dtype(endian + "u4") if sample_code == "ibm32" else _sized_dtype(sample_code, "big" if endian == ">" else "little")
+    trace_dtype = np.dtype([("header", "V240"), ("samples", sample_dtype, (samples,))])
+    traces = (os.path.getsize(path) - data_offset) // trace_dtype.itemsize
+    if traces < 1:
+        raise BinaryFormatError(f"{os.path.basename(path)}: no complete trace of {samples} samples found.")
+    mapped = np.memmap(path, dtype=trace_dtype, mode="r", offset=data_offset, shape=(traces,))
+    data = mapped["samples"] # (traces x samples) view into the mapping
+    copied = sample_code == "ibm32"
+    if copied:
+        data = ibm_to_float32(data)
+    info = {"format": "segy", "dtype": "float32 (from IBM)" if copied else str(sample_dtype), "pings": int(traces),
+            "samples": int(samples), "sample_interval_us": sample_interval_us, "copied": copied}
+    return BinaryScan(data.T, info)
+
+
+def open_xtf(path, channel=0, sample_dtype=None):
+    """Maps one sonar channel of an XTF file. Uniformly spaced ping packets give a zero-copy strided view;
+    files with interleaved navigation/attitude packets or varying sample counts are gathered into one array."""
+    raw = np.memmap(path, dtype=np.uint8, mode="r")
+    if raw.size < 1024 or raw[0] != 0x7B:
+        raise BinaryFormatError(f"{os.path.basename(path)}: not an XTF file (bad file header).")
+    sonar_channels = int(raw[166:168].view("<u2")[0])
+    bathy_channels = int(raw[168:170].view("<u2")[0])
+    if channel >= sonar_channels:
+        raise BinaryFormatError(f"{os.path.basename(path)}: channel {channel} requested, file has {sonar_channels} sonar channel(s).")
+    total_channels = sonar_channels + bathy_channels
+    file_header_bytes = 1024 if total_channels <= 6 else 1024 * (1 + (256 + 128 * total_channels - 1) // 1024)
+    bytes_per_sample = int(raw[256 + 128 * channel + 6:256 + 128 * channel + 8].view("<u2")[0])
+    dtype = np.dtype(sample_dtype or _XTF_SAMPLE_DTYPES.get(bytes_per_sample, "<u2"))
+
+    data_offsets, sample_counts = [], []
+    pos = file_header_bytes
+    while pos + 256 <= raw.size:
+        if raw[pos] != 0xCE or raw[pos + 1] != 0xFA:
+            raise BinaryFormatError(f"{os.path.basename(path)}: lost packet sync at byte {pos}.")
+        header_type = int(raw[pos + 2])
+        chans_to_follow = int(raw[pos + 4:pos + 6].view("<u2")[0])
+        record_bytes = int(raw[pos + 10:pos + 14].view("<u4")[0])
+        if record_bytes < 256:
+            raise BinaryFormatError(f"{os.path.basename(path)}: corrupt packet length at byte {pos}.")
+        if header_type == 0: # Sonar ping: 256-byte ping header, then (64-byte channel header + samples) per channel
+            chan_pos = pos + 256
+            for _ in range(chans_to_follow):
+                chan_number = int(raw[chan_pos:chan_pos + 2].view("<u2")[0])
+                n_samples = int(raw[chan_pos + 42:chan_pos + 46].view("<u4")[0])
+                if chan_number == channel:
+                    data_offsets.append(chan_pos + 64)
+                    sample_counts.append(n_samples)
+                    break
+                chan_pos += 64 + n_samples * bytes_per_sample
+        pos += record_bytes
+    if not data_offsets:
+        raise BinaryFormatError(f"{os.path.basename(path)}: no sonar pings for channel {channel}.")
+
+    offsets = np.asarray(data_offsets, dtype=np.int64)
+    samples = min(sample_counts)
+    steps = np.diff(offsets)
+    uniform = len(set(sample_counts)) == 1 and (steps.size == 0 or np.all(steps == steps[0]))
+    if uniform:
+        stride = int(steps[0]) if steps.size else samples * dtype.itemsize
+        data = np.ndarray(shape=(len(offsets), samples), dtype=dtype, buffer=raw, offset=int(offsets[0]),
+                          strides=(stride, dtype.itemsize))
+    else:
+        data = np.stack([np.ndarray((samples,), dtype=dtype, buffer=raw, offset=int(o)) for o in offsets])
+    info = {"format": "xtf", "dtype": str(dtype), "pings": len(offsets), "samples": int(samples), "channel": channel,
+            "sonar_channels": sonar_channels, "copied": not uniform}
+    return BinaryScan(data.T, info)
+
+
+def open_binary_scan(path, **kwargs):
+    """Opens any supported binary ping file by extension. Keyword arguments go to the format's reader."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in SEGY_EXTENSIONS:
+        return open_segy(path)
+    if ext in XTF_EXTENSIONS:
+        return open_xtf(path, **kwargs)
+    if ext in RAW_EXTENSIONS:
+        return open_raw_matrix(path, **kwargs)
+    raise BinaryFormatError(f"Unsupported binary sonar format: {ext or path}")
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Small thread-safe LRU cache shared by the hub's engines.
+Streamlit serves every session from threads of one process, so all access goes through a lock.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+def nbytes_of(value):
+    """Best-effort memory size of a cached value (NumPy arrays, bytes, or containers of them)."""
+    if value is None:
+        return 0
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(nbytes_of(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes_of(v) for v in value)
+    return 0
+
+
+class LRUCache:
+    """Mapping bounded by entry count and, optionally, total size in bytes. Least recently used entries are evicted first."""
+
+    def __init__(self, max_entries=128, max_bytes=None, sizeof=nbytes_of):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data = OrderedDict() # key -> (value, size)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key][0]
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._total_bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self._total_bytes += size
+            self._evict_locked()
+        return value
+
+    def get_or_create(self, key, factory):
+        """Returns the cached value for `key`, building it with `factory()` on a miss (outside the lock)."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self.misses += 1
+        return self.put(key, factory())
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value, size = self._data.pop(key)
+            self._total_bytes -= size
+            return value
+
+    def discard_where(self, predicate):
+        """Drops every entry whose key satisfies `predicate(key)`."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                self._total_bytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        return {"entries": len(self._data), "bytes": self._total_bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _evict_locked(self):
+        # Always keep the newest entry, even if it alone exceeds max_bytes.
+        while len(self._data) > 1 and (
+            (self.max_entries is not None and len(self._data) > self.max_entries)
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            _, (_, size) = self._data.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
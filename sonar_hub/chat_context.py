@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Token-budgeted conversation context for the AI Assistant.
+Each request carries the system prompt, a rolling summary of older turns and the last N turns verbatim, and stays under
+a configurable token budget. App-generated notices (messages flagged {"notice": True}) are never sent.
+"""
+
+import hashlib
+import math
+
+try:
+    import tiktoken # Optional: exact counts for OpenAI-style tokenizers
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception: # ImportError, or no cached encoding offline
+    _ENCODING = None
+
+MESSAGE_OVERHEAD_TOKENS = 4 # Role and separator tokens per chat message
+SUMMARY_HEADER = "\n\nSummary of the earlier conversation with this user:\n"
+
+
+def estimate_tokens(text):
+    """Token count of `text`: exact with tiktoken installed, otherwise the usual ~4 characters per token estimate."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def count_message_tokens(messages):
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_to_tokens(text, max_tokens, keep="tail"):
+    """Cuts `text` to roughly `max_tokens`, keeping its start ("head") or its end ("tail")."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * 4)
+    return "…" + text[-max_chars:] if keep == "tail" else text[:max_chars] + "…"
+
+
+def extractive_summary(previous_summary, messages, max_tokens):
+    """Fallback summarizer without an LLM: one clipped line per folded message, oldest lines dropped first."""
+    lines = [previous_summary] if previous_summary else []
+    for msg in messages:
+        speaker = "User" if msg["role"] == "user" else "Assistant"
+        lines.append(f"- {speaker}: {truncate_to_tokens(' '.join(msg['content'].split()), 60, keep='head')}")
+    return truncate_to_tokens("\n".join(lines), max_tokens, keep="tail")
+
+
+def _split_turns(messages):
+    """Groups messages into turns: a user message plus the assistant replies that follow it."""
+    turns = []
+    for msg in messages:
+        if msg["role"] == "user" or not turns:
+            turns.append([msg])
+        else:
+            turns[-1].append(msg)
+    return turns
+
+
+def _fingerprint(messages):
+    digest = hashlib.sha1()
+    for msg in messages:
+        digest.update(msg["role"].encode("utf-8") + b"\0" + msg["content"].encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def _merge_same_role(messages):
+    """Chat APIs such as Perplexity require user/assistant alternation after the system message."""
+    merged = []
+    for msg in messages:
+        if merged and merged[-1]["role"] == msg["role"]:
+            merged[-1] = {"role": msg["role"], "content": merged[-1]["content"] + "\n\n" + msg["content"]}
+        else:
+            merged.append(dict(msg))
+    while merged and merged[0]["role"] == "assistant":
+        merged.pop(0)
+    return merged
+
+
+class ConversationContext:
+    """Builds token-budgeted message lists; keep one instance per chat session (it caches the rolling summary).
+
+    `summarizer(previous_summary, messages, max_tokens)` folds older messages into the summary; it is only called for
+    messages not folded before. Without one, or if it raises, `extractive_summary` is used.
+    """
+
+    def __init__(self, system_prompt, budget_tokens=6000, keep_last_turns=6, summary_tokens=500, summarizer=None):
+        self.system_prompt = system_prompt
+        self.budget_tokens = budget_tokens
+        self.keep_last_turns = keep_last_turns
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.summary = ""
+        self._folded_count = 0
+        self._folded_fingerprint = _fingerprint([])
+        self.last_request_tokens = 0
+
+    def reset(self):
+        self.summary = ""
+        self._folded_count = 0
+        self._folded_fingerprint = _fingerprint([])
+
+    def _fold(self, folded):
+        """Brings the cached summary up to date with `folded` (the oldest messages), summarizing only new ones."""
+        if len(folded) < self._folded_count or _fingerprint(folded[:self._folded_count]) != self._folded_fingerprint:
+            self.reset() # History was cleared or edited; rebuild from scratch
+        new_messages = folded[self._folded_count:]
+        if not new_messages:
+            return
+        try:
+            if self.summarizer is None:
+                raise LookupError("no summarizer configured")
+            summary = self.summarizer(self.summary, new_messages, self.summary_tokens)
+        except Exception as e_summary:
+            if self.summarizer is not None:
+                print(f"Conversation summarizer failed, using extractive summary: {e_summary}")
+            summary = extractive_summary(self.summary, new_messages, self.summary_tokens)
+        self.summary = truncate_to_tokens(summary or "", self.summary_tokens)
+        self._folded_count = len(folded)
+        self._folded_fingerprint = _fingerprint(folded)
+
+    def _system_message(self):
+        content = self.system_prompt
+        if self.summary:
+            content += SUMMARY_HEADER + self.summary
+        return {"role": "system", "content": content}
+
+    def _system_tokens(self, summary_tokens):
+        """Tokens of the system message carrying a summary of `summary_tokens` tokens."""
+        header = SUMMARY_HEADER if summary_tokens else ""
+        return estimate_tokens(self.system_prompt + header) + summary_tokens + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, history, current_user_content):
+        """Returns API messages for `history` (excluding the current prompt) plus the current user turn."""
+        conversation = [
+            {"role": m["role"], "content": str(m.get("content", ""))}
+            for m in history
+            if m.get("role") in ("user", "assistant") and not m.get("notice")
+        ]
+        turns = _split_turns(conversation)
+        current = {"role": "user", "content": current_user_content}
+        # Turns already folded into the summary stay folded, so the summary is never rebuilt just to un-fold them.
+        folded_turns = 0
+        summary_valid = bool(self._folded_count) and _fingerprint(conversation[:self._folded_count]) == self._folded_fingerprint
+        if summary_valid:
+            folded_messages = 0
+            while folded_turns < len(turns) and folded_messages < self._folded_count:
+                folded_messages += len(turns[folded_turns])
+                folded_turns += 1
+        # Pick the number of verbatim turns from token counts alone, reserving summary_tokens for a summary that would
+        # change, then fold once: one summarizer call per request however far over budget the history is.
+        keep = min(self.keep_last_turns, len(turns) - folded_turns)
+        while keep > 0:
+            folded_count = sum(len(turn) for turn in turns[:len(turns) - keep])
+            if folded_count == (self._folded_count if summary_valid else 0): # Summary reused (or empty) as it is
+                summary_tokens = estimate_tokens(self.summary) if folded_count else 0
+            else:
+                summary_tokens = self.summary_tokens
+            verbatim = [msg for turn in turns[len(turns) - keep:] for msg in turn]
+            if self._system_tokens(summary_tokens) + count_message_tokens(_merge_same_role(verbatim + [current])) <= self.budget_tokens:
+                break
+            keep -= 1
+        verbatim = [msg for turn in turns[len(turns) - keep:] for msg in turn]
+        self._fold([msg for turn in turns[:len(turns) - keep] for msg in turn])
+        messages = [self._system_message()] + _merge_same_role(verbatim + [current])
+        self.last_request_tokens = count_message_tokens(messages)
+        if self.last_request_tokens > self.budget_tokens:
+            print(f"Chat context still over budget ({self.last_request_tokens} > {self.budget_tokens} tokens) after folding all history.")
+        return messages
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Binary scan export / import.
+Unlike the JSON export, these formats carry the full spectrogram (compressed) with the scan metadata and detected
+targets alongside, and load back into a scan dict directly:
+- NPZ: `spectrogram` array plus a `metadata_json` string (NumPy only, loads without pickle).
+- Parquet / Arrow IPC: one row per spectrogram row (a fixed-size float list), metadata as JSON in the schema metadata.
+  Both need pyarrow.
+"""
+
+import io
+import json
+import zipfile
+
+import numpy as np
+
+from sonar_hub.scan_store import json_default
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError: # Optional: NPZ export works without it
+    pa = pa_ipc = pq = None
+
+SPECTROGRAM_KEY = "spectrogram_data"
+SCHEMA_METADATA_KEY = b"sonar_hub.scan"
+EXPORT_FORMATS = { # name -> (file extension, MIME type, needs pyarrow)
+    "npz": (".npz", "application/octet-stream", False),
+    "parquet": (".parquet", "application/vnd.apache.parquet", True),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file", True),
+}
+
+
+class ScanImportError(ValueError):
+    """Raised when bytes are not a scan export this module understands."""
+
+
+def available_formats():
+    return [name for name, (_, _, needs_arrow) in EXPORT_FORMATS.items() if pa is not None or not needs_arrow]
+
+
+def _split(scan):
+    meta = {k: v for k, v in scan.items() if k != SPECTROGRAM_KEY}
+    data = scan.get(SPECTROGRAM_KEY)
+    return meta, (None if data is None else np.asarray(data))
+
+
+def _metadata_json(meta):
+    return json.dumps(meta, default=json_default)
+
+
+def _arrow_table(scan):
+    meta, data = _split(scan)
+    if data is None:
+        data = np.zeros((0, 0), dtype=np.float32)
+    data = np.ascontiguousarray(data, dtype=data.dtype.newbyteorder("=")) # Arrow wants native byte order
+    width = data.shape[1] if data.ndim == 2 else 0
+    values = pa.array(data.reshape(-1))
+    column = pa.FixedSizeListArray.from_arrays(values, width) if width else pa.array([], type=pa.list_(values.type, 0))
+    return pa.table({"spectrogram_row": column}, metadata={SCHEMA_METADATA_KEY: _metadata_json(meta).encode("utf-8")})
+
+
+def export_scan(scan, fmt="npz"):
+    """Serializes a scan dict to bytes in `fmt` (see EXPORT_FORMATS)."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if EXPORT_FORMATS[fmt][2] and pa is None:
+        raise ImportError(f"The {fmt} export requires the 'pyarrow' package (pip install pyarrow).")
+    buffer = io.BytesIO()
+    if fmt == "npz":
+        meta, data = _split(scan)
+        arrays = {"metadata_json": np.array(_metadata_json(meta))}
+        if data is not None:
+            arrays["spectrogram"] = data
+        np.savez_compressed(buffer, **arrays)
+    elif fmt == "parquet":
+        pq.write_table(_arrow_table(scan), buffer, compression="zstd")
+    else:
+        table = _arrow_table(scan) # Converted once, for both the schema and the data
+        with pa_ipc.new_file(buffer, table.schema, options=pa_ipc.IpcWriteOptions(compression="zstd")) as writer:
+            writer.write_table(table)
+    return buffer.getvalue()
+
+
+def _scan_from_table(table):
+    raw_meta = (table.schema.metadata or {}).get(SCHEMA_METADATA_KEY)
+    if raw_meta is None or "spectrogram_row" not in table.column_names:
+        raise ScanImportError("Arrow data is not a Sonar Hub scan export.")
+    scan = json.loads(raw_meta.decode("utf-8"))
+    column = table.column("spectrogram_row").combine_chunks()
+    if len(column):
+        width = column.type.list_size
+        scan[SPECTROGRAM_KEY] = column.flatten().to_numpy(zero_copy_only=False).reshape(len(column), width)
+    return scan
+
+
+def import_scan(data):
+    """Loads a scan dict from NPZ, Parquet or Arrow IPC export bytes (format detected from the content)."""
+    if data[:4] == b"PAR1":
+        if pq is None:
+            raise ImportError("Reading Parquet exports requires the 'pyarrow' package (pip install pyarrow).")
+        return _scan_from_table(pq.read_table(io.BytesIO(data)))
+    if data[:6] == b"ARROW1":
+        if pa_ipc is None:
+            raise ImportError("Reading Arrow exports requires the 'pyarrow' package (pip install pyarrow).")
+        return _scan_from_table(pa_ipc.open_file(pa.BufferReader(data)).read_all())
+    if data[:2] == b"PK":
+        try:
+            with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+                if "metadata_json" not in npz.files:
+                    raise ScanImportError("NPZ file is not a Sonar Hub scan export (no metadata_json).")
+                scan = json.loads(str(npz["metadata_json"]))
+                if "spectrogram" in npz.files:
+                    scan[SPECTROGRAM_KEY] = npz["spectrogram"]
+            return scan
+        except zipfile.BadZipFile as e_zip:
+            raise ScanImportError(f"Corrupt NPZ export: {e_zip}")
+    raise ScanImportError("Unrecognized scan export (expected NPZ, Parquet or Arrow IPC).")
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-scan fusion: align overlapping scans and mosaic them onto one grid (the "Data Fusion and Alignment" stage).
+Each scan is a grid in metres: rows run along-track, columns across range, with an origin and a cell size
+(scan_geometry). Alignment estimates each scan's translation against the first one with FFT phase correlation on a
+common cell size; rotation is not estimated, and a shift whose correlation peak stands less than
+MIN_ALIGNMENT_PEAK_RATIO times above the surface's noise is rejected in favour of the scan's stored geometry. The mosaic is written tile by tile: every output tile bilinearly
+samples only the part of each scan it covers, and overlaps are blended with feathered weights that fall off towards
+scan edges.
+Memory is bounded by the tile size, so mosaics larger than RAM can go straight to an np.lib.format.open_memmap.
+
+Benchmark: python -m sonar_hub.fusion
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_TILE = (1024, 1024)
+DEFAULT_FEATHER = 16 # Cells over which a scan's weight ramps up from its edge
+# Peak / std of the correlation surface: unrelated or barely overlapping scans reach 8-15 (more for larger grids),
+# real matches 20 and up. The raw peak is no test on its own: its noise floor falls as the grids grow.
+MIN_ALIGNMENT_PEAK_RATIO = 20.0
+
+# origin_m: (along, range) of cell (0, 0)'s centre; cell_m: (along, range) cell size; shape: (rows, cols)
+Placement = namedtuple("Placement", "scan_id origin_m cell_m shape")
+# Phase correlation result for one scan; accepted is False when the peak was too weak and stored geometry was used
+Alignment = namedtuple("Alignment", "shift_cells shift_m peak peak_ratio accepted")
+
+
+def scan_geometry(scan):
+    """(origin_m, cell_m) of a scan: its "geometry" entry if present, else range cells from the range parameter
+    (range_m / depth_m_max / max_range_m over the columns), square cells and the origin at (0, 0)."""
+    data = scan["spectrogram_data"]
+    geometry = scan.get("geometry") or {}
+    if "cell_m" in geometry:
+        cell = tuple(float(v) for v in geometry["cell_m"])
+    else:
+        params = scan.get("parameters") or {}
+        extent = next((params[k] for k in ("range_m", "depth_m_max", "max_range_m", "range_generic") if params.get(k)), None)
+        cell_range = float(extent) / data.shape[1] if extent else 1.0
+        cell = (cell_range, cell_range)
+    return tuple(float(v) for v in geometry.get("origin_m", (0.0, 0.0))), cell
+
+
+def resample(data, shape):
+    """Bilinear resize of a 2-D array to `shape` (cell centres aligned), as two separable gathers."""
+    data = np.asarray(data, dtype=np.float32)
+    rows = _axis_sampling(data.shape[0], shape[0])
+    cols = _axis_sampling(data.shape[1], shape[1])
+    return _bilinear(data, rows, cols)
+
+
+def _axis_sampling(n_in, n_out):
+    pos = np.clip((np.arange(n_out) + 0.5) * n_in / n_out - 0.5, 0, n_in - 1)
+    lo = np.floor(pos).astype(np.intp)
+    return lo, np.minimum(lo + 1, n_in - 1), (pos - lo).astype(np.float32)
+
+
+def _bilinear(data, rows, cols):
+    r0, r1, fr = rows
+    c0, c1, fc = cols
+    top = data[r0][:, c0] * (1 - fc) + data[r0][:, c1] * fc
+    bottom = data[r1][:, c0] * (1 - fc) + data[r1][:, c1] * fc
+    return top * (1 - fr)[:, None] + bottom * fr[:, None]
+
+
+def _prepared(data):
+    data = np.asarray(data, dtype=np.float64)
+    data = data - data.mean()
+    return data * np.outer(np.hanning(data.shape[0]), np.hanning(data.shape[1])) # Taper edges against spurious peaks
+
+
+def phase_correlation(reference, moving):
+    """Translation (rows, cols) that places `moving` on `reference` (moving[i, j] ~ reference[i + dy, j + dx]), with
+    sub-cell refinement, the normalised correlation peak (near 1 for a clean match, near 0 for none) and the peak's ratio
+    to the standard deviation of the correlation surface.
+    Both arrays are zero-padded to the combined size, so shifts up to the full extent of either are unambiguous."""
+    shape = (reference.shape[0] + moving.shape[0], reference.shape[1] + moving.shape[1])
+    f_ref = np.fft.rfft2(_prepared(reference), s=shape)
+    f_mov = np.fft.rfft2(_prepared(moving), s=shape)
+    cross = f_ref * np.conj(f_mov)
+    cross /= np.maximum(np.abs(cross), 1e-12)
+    surface = np.fft.irfft2(cross, s=shape)
+    peak_idx = np.unravel_index(np.argmax(surface), shape)
+    shift = []
+    for axis, (idx, size) in enumerate(zip(peak_idx, shape)):
+        neighbours = [surface[tuple((idx + d) % size if a == axis else peak_idx[a] for a in range(2))] for d in (-1, 0, 1)]
+        denom = neighbours[0] - 2 * neighbours[1] + neighbours[2]
+        offset = 0.5 * (neighbours[0] - neighbours[2]) / denom if denom < 0 else 0.0 # Parabola through the peak
+        value = idx + offset
+        shift.append(value - size if value > size / 2 else value) # Wrap to a signed shift
+    peak = float(surface[peak_idx])
+    return (shift[0], shift[1]), peak, peak / max(float(surface.std()), 1e-12)
+
+
+def align_scans(scans, max_cells=1024, min_peak_ratio=MIN_ALIGNMENT_PEAK_RATIO):
+    """Placements for `scans` with every scan after the first translated onto it by phase correlation.
+    Correlation runs on copies resampled to the reference cell size and at most `max_cells` per side. A shift whose
+    peak ratio is below `min_peak_ratio` is not trusted: that scan keeps its stored geometry and its alignment is not accepted.
+    Returns (placements, alignments); the first alignment is the zero shift of the reference."""
+    ref_origin, ref_cell = scan_geometry(scans[0])
+    ref_data = scans[0]["spectrogram_data"]
+    factor = min(1.0, max_cells / max(ref_data.shape))
+    work_cell = (ref_cell[0] / factor, ref_cell[1] / factor)
+
+    def on_work_grid(data, cell):
+        shape = (max(2, int(round(data.shape[0] * cell[0] / work_cell[0]))), max(2, int(round(data.shape[1] * cell[1] / work_cell[1]))))
+        return resample(data, shape)
+
+    reference = on_work_grid(ref_data, ref_cell)
+    placements = [Placement(scans[0].get("scan_id"), ref_origin, ref_cell, ref_data.shape)]
+    alignments = [Alignment((0.0, 0.0), (0.0, 0.0), 1.0, np.inf, True)]
+    for scan in scans[1:]:
+        origin, cell = scan_geometry(scan)
+        (dy, dx), peak, peak_ratio = phase_correlation(reference, on_work_grid(scan["spectrogram_data"], cell))
+        shift_m = (dy * work_cell[0], dx * work_cell[1])
+        accepted = peak_ratio >= min_peak_ratio
+        if accepted:
+            origin = (ref_origin[0] + shift_m[0], ref_origin[1] + shift_m[1])
+        placements.append(Placement(scan.get("scan_id"), origin, cell, scan["spectrogram_data"].shape))
+        alignments.append(Alignment((dy, dx), shift_m, peak, peak_ratio, accepted))
+    return placements, alignments
+
+
+def place_scans(scans):
+    """Placements from each scan's own geometry, without alignment."""
+    return [Placement(scan.get("scan_id"), *scan_geometry(scan), scan["spectrogram_data"].shape) for scan in scans]
+
+
+def mosaic_grid(placements, cell_m=None, max_cells=None):
+    """(origin_m, cell_m, shape) of the grid covering all placements; cell size defaults to the finest input's.
+    With `max_cells`, cells are coarsened (keeping their aspect) until the grid holds at most that many."""
+    cell_m = cell_m or (min(p.cell_m[0] for p in placements), min(p.cell_m[1] for p in placements))
+    low = [min(p.origin_m[a] - p.cell_m[a] / 2 for p in placements) for a in range(2)]
+    high = [max(p.origin_m[a] + (p.shape[a] - 0.5) * p.cell_m[a] for p in placements) for a in range(2)]
+    shape = tuple(max(1, int(np.ceil((high[a] - low[a]) / cell_m[a]))) for a in range(2))
+    if max_cells and shape[0] * shape[1] > max_cells:
+        coarsen = np.sqrt(shape[0] * shape[1] / max_cells)
+        cell_m = (cell_m[0] * coarsen, cell_m[1] * coarsen)
+        shape = tuple(max(1, int(np.floor((high[a] - low[a]) / cell_m[a]))) for a in range(2))
+    origin = tuple(low[a] + cell_m[a] / 2 for a in range(2))
+    return origin, tuple(cell_m), shape
+
+
+def _axis_lookup(grid_origin, grid_cell, start, stop, placement, axis, feather):
+    """For output cells start..stop along one axis: source index pairs, fractions, in-scan mask and edge weights."""
+    pos = (grid_origin + np.arange(start, stop) * grid_cell - placement.origin_m[axis]) / placement.cell_m[axis]
+    n = placement.shape[axis]
+    inside = (pos >= -0.5) & (pos <= n - 0.5)
+    clipped = np.clip(pos, 0, n - 1)
+    lo = np.floor(clipped).astype(np.intp)
+    hi = np.minimum(lo + 1, n - 1)
+    edge_distance = np.minimum(pos + 0.5, n - 0.5 - pos) # Cells to the nearest scan edge
+    weight = np.clip(edge_distance / max(feather, 1e-9), 0, 1) if feather else inside.astype(np.float32)
+    return lo, hi, (clipped - lo).astype(np.float32), inside, weight.astype(np.float32)
+
+
+def write_mosaic(scans, placements, grid, out=None, tile=DEFAULT_TILE, feather=DEFAULT_FEATHER, fill=np.nan):
+    """Blends the scans into a float32 mosaic on `grid` (from mosaic_grid), tile by tile; cells no scan covers get `fill`.
+    `out` may be an np.lib.format.open_memmap of the grid's shape; only one output tile and the scan windows under it
+    are in memory at a time."""
+    grid_origin, grid_cell, shape = grid
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    for row0 in range(0, shape[0], tile[0]):
+        row1 = min(row0 + tile[0], shape[0])
+        for col0 in range(0, shape[1], tile[1]):
+            col1 = min(col0 + tile[1], shape[1])
+            total = np.zeros((row1 - row0, col1 - col0), dtype=np.float32)
+            weights = np.zeros_like(total)
+            for scan, placement in zip(scans, placements):
+                r0, r1, fr, r_in, r_w = _axis_lookup(grid_origin[0], grid_cell[0], row0, row1, placement, 0, feather)
+                c0, c1, fc, c_in, c_w = _axis_lookup(grid_origin[1], grid_cell[1], col0, col1, placement, 1, feather)
+                if not r_in.any() or not c_in.any():
+                    continue
+                # Read just the source window under this tile (a slice of a memory map stays on disk otherwise)
+                rs, re_ = int(r0[r_in].min()), int(r1[r_in].max()) + 1
+                cs, ce = int(c0[c_in].min()), int(c1[c_in].max()) + 1
+                window = np.asarray(scan["spectrogram_data"][rs:re_, cs:ce], dtype=np.float32)
+                values = _bilinear(window, (np.clip(r0 - rs, 0, re_ - rs - 1), np.clip(r1 - rs, 0, re_ - rs - 1), fr),
+                                   (np.clip(c0 - cs, 0, ce - cs - 1), np.clip(c1 - cs, 0, ce - cs - 1), fc))
+                weight = np.outer(r_w * r_in, c_w * c_in)
+                weight[~np.isfinite(values)] = 0
+                total += np.where(weight > 0, values, 0) * weight
+                weights += weight
+            covered = weights > 0
+            out[row0:row1, col0:col1] = np.where(covered, total / np.where(covered, weights, 1), fill)
+    return out
+
+
+def fuse_scans(scans, align=True, cell_m=None, out_path=None, tile=DEFAULT_TILE, feather=DEFAULT_FEATHER, fill=np.nan,
+               max_cells=None):
+    """Aligns (optionally) and mosaics `scans`; returns (mosaic, grid, placements, alignments or None).
+    `cell_m` and `max_cells` are passed to mosaic_grid.
+    With `out_path`, the mosaic is written to that .npy file as a memory map and returned as one."""
+    if len(scans) < 1:
+        raise ValueError("At least one scan is needed")
+    placements, alignments = align_scans(scans) if align and len(scans) > 1 else (place_scans(scans), None)
+    grid = mosaic_grid(placements, cell_m, max_cells)
+    out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=grid[2]) if out_path else None
+    mosaic = write_mosaic(scans, placements, grid, out, tile, feather, fill)
+    if out_path:
+        mosaic.flush()
+    return mosaic, grid, placements, alignments
+
+
+if __name__ == "__main__":
+    import time
+
+    from sonar_hub.synthesis import synthesize_spectrogram
+
+    # Two overlapping passes cut from one synthetic scene, the second offset and with its own noise
+    scene = synthesize_spectrogram("small_objects_sea", 3000, 4000, seed=11, dtype=np.float32)
+    rng = np.random.default_rng(0)
+    offset = (412, 1337)
+    first = scene[:2400, :2800]
+    second = scene[offset[0]:offset[0] + 2400, offset[1]:offset[1] + 2600] + rng.normal(0, 0.02, (2400, 2600)).astype(np.float32)
+    scans = [{"scan_id": "A", "spectrogram_data": first, "geometry": {"cell_m": (0.1, 0.1)}},
+             {"scan_id": "B", "spectrogram_data": second, "geometry": {"cell_m": (0.1, 0.1)}}]
+    start = time.perf_counter()
+    placements, alignments = align_scans(scans)
+    aligned = time.perf_counter()
+    grid = mosaic_grid(placements)
+    mosaic = write_mosaic(scans, placements, grid)
+    done = time.perf_counter()
+    print(f"True offset {offset} cells, estimated {tuple(round(v / 0.1, 1) for v in alignments[1].shift_m)} "
+          f"(peak {alignments[1].peak:.2f}, {alignments[1].peak_ratio:.0f}x noise)")
+    print(f"Alignment {aligned - start:.2f} s, mosaic {grid[2][0]}x{grid[2][1]} in {done - aligned:.2f} s")
+
+    # Too little overlap to correlate: the weak peak is rejected and the stored geometry kept
+    narrow = [dict(scans[0], spectrogram_data=scene[:400, :400]),
+              dict(scans[1], spectrogram_data=scene[:400, 300:700], geometry={"cell_m": (0.1, 0.1), "origin_m": (0.0, 30.0)})]
+    placements, alignments = align_scans(narrow)
+    assert not alignments[1].accepted and placements[1].origin_m == (0.0, 30.0), alignments[1]
+    print(f"25% overlap: peak {alignments[1].peak:.3f} ({alignments[1].peak_ratio:.0f}x noise) rejected, stored geometry kept")
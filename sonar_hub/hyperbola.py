@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Hyperbola (point reflector) detection for GPR radargrams.
+A buried pipe or cable seen from a moving antenna traces y(x) = sqrt(y0^2 + (s * (x - x0))^2) in (sample row, trace
+column) units, with the apex (y0, x0) above the object and the asymptote slope s set by the wave velocity
+(s = 2 * trace spacing / (velocity * sample interval), see velocity_scales). Detection is a Hough transform:
+1. Mean-trace removal (each row minus its mean over traces) drops flat layers, then strong cells are kept as edge points.
+2. Every edge point votes, for every candidate scale and arm offset at once, for the apex it would lie on
+   (one np.bincount per scale).
+3. Votes are normalised by how many curve cells could have voted, giving a 0..1 fit quality, and the best
+   non-overlapping apexes are kept.
+Long survey lines are split into overlapping column windows, processed in parallel on the shared process pool.
+
+Benchmark: python -m sonar_hub.hyperbola
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from sonar_hub.parallel import run_unordered
+
+DEFAULT_SCALES = (0.3, 0.4, 0.5, 0.65, 0.8, 1.0, 1.25, 1.6, 2.0) # Rows per column on the asymptotes
+DEFAULT_WINDOW_COLS = 2048
+MAX_EDGE_POINTS = 200_000 # Strongest points kept per window; bounds the vote arrays
+MAX_CANDIDATES = 20_000 # Apex candidates considered by non-maximum suppression per window
+
+HyperbolaFit = namedtuple("HyperbolaFit", "apex_row apex_col scale quality votes")
+HyperbolaFit.__doc__ = """A fitted hyperbola: apex cell, asymptote slope (rows per column), fit quality (fraction of the
+curve's cells that are edge points, 0..1) and the raw vote count."""
+
+
+def velocity_scales(velocities_m_per_ns, trace_spacing_m, sample_interval_ns):
+    """Hough scales for candidate GPR wave velocities (m/ns), given the trace spacing and two-way sample interval."""
+    return tuple(float(2 * trace_spacing_m / (v * sample_interval_ns)) for v in velocities_m_per_ns)
+
+
+def scale_to_velocity(scale, trace_spacing_m, sample_interval_ns):
+    """Inverse of velocity_scales for one scale: wave velocity in m/ns."""
+    return 2 * trace_spacing_m / (scale * sample_interval_ns)
+
+
+def default_half_width(width):
+    """Arm length (columns either side of the apex) considered by default: 1/8 of the line, 8 to 64 traces."""
+    return int(min(64, max(8, width // 8)))
+
+
+def edge_points(data, z=3.0, max_points=MAX_EDGE_POINTS):
+    """(rows, cols) of strong reflections: cells whose mean-trace-removed value exceeds the median by `z` robust sigmas.
+    Only the top cell of each vertical run is kept (the reflection's leading edge), so a trace crossing a thick
+    reflection still votes once per apex and fit quality stays a fraction of the curve."""
+    data = np.asarray(data, dtype=np.float32)
+    residual = data - data.mean(axis=1, keepdims=True) # Removes flat layers and the direct wave
+    median = float(np.median(residual))
+    sigma = 1.4826 * float(np.median(np.abs(residual - median))) or float(residual.std()) or 1.0
+    strength = residual - (median + z * sigma)
+    strong = strength > 0
+    strong[1:] &= ~strong[:-1]
+    rows, cols = np.nonzero(strong)
+    if len(rows) > max_points:
+        strongest = np.argpartition(strength[rows, cols], -max_points)[-max_points:]
+        rows, cols = rows[strongest], cols[strongest]
+    return rows, cols
+
+
+def hough_accumulator(rows, cols, shape, scales=DEFAULT_SCALES, half_width=None):
+    """(len(scales), H, W) apex vote counts for the edge points, each vote spread over +-1 row to absorb rounding."""
+    height, width = shape
+    half_width = half_width or default_half_width(width)
+    offsets = np.arange(-half_width, half_width + 1)
+    apex_cols = cols[:, None] - offsets[None, :] # A point at column x lies on the arm at offset x - x0
+    in_cols = (apex_cols >= 0) & (apex_cols < width)
+    rows_sq = rows.astype(np.float64)[:, None] ** 2
+    acc = np.zeros((len(scales), height, width), dtype=np.float32)
+    for k, scale in enumerate(scales): # A handful of scales; each is one vectorized vote over points x offsets
+        apex_sq = rows_sq - (scale * offsets[None, :]) ** 2
+        valid = in_cols & (apex_sq >= 0)
+        apex_rows = np.rint(np.sqrt(apex_sq[valid])).astype(np.intp)
+        votes = np.bincount(apex_rows * width + apex_cols[valid], minlength=height * width).reshape(height, width)
+        acc[k] = votes
+        acc[k, 1:] += votes[:-1]
+        acc[k, :-1] += votes[1:]
+    return acc
+
+
+def expected_votes(shape, scales=DEFAULT_SCALES, half_width=None):
+    """(len(scales), H, W) number of curve cells inside the image for each candidate apex (the vote count of a perfect fit)."""
+    height, width = shape
+    half_width = half_width or default_half_width(width)
+    apex_rows = np.arange(height, dtype=np.float64)[:, None]
+    apex_cols = np.arange(width)[None, :]
+    expected = np.empty((len(scales), height, width), dtype=np.float32)
+    for k, scale in enumerate(scales):
+        reach = np.minimum(half_width, np.floor(np.sqrt(np.maximum(height ** 2 - apex_rows ** 2, 0)) / scale)).astype(np.intp)
+        expected[k] = np.minimum(reach, width - 1 - apex_cols) + np.minimum(reach, apex_cols) + 1
+    return expected
+
+
+def _pick_apexes(quality, votes, best_scale, scales, min_quality, min_votes, separation, max_fits):
+    """Greedy non-maximum suppression over the best-scale quality map."""
+    candidates = np.flatnonzero((quality >= min_quality) & (votes >= min_votes))
+    if not candidates.size:
+        return []
+    if candidates.size > MAX_CANDIDATES:
+        candidates = candidates[np.argpartition(quality.ravel()[candidates], -MAX_CANDIDATES)[-MAX_CANDIDATES:]]
+    order = np.lexsort((-votes.ravel()[candidates], -quality.ravel()[candidates]))
+    rows, cols = np.unravel_index(candidates[order], quality.shape)
+    kept = []
+    for row, col in zip(rows, cols):
+        if any(abs(row - r) <= separation[0] and abs(col - c) <= separation[1] for r, c in kept):
+            continue
+        kept.append((row, col))
+        if max_fits and len(kept) >= max_fits:
+            break
+    return [HyperbolaFit(int(r), int(c), float(scales[best_scale[r, c]]), float(quality[r, c]), int(votes[r, c]))
+            for r, c in kept]
+
+
+def fit_hyperbolas(data, scales=DEFAULT_SCALES, half_width=None, z=3.0, min_quality=0.6, max_fits=10):
+    """Hough fit of hyperbolas in one radargram window; returns up to `max_fits` (None: all) HyperbolaFits, best first."""
+    data = np.asarray(data)
+    height, width = data.shape
+    half_width = half_width or default_half_width(width)
+    rows, cols = edge_points(data, z)
+    if not len(rows):
+        return []
+    acc = hough_accumulator(rows, cols, data.shape, scales, half_width)
+    expected = expected_votes(data.shape, scales, half_width)
+    quality = np.minimum(acc / np.maximum(expected, 1), 1.0)
+    quality[expected < half_width] = 0 # Too little of the curve inside the image to judge the fit
+    best_scale = quality.argmax(axis=0)
+    best_quality = np.take_along_axis(quality, best_scale[None], axis=0)[0]
+    best_votes = np.take_along_axis(acc, best_scale[None], axis=0)[0]
+    return _pick_apexes(best_quality, best_votes, best_scale, scales, min_quality, half_width,
+                        (max(2, half_width // 4), half_width), max_fits)
+
+
+def _window_fits(window, col_offset, core, **fit_kwargs):
+    """Fits in one column window, keeping apexes inside its core (the part not covered better by a neighbour)."""
+    fits = fit_hyperbolas(window, **fit_kwargs)
+    return [fit._replace(apex_col=fit.apex_col + col_offset) for fit in fits if core[0] <= fit.apex_col + col_offset < core[1]]
+
+
+def column_windows(width, window_cols, half_width):
+    """(start, end, core_start, core_end) column windows overlapping by 2 * half_width, so every apex's full arms fall
+    inside the window whose core holds it."""
+    if width <= window_cols:
+        return [(0, width, 0, width)]
+    step = window_cols - 2 * half_width
+    if step <= 0:
+        raise ValueError("window_cols must exceed twice the hyperbola half width")
+    windows = []
+    for start in range(0, width - 2 * half_width, step):
+        end = min(start + window_cols, width)
+        windows.append((start, end, 0 if start == 0 else start + half_width, width if end == width else end - half_width))
+        if end == width:
+            break
+    return windows
+
+
+def detect_hyperbolas(data, scales=DEFAULT_SCALES, half_width=None, z=3.0, min_quality=0.6, max_fits=None,
+                      window_cols=DEFAULT_WINDOW_COLS, parallel=True, executor=None):
+    """Hyperbola fits over a whole radargram (rows = samples, cols = traces), best first (up to `max_fits`, None: all).
+    Lines wider than `window_cols` are split into overlapping windows; with `parallel`, windows run on the shared
+    process pool (or `executor`)."""
+    data = np.asarray(data)
+    half_width = half_width or default_half_width(min(data.shape[1], window_cols))
+    fit_kwargs = {"scales": tuple(scales), "half_width": half_width, "z": z, "min_quality": min_quality, "max_fits": None}
+    windows = column_windows(data.shape[1], window_cols, half_width)
+    jobs = [dict(fit_kwargs, window=np.ascontiguousarray(data[:, start:end]), col_offset=start, core=(core_start, core_end))
+            for start, end, core_start, core_end in windows]
+    if len(jobs) > 1 and parallel:
+        fits = []
+        for _, window_fits, error in run_unordered(_window_fits, jobs, executor=executor):
+            if error is not None:
+                raise error
+            fits.extend(window_fits)
+    else:
+        fits = [fit for job in jobs for fit in _window_fits(**job)]
+    return sorted(fits, key=lambda fit: (-fit.quality, -fit.votes))[:max_fits]
+
+
+if __name__ == "__main__":
+    import time
+
+    from sonar_hub.parallel import default_workers
+    from sonar_hub.synthesis import synthesize_spectrogram
+
+    single = synthesize_spectrogram("utility_gpr", 180, 350, seed=1005)
+    start = time.perf_counter()
+    fits = detect_hyperbolas(single)
+    print(f"LAND002-sized scan 180x350: {(time.perf_counter() - start) * 1000:.1f} ms, {len(fits)} fit(s)")
+    for fit in fits:
+        print(f"  apex row {fit.apex_row}, col {fit.apex_col}, scale {fit.scale}, quality {fit.quality:.2f}")
+
+    # Long survey line: 40 utility segments side by side
+    line = np.hstack([synthesize_spectrogram("utility_gpr", 256, 512, seed=i, dtype=np.float32) for i in range(40)])
+    for parallel in (False, True):
+        start = time.perf_counter()
+        fits = detect_hyperbolas(line, half_width=32, parallel=parallel)
+        print(f"Survey line {line.shape[0]}x{line.shape[1]} ({'parallel, %d workers' % default_workers() if parallel else 'serial'}): "
+              f"{time.perf_counter() - start:.2f} s, {len(fits)} fit(s)")
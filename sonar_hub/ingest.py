@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked, bounded-memory CSV ingestion for uploaded sonar logs.
+The file is parsed in chunks (pyarrow's streaming CSV reader when installed, pandas' C engine otherwise); column types
+are fixed by the first chunk, per-column statistics are accumulated in one pass and only a small preview is kept, so
+memory use does not grow with the file size. pyarrow cannot read past a value that does not fit its inferred column type,
+so in "auto" mode the rest of the file is then re-read with pandas, which counts such values as invalid.
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError: # Optional: pandas' chunked reader is the fallback
+    pa = pa_csv = None
+
+DEFAULT_CHUNK_ROWS = 100_000
+ARROW_BLOCK_BYTES = 1 << 20 # pyarrow reads ahead a fixed number of blocks, so peak memory scales with this, not the file
+MAX_DISTINCT_TRACKED = 1000 # Text columns: exact distinct counts up to this many values
+
+# preview: first rows as a DataFrame; rows: total data rows; dtypes: {column: dtype name} from the first chunk;
+# stats: per-column statistics DataFrame; engine: "pyarrow", "pandas" or "pyarrow+pandas" (pyarrow handed over after a
+# misfit value); error: message if parsing stopped early
+CsvSummary = namedtuple("CsvSummary", "preview rows dtypes stats engine error")
+
+
+class ColumnStats:
+    """One-pass statistics of a column. Numeric columns merge per-chunk mean/M2 (Chan et al.), so no values are kept."""
+
+    def __init__(self, name, numeric):
+        self.name = name
+        self.numeric = numeric
+        self.count = 0 # Non-null values
+        self.nulls = 0
+        self.invalid = 0 # Values that did not parse as the column's first-chunk type
+        self.min = self.max = None
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._distinct = set()
+        self._distinct_overflow = False
+
+    def update(self, series):
+        if self.numeric:
+            values = pd.to_numeric(series, errors="coerce")
+            missing = values.isna()
+            self.invalid += int((missing & series.notna()).sum())
+            self.nulls += int(series.isna().sum())
+            values = values[~missing].to_numpy(dtype=np.float64)
+            if values.size == 0:
+                return
+            n, mean = values.size, float(values.mean())
+            m2 = float(((values - mean) ** 2).sum())
+            total = self.count + n
+            delta = mean - self.mean
+            self.mean += delta * n / total
+            self._m2 += m2 + delta * delta * self.count * n / total
+            self.count = total
+            lo, hi = float(values.min()), float(values.max())
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+        else:
+            present = series.dropna()
+            self.nulls += len(series) - len(present)
+            self.count += len(present)
+            if not self._distinct_overflow:
+                self._distinct.update(present.astype(str).unique())
+                if len(self._distinct) > MAX_DISTINCT_TRACKED:
+                    self._distinct_overflow = True
+                    self._distinct = set()
+
+    def as_row(self):
+        row = {"column": self.name, "type": "numeric" if self.numeric else "text", "count": self.count, "nulls": self.nulls}
+        if self.numeric:
+            row.update({"min": self.min, "max": self.max, "mean": self.mean if self.count else None,
+                        "std": math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else None, "invalid": self.invalid})
+        else:
+            row["distinct"] = f">{MAX_DISTINCT_TRACKED}" if self._distinct_overflow else str(len(self._distinct))
+        return row
+
+
+def _pyarrow_chunks(source, chunk_rows, columns=None):
+    reader = pa_csv.open_csv(source, read_options=pa_csv.ReadOptions(block_size=ARROW_BLOCK_BYTES),
+                             convert_options=pa_csv.ConvertOptions(include_columns=columns) if columns else None)
+    pending, pending_rows, first = [], 0, True
+    for batch in reader: # Column types are inferred from the first block and fixed for the rest
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if first or pending_rows >= chunk_rows: # The first block goes out alone so the preview is not delayed
+            yield pa.Table.from_batches(pending).to_pandas()
+            pending, pending_rows, first = [], 0, False
+    if pending_rows:
+        yield pa.Table.from_batches(pending).to_pandas()
+
+
+def _pandas_chunks(source, chunk_rows, columns=None, skip_rows=0):
+    # pandas re-infers types per chunk; ColumnStats keeps the first chunk's numeric/text split and counts misfits as invalid.
+    skiprows = (lambda line: 0 < line <= skip_rows) if skip_rows else None # Data rows after the header
+    yield from pd.read_csv(source, chunksize=chunk_rows, engine="c", low_memory=True, usecols=columns, skiprows=skiprows)
+
+
+def _pyarrow_then_pandas_chunks(source, chunk_rows, columns=None):
+    """(engine_name, chunk) from pyarrow until a value does not fit the column types it inferred from the first block;
+    the rows not yet yielded are then re-read with pandas."""
+    done = 0
+    try:
+        for chunk in _pyarrow_chunks(source, chunk_rows, columns):
+            done += len(chunk)
+            yield "pyarrow", chunk
+    except pa.ArrowInvalid as e_arrow:
+        print(f"CSV ingestion: pyarrow stopped after {done:,} rows ({e_arrow}); reading the rest with pandas")
+        if hasattr(source, "seek"):
+            source.seek(0)
+        for chunk in _pandas_chunks(source, chunk_rows, columns, skip_rows=done):
+            yield "pandas", chunk
+
+
+def iter_csv_chunks(source, chunk_rows=DEFAULT_CHUNK_ROWS, engine="auto", columns=None):
+    """Yields (engine_name, DataFrame chunk) for a path or binary file object; `columns` limits parsing to those columns.
+    In "auto" mode a value pyarrow cannot convert hands the rest of the file to pandas (file objects must be seekable)."""
+    if engine not in ("auto", "pyarrow", "pandas"):
+        raise ValueError(f"Unknown CSV engine: {engine}")
+    use_arrow = pa_csv is not None and engine in ("auto", "pyarrow")
+    if engine == "pyarrow" and pa_csv is None:
+        raise ImportError("The pyarrow CSV engine requires the 'pyarrow' package (pip install pyarrow).")
+    if use_arrow and engine == "auto":
+        yield from _pyarrow_then_pandas_chunks(source, chunk_rows, columns)
+        return
+    name = "pyarrow" if use_arrow else "pandas"
+    for chunk in (_pyarrow_chunks if use_arrow else _pandas_chunks)(source, chunk_rows, columns):
+        yield name, chunk
+
+
+def ingest_csv(source, chunk_rows=DEFAULT_CHUNK_ROWS, preview_rows=20, engine="auto", on_preview=None, on_progress=None):
+    """Parses a CSV in chunks and returns a CsvSummary.
+
+    `on_preview(preview_df)` is called as soon as the first chunk is parsed; `on_progress(rows, bytes_read)` after every
+    chunk (bytes_read is None when the source cannot tell). Values that do not fit the column type inferred from the first
+    chunk are counted as invalid (with engine="pyarrow" they stop ingestion); any other parse error after the first chunk stops ingestion and is reported in `error`
+    alongside the statistics so far.
+    """
+    preview, dtypes, stats, rows, engines, error = None, {}, {}, 0, [], None
+    try:
+        for engine_name, chunk in iter_csv_chunks(source, chunk_rows, engine):
+            if engine_name not in engines:
+                engines.append(engine_name)
+            if preview is None:
+                preview = chunk.head(preview_rows).copy()
+                dtypes = {str(col): str(dtype) for col, dtype in chunk.dtypes.items()}
+                stats = {col: ColumnStats(str(col), pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype))
+                         for col, dtype in chunk.dtypes.items()}
+                if on_preview is not None:
+                    on_preview(preview)
+            for col, col_stats in stats.items():
+                if col in chunk:
+                    col_stats.update(chunk[col])
+            rows += len(chunk)
+            if on_progress is not None:
+                on_progress(rows, source.tell() if hasattr(source, "tell") else None)
+    except Exception as e_parse:
+        if preview is None:
+            raise
+        error = f"Parsing stopped after {rows:,} rows: {e_parse}"
+        print(f"CSV ingestion: {error}")
+    if preview is None:
+        preview = pd.DataFrame()
+    stats_df = pd.DataFrame([s.as_row() for s in stats.values()])
+    return CsvSummary(preview, rows, dtypes, stats_df, "+".join(engines) or engine, error)
+
+
+if __name__ == "__main__":
+    import io
+
+    # A non-numeric value long after pyarrow has fixed the column types: counted as invalid, no rows lost
+    lines = [f"{i},{i % 2000 - 1000}" for i in range(300_000)]
+    lines[-3] = f"{300_000 - 3},abc"
+    data = ("t,hydro\n" + "\n".join(lines)).encode("utf-8")
+    for csv_engine in ("auto", "pandas"):
+        summary = ingest_csv(io.BytesIO(data), engine=csv_engine)
+        hydro = summary.stats.set_index("column").loc["hydro"]
+        assert summary.error is None and summary.rows == 300_000, summary.error
+        assert hydro["invalid"] == 1 and hydro["count"] == 299_999, hydro
+        print(f"{csv_engine}: {summary.rows:,} rows via {summary.engine}, {hydro['invalid']} invalid value")
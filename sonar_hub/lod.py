@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Level-of-detail pyramid for spectrogram / radargram rendering.
+Level 0 is the full-resolution array (not copied, memory maps welcome); each further level halves every axis that is
+still longer than `min_size`, keeping min, max and mean reductions. A renderer asks for a (window, pixel budget) pair
+and gets the finest level that fits, so the payload sent to the browser is bounded whatever the scan size.
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+REDUCTIONS = ("max", "mean", "min")
+_COMBINE = {"max": np.maximum, "min": np.minimum, "mean": np.add}
+
+# data: 2-D float32 array to draw; x/y: full-resolution bin centre of every column/row; level: pyramid level; factor: (rows, cols) per cell
+LodView = namedtuple("LodView", "data x y level factor")
+
+
+def _halve(block, reduction, halve_rows, halve_cols):
+    """Reduces 2x1, 1x2 or 2x2 cells of `block`; odd edges are padded by repeating the last row/column."""
+    block = np.asarray(block, dtype=np.float32)
+    combine = _COMBINE[reduction]
+    if halve_rows:
+        if block.shape[0] % 2:
+            block = np.concatenate([block, block[-1:]], axis=0)
+        block = combine(block[0::2], block[1::2])
+        if reduction == "mean":
+            block *= 0.5
+    if halve_cols:
+        if block.shape[1] % 2:
+            block = np.concatenate([block, block[:, -1:]], axis=1)
+        block = combine(block[:, 0::2], block[:, 1::2])
+        if reduction == "mean":
+            block *= 0.5
+    return block
+
+
+class LodPyramid:
+    """min/max/mean pyramid of a 2-D array, built once and queried per render."""
+
+    def __init__(self, data, min_size=64, chunk_rows=4096):
+        if np.ndim(data) != 2:
+            raise ValueError(f"LodPyramid expects a 2-D array, got shape {np.shape(data)}")
+        self.shape = tuple(data.shape)
+        self.levels = [{name: data for name in REDUCTIONS}]
+        self.factors = [(1, 1)]
+        chunk_rows += chunk_rows % 2 # Chunks must hold whole 2-row cells
+        while True:
+            prev = self.levels[-1]
+            h, w = prev["max"].shape
+            halve_rows, halve_cols = h > min_size, w > min_size
+            if not (halve_rows or halve_cols):
+                break
+            level = {}
+            for name in REDUCTIONS:
+                # Row chunks keep temporaries small when level 0 is a large memory map.
+                level[name] = np.concatenate([
+                    _halve(prev[name][r:r + chunk_rows], name, halve_rows, halve_cols)
+                    for r in range(0, h, chunk_rows)
+                ], axis=0)
+            fy, fx = self.factors[-1]
+            self.levels.append(level)
+            self.factors.append((fy * (2 if halve_rows else 1), fx * (2 if halve_cols else 1)))
+
+    @property
+    def nbytes(self):
+        """Memory held by the derived levels (level 0 belongs to the caller)."""
+        return sum(arr.nbytes for level in self.levels[1:] for arr in level.values())
+
+    def level_for(self, max_rows, max_cols, row_span=None, col_span=None):
+        """Finest level at which a window of `row_span` x `col_span` full-res bins fits in max_rows x max_cols cells."""
+        row_span = self.shape[0] if row_span is None else row_span
+        col_span = self.shape[1] if col_span is None else col_span
+        for k, (fy, fx) in enumerate(self.factors):
+            if math.ceil(row_span / fy) <= max_rows and math.ceil(col_span / fx) <= max_cols:
+                return k
+        return len(self.levels) - 1
+
+    def view(self, max_rows=450, max_cols=1000, rows=None, cols=None, reduction="max"):
+        """Returns a LodView of the window rows=(start, stop), cols=(start, stop) in full-res bins, within the cell budget."""
+        r0, r1 = rows if rows is not None else (0, self.shape[0])
+        c0, c1 = cols if cols is not None else (0, self.shape[1])
+        r0, r1 = max(0, int(r0)), min(self.shape[0], int(r1))
+        c0, c1 = max(0, int(c0)), min(self.shape[1], int(c1))
+        k = self.level_for(max_rows, max_cols, r1 - r0, c1 - c0)
+        fy, fx = self.factors[k]
+        i0, i1 = r0 // fy, math.ceil(r1 / fy)
+        j0, j1 = c0 // fx, math.ceil(c1 / fx)
+        data = np.asarray(self.levels[k][reduction][i0:i1, j0:j1], dtype=np.float32)
+        y = _bin_centres(i0, i1, fy, self.shape[0])
+        x = _bin_centres(j0, j1, fx, self.shape[1])
+        # A coarsest level that still exceeds the budget (tiny min_size vs budget) is strided as a last resort.
+        step_y, step_x = max(1, math.ceil(data.shape[0] / max_rows)), max(1, math.ceil(data.shape[1] / max_cols))
+        if step_y > 1 or step_x > 1:
+            data, y, x = data[::step_y, ::step_x], y[::step_y], x[::step_x]
+        return LodView(data, x, y, k, (fy, fx))
+
+
+def _bin_centres(start, stop, factor, full_length):
+    """Full-resolution centre of each level cell in [start, stop) (the last cell may be partial)."""
+    first = np.arange(start, stop) * factor
+    last = np.minimum(first + factor, full_length) - 1
+    return (first + last) / 2.0
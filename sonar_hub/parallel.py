@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Shared process pool for CPU-bound engines (simulation sweeps, detection, tiled processing).
+Workers are started with the "spawn" method: Streamlit serves sessions from threads, and forking a threaded process
+can deadlock. The pool is created on first use, reused across reruns and sessions, and replaced if a worker dies.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+MAX_DEFAULT_WORKERS = 8
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def default_workers():
+    return max(1, min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS))
+
+
+def get_executor(max_workers=None):
+    """Returns the process-wide ProcessPoolExecutor, (re)creating it if needed."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None or getattr(_EXECUTOR, "_broken", False):
+            _EXECUTOR = ProcessPoolExecutor(max_workers=max_workers or default_workers(),
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _EXECUTOR
+
+
+def shutdown_executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            _EXECUTOR = None
+
+
+atexit.register(shutdown_executor)
+
+
+def run_unordered(fn, kwargs_list, executor=None):
+    """Submits fn(**kwargs) for each kwargs dict and yields (index, result, error) in completion order.
+    A failing call yields its exception instead of stopping the others; `fn` must be importable by worker processes."""
+    executor = executor or get_executor()
+    futures = {executor.submit(fn, **kwargs): i for i, kwargs in enumerate(kwargs_list)}
+    try:
+        for future in as_completed(futures):
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                raise error
+            yield futures[future], (future.result() if error is None else None), error
+    finally:
+        for future in futures: # Consumer stopped early (e.g. the Streamlit script was rerun): drop queued work
+            future.cancel()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache for parsed uploads.
+Uploads are identified by a SHA-256 of their bytes (content_digest), so the same file is parsed once no matter how
+often a session reruns or how many sessions upload it. ParseCache is an LRUCache whose get_or_create is single-flight:
+concurrent requests for the same key wait for one parse instead of each running their own.
+"""
+
+import hashlib
+import threading
+
+import pandas as pd
+
+from sonar_hub.cache import LRUCache, nbytes_of
+
+DIGEST_BLOCK_BYTES = 1024 ** 2
+
+
+def content_digest(fileobj, block_size=DIGEST_BLOCK_BYTES):
+    """SHA-256 hex digest of a binary file object's whole content, read in blocks; the position is restored."""
+    position = fileobj.tell()
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(block_size), b""):
+        digest.update(block)
+    fileobj.seek(position)
+    return digest.hexdigest()
+
+
+def sizeof_parsed(value):
+    """Memory size of a parse result: DataFrames by their memory usage, otherwise as cache.nbytes_of (recursing into
+    tuples, lists and dicts so namedtuple summaries are sized by their frames)."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(sizeof_parsed(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof_parsed(v) for v in value)
+    return nbytes_of(value)
+
+
+class ParseCache(LRUCache):
+    """LRUCache sized by sizeof_parsed, with single-flight get_or_create."""
+
+    def __init__(self, max_entries=64, max_bytes=None):
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, sizeof=sizeof_parsed)
+        self._inflight = {} # key -> lock held while that key is being parsed
+        self._inflight_lock = threading.Lock()
+
+    def get_or_create(self, key, factory):
+        """Cached value for `key`; on a miss one caller runs `factory()` while concurrent callers for the same key wait."""
+        if key in self:
+            return super().get_or_create(key, factory)
+        with self._inflight_lock:
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                return super().get_or_create(key, factory) # A waiter finds the value its predecessor stored
+            finally:
+                with self._inflight_lock:
+                    if self._inflight.get(key) is key_lock:
+                        del self._inflight[key]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Fast raster previews of spectrograms.
+A 2-D array is scaled to 0..255, colormapped through a precomputed 256-entry lookup table built from the same Plotly
+color scale the interactive heatmap uses, and encoded as a PNG. Callers pass an already downsampled array (e.g. a
+LodPyramid view), so encoding cost and payload are bounded by the preview size, not the scan size.
+"""
+
+import functools
+import io
+import re
+
+import numpy as np
+from PIL import Image
+from plotly.colors import sample_colorscale
+
+DEFAULT_COLOR_SCALE = "Viridis"
+
+
+@functools.lru_cache(maxsize=64)
+def colormap_lut(color_scale=DEFAULT_COLOR_SCALE):
+    """(256, 3) uint8 RGB lookup table for a Plotly color scale name; unknown names fall back to Viridis."""
+    try:
+        colors = sample_colorscale(color_scale, 256)
+    except Exception:
+        colors = sample_colorscale(DEFAULT_COLOR_SCALE, 256)
+    lut = np.array([[float(c) for c in re.findall(r"[\d.]+", color)[:3]] for color in colors])
+    lut = np.clip(np.rint(lut), 0, 255).astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+
+def scale_to_uint8(data, vmin=None, vmax=None):
+    """Linearly maps `data` onto 0..255 (min/max of the finite values by default, as px.imshow does); NaNs become 0."""
+    data = np.asarray(data, dtype=np.float32)
+    finite = np.isfinite(data)
+    if vmin is None or vmax is None:
+        if not finite.any():
+            return np.zeros(data.shape, dtype=np.uint8)
+        vmin = float(data[finite].min()) if vmin is None else vmin
+        vmax = float(data[finite].max()) if vmax is None else vmax
+    span = (vmax - vmin) or 1.0
+    scaled = (data - vmin) * (255.0 / span)
+    np.clip(scaled, 0, 255, out=scaled)
+    scaled[~finite] = 0
+    return scaled.astype(np.uint8)
+
+
+def colorize(data, color_scale=DEFAULT_COLOR_SCALE, vmin=None, vmax=None):
+    """(H, W, 3) uint8 RGB image of a 2-D array."""
+    return colormap_lut(color_scale)[scale_to_uint8(data, vmin, vmax)]
+
+
+def encode_png(data, color_scale=DEFAULT_COLOR_SCALE, vmin=None, vmax=None, compress_level=6):
+    """PNG bytes of the colormapped array. The LUT is written as the PNG palette over 8-bit indices, which decodes to the
+    same RGB pixels as `colorize` at a third of the raw size and a fraction of the encode time."""
+    image = Image.fromarray(scale_to_uint8(data, vmin, vmax)).convert("P") # 2-D uint8 -> "L", then palette indices
+    image.putpalette(colormap_lut(color_scale).tobytes())
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=compress_level)
+    return buffer.getvalue()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy scan registry.
+Each entry keeps only its metadata plus a recipe (a zero-argument callable that builds the spectrogram).
+Arrays are built on first read and memoized in a bounded LRU cache, so listing scans never touches pixel data.
+With a ScanStore attached, added scans are persisted and every stored scan becomes an entry whose recipe memory-maps its .npy file.
+Listeners (add_listener) are told about every entry added, replaced or removed, so derived indexes can stay incremental.
+"""
+
+import functools
+import hashlib
+import itertools
+import threading
+
+from sonar_hub.cache import LRUCache
+
+SPECTROGRAM_KEY = "spectrogram_data"
+
+
+def recipe_version(recipe):
+    """Stable short version tag for a recipe, derived from its repr."""
+    return hashlib.sha1(repr(recipe).encode("utf-8")).hexdigest()[:12]
+
+
+class ScanRegistry:
+    """Dict-like scan catalog. `registry[scan_id]` returns a full scan dict; metadata accessors never build arrays."""
+
+    def __init__(self, max_cached_spectrograms=8, store=None):
+        self._entries = {} # scan_id -> {"meta": dict, "recipe": callable or None, "data": pinned array or None}
+        self._lock = threading.RLock()
+        self._spectrograms = LRUCache(max_entries=max_cached_spectrograms)
+        self._version_counter = itertools.count(1)
+        self._store = store
+        self._store_ids = set()
+        self._store_version = None
+        self._listeners = []
+
+    @property
+    def store(self):
+        return self._store
+
+    def sync(self):
+        """Picks up scans added or deleted in the store by other sessions or processes. Cheap when nothing changed."""
+        if self._store is None or self._store.version == self._store_version:
+            return
+        with self._lock:
+            self._store_version = self._store.version
+            current = {}
+            for meta in self._store.iter_metadata():
+                current[meta["scan_id"]] = meta
+            for scan_id in self._store_ids - set(current):
+                if self._entries.pop(scan_id, None) is not None:
+                    self._notify(scan_id, None)
+                self._spectrograms.discard_where(lambda key, sid=scan_id: key[0] == sid)
+            for scan_id, meta in current.items():
+                entry = self._entries.get(scan_id)
+                if entry is None or entry["meta"].get("data_version") != meta.get("data_version"):
+                    self.register(meta, functools.partial(self._store.load_spectrogram, scan_id))
+            self._store_ids = set(current)
+
+    # --- Change listeners ---
+
+    def add_listener(self, listener):
+        """Calls `listener(scan_id, metadata)` after every add or replace, and `listener(scan_id, None)` after a removal.
+        Listeners run under the registry lock, in the thread making the change; they should be quick and not call back in."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def _notify(self, scan_id, meta):
+        for listener in list(self._listeners):
+            try:
+                listener(scan_id, dict(meta) if meta is not None else None)
+            except Exception as e: # A broken listener must not break the catalog itself
+                print(f"Registry listener {listener!r} failed for {scan_id}: {e}")
+
+    # --- Registration ---
+
+    def register(self, metadata, recipe):
+        """Adds a scan described by `metadata` whose spectrogram is built by `recipe()` on first read."""
+        meta = {k: v for k, v in metadata.items() if k != SPECTROGRAM_KEY}
+        meta.setdefault("data_version", recipe_version(recipe))
+        with self._lock:
+            self._entries[meta["scan_id"]] = {"meta": meta, "recipe": recipe, "data": None}
+            self._notify(meta["scan_id"], meta)
+        self._spectrograms.discard_where(lambda key: key[0] == meta["scan_id"])
+
+    def add(self, scan, persist=True):
+        """Adds a fully materialized scan dict.
+
+        With a store attached (and persist=True) the scan is written to disk and read back through a memory map;
+        otherwise its array is pinned in memory, since there is no recipe to rebuild it from.
+        """
+        if persist and self._store is not None:
+            meta = self._store.put(scan)
+            with self._lock:
+                self._store_ids.add(meta["scan_id"])
+            self.register(meta, functools.partial(self._store.load_spectrogram, meta["scan_id"]))
+            return
+        meta = {k: v for k, v in scan.items() if k != SPECTROGRAM_KEY}
+        meta.setdefault("data_version", f"v{next(self._version_counter)}")
+        data = scan.get(SPECTROGRAM_KEY)
+        if hasattr(data, "shape") and hasattr(data, "dtype"): # As ScanStore.put records them, for size estimates from metadata alone
+            meta["spectrogram_shape"] = list(data.shape)
+            meta["spectrogram_dtype"] = data.dtype.str
+        with self._lock:
+            self._entries[meta["scan_id"]] = {"meta": meta, "recipe": None, "data": data}
+            self._notify(meta["scan_id"], meta)
+        self._spectrograms.discard_where(lambda key: key[0] == meta["scan_id"])
+
+    def remove(self, scan_id):
+        with self._lock:
+            entry = self._entries.pop(scan_id, None)
+            if scan_id in self._store_ids:
+                self._store_ids.discard(scan_id)
+                self._store.delete(scan_id)
+            if entry is not None:
+                self._notify(scan_id, None)
+        self._spectrograms.discard_where(lambda key: key[0] == scan_id)
+        return entry is not None
+
+    # --- Metadata-only access ---
+
+    def __contains__(self, scan_id):
+        return scan_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ids(self):
+        with self._lock:
+            return list(self._entries)
+
+    keys = ids
+
+    def metadata(self, scan_id):
+        """Returns the metadata dict for `scan_id` (no spectrogram), or None."""
+        entry = self._entries.get(scan_id)
+        return dict(entry["meta"]) if entry else None
+
+    def iter_metadata(self):
+        with self._lock:
+            metas = [entry["meta"] for entry in self._entries.values()]
+        for meta in metas:
+            yield dict(meta)
+
+    # --- Full scan access (builds the spectrogram when needed) ---
+
+    def spectrogram(self, scan_id):
+        entry = self._entries.get(scan_id)
+        if entry is None:
+            raise KeyError(scan_id)
+        if entry["recipe"] is None:
+            return entry["data"]
+        return self._spectrograms.get_or_create((scan_id, entry["meta"]["data_version"]), entry["recipe"])
+
+    def get(self, scan_id, default=None):
+        entry = self._entries.get(scan_id)
+        if entry is None:
+            return default
+        scan = dict(entry["meta"])
+        scan[SPECTROGRAM_KEY] = self.spectrogram(scan_id)
+        return scan
+
+    def __getitem__(self, scan_id):
+        scan = self.get(scan_id)
+        if scan is None:
+            raise KeyError(scan_id)
+        return scan
+
+    def __setitem__(self, scan_id, scan):
+        self.add(dict(scan, scan_id=scan_id))
+
+    def __delitem__(self, scan_id):
+        if not self.remove(scan_id):
+            raise KeyError(scan_id)
+
+    def cache_stats(self):
+        return self._spectrograms.stats()
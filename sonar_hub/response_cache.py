@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent response cache for the AI Assistant.
+Answers are stored in SQLite keyed by (normalized prompt, conversation context, model, temperature), with a TTL and an
+LRU cap on entries. One database file is shared by every session and server process; hit/miss counters live in it too.
+stats() returns an in-memory snapshot of them, refreshed whenever this process reads or writes the cache.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    model TEXT,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0);
+"""
+
+
+def normalize_prompt(text):
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a prompt."""
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip("?!. ")
+
+
+def make_cache_key(prompt, context_messages, model, temperature):
+    """Key for a request: normalized prompt plus the conversation context it is answered in, model and temperature."""
+    payload = {
+        "prompt": normalize_prompt(prompt),
+        "context": [[m["role"], m["content"]] for m in context_messages],
+        "model": model,
+        "temperature": round(float(temperature), 3),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed cache with TTL and LRU limits."""
+
+    def __init__(self, path, ttl_s=7 * 24 * 3600, max_entries=5000):
+        self.path = os.path.abspath(path)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            self._refresh_stats(conn)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection inside a transaction (committed on success) and always closes it."""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer across processes
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn, name):
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+
+    def _refresh_stats(self, conn):
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self._stats = {"entries": entries, "hits": counters.get("hits", 0), "misses": counters.get("misses", 0)}
+
+    def get(self, key):
+        """Returns the cached response for `key` or None (expired entries count as misses and are dropped)."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_s:
+                if row is not None:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._count(conn, "misses")
+                self._refresh_stats(conn)
+                return None
+            conn.execute("UPDATE responses SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._count(conn, "hits")
+            self._refresh_stats(conn)
+            return row[0]
+
+    def put(self, key, response, model=None):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, model, created_at, last_used_at, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (key, response, model, now, now))
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_s,))
+            excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0: # Evict least recently used
+                conn.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used_at ASC LIMIT ?)", (excess,))
+            self._refresh_stats(conn)
+
+    def stats(self):
+        """Entry count and hit/miss counters as of this process's last cache access (no database query)."""
+        return dict(self._stats)
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("UPDATE counters SET value = 0")
+            self._refresh_stats(conn)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Incrementally maintained catalog statistics for the dashboard.
+Counters (scans per sonar family and type, targets per type, scans per day) and a confidence histogram are updated
+when a scan is added or removed (follow(registry) subscribes to the registry's change listener). Each scan's
+contribution is remembered, so a removal or replacement subtracts exactly what was added. Reading the aggregates costs
+the same for six scans or a million; `version` changes with every update, so charts can be cached against it.
+"""
+
+import threading
+from collections import Counter
+
+import numpy as np
+
+from sonar_hub.timestamps import parse_timestamp
+
+SONAR_FAMILIES = (("Sea", "Sea"), ("Land (GPR)", "Land"), ("Air (Ultrasonic)", "Air")) # (label, substring of sonar_type)
+OTHER_FAMILY = "Other"
+CONFIDENCE_EDGES = np.linspace(0.0, 1.0, 11)
+
+
+def sonar_family(sonar_type):
+    """Dashboard family label for a sonar type (first SONAR_FAMILIES substring match, else OTHER_FAMILY)."""
+    for label, needle in SONAR_FAMILIES:
+        if needle in (sonar_type or ""):
+            return label
+    return OTHER_FAMILY
+
+
+def _contribution(meta):
+    """What one scan adds to the aggregates."""
+    targets = meta.get("detected_targets") or []
+    confidences = []
+    for target in targets:
+        try:
+            confidences.append(float(target.get("confidence")))
+        except (TypeError, ValueError):
+            pass
+    confidences = np.clip(np.asarray(confidences, dtype=np.float64), 0.0, 1.0)
+    timestamp = parse_timestamp(meta.get("timestamp"))
+    return {
+        "family": sonar_family(meta.get("sonar_type")),
+        "sonar_type": meta.get("sonar_type") or "Unknown",
+        "day": timestamp.date().isoformat() if timestamp else None,
+        "target_types": Counter(target.get("type") or "Unknown" for target in targets),
+        "confidence_counts": np.histogram(confidences[np.isfinite(confidences)], bins=CONFIDENCE_EDGES)[0],
+    }
+
+
+def _bump(counter, key, delta):
+    counter[key] += delta
+    if counter[key] <= 0: # Keys that fall to zero disappear, so charts never show empty categories
+        del counter[key]
+
+
+class ScanStats:
+    """Running aggregates over the scan catalog; read them with snapshot()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contributions = {} # scan_id -> _contribution(meta)
+        self._families = Counter()
+        self._sonar_types = Counter()
+        self._target_types = Counter()
+        self._days = Counter()
+        self._confidence_counts = np.zeros(len(CONFIDENCE_EDGES) - 1, dtype=np.int64)
+        self.version = 0
+
+    def follow(self, registry):
+        """Counts every scan already in `registry` and keeps the statistics in step with it through a registry listener."""
+        registry.add_listener(self.on_registry_change)
+        for meta in registry.iter_metadata():
+            self.add_scan(meta)
+
+    def on_registry_change(self, scan_id, meta):
+        if meta is None:
+            self.remove_scan(scan_id)
+        else:
+            self.add_scan(meta)
+
+    def _apply(self, contribution, sign):
+        _bump(self._families, contribution["family"], sign)
+        _bump(self._sonar_types, contribution["sonar_type"], sign)
+        if contribution["day"]:
+            _bump(self._days, contribution["day"], sign)
+        for target_type, count in contribution["target_types"].items():
+            _bump(self._target_types, target_type, sign * count)
+        self._confidence_counts += sign * contribution["confidence_counts"]
+        self.version += 1
+
+    def add_scan(self, meta):
+        contribution = _contribution(meta)
+        with self._lock:
+            previous = self._contributions.pop(meta["scan_id"], None)
+            if previous is not None:
+                self._apply(previous, -1)
+            self._contributions[meta["scan_id"]] = contribution
+            self._apply(contribution, 1)
+
+    def remove_scan(self, scan_id):
+        with self._lock:
+            previous = self._contributions.pop(scan_id, None)
+            if previous is not None:
+                self._apply(previous, -1)
+        return previous is not None
+
+    def snapshot(self):
+        """Copies of the aggregates: counts per family / sonar type / target type / day, and the confidence histogram."""
+        with self._lock:
+            return {
+                "version": self.version,
+                "scans": len(self._contributions),
+                "targets": sum(self._target_types.values()),
+                "scans_by_family": {label: self._families.get(label, 0) for label, _ in SONAR_FAMILIES + ((OTHER_FAMILY, None),)},
+                "scans_by_type": dict(self._sonar_types),
+                "targets_by_type": dict(self._target_types),
+                "scans_per_day": dict(sorted(self._days.items())),
+                "confidence_edges": CONFIDENCE_EDGES.copy(),
+                "confidence_counts": self._confidence_counts.copy(),
+            }
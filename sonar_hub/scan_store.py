@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk scan store shared by Streamlit sessions and worker processes.
+Layout: <root>/index.json holds every scan's metadata; <root>/<safe scan_id>-<hash>.npy holds its spectrogram (the hash
+keeps IDs that sanitize alike, such as "A B" and "A_B", apart).
+Arrays are opened with np.load(mmap_mode='r'), so readers share the OS page cache instead of each holding a copy.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl # POSIX advisory locks for cross-process index updates
+except ImportError: # pragma: no cover - Windows
+    fcntl = None
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def json_default(value):
+    """json.dumps fallback for NumPy scalars and arrays found in scan metadata."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ScanStore:
+    """Directory-backed scan store with a JSON metadata index and one memory-mapped .npy file per spectrogram."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._index_path = os.path.join(self.root, INDEX_NAME)
+        self._index = {}
+        self._index_stamp = None
+        self._index_lock = threading.Lock() # Streamlit sessions share one store from several threads
+
+    # --- Index handling ---
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _read_index(self, force=False):
+        """Returns the index, re-reading index.json only when another writer has replaced it (or when forced)."""
+        with self._index_lock:
+            stamp = self._stamp()
+            if force or stamp != self._index_stamp:
+                if stamp is None:
+                    self._index = {}
+                else:
+                    with open(self._index_path, "r", encoding="utf-8") as f:
+                        self._index = json.load(f)
+                self._index_stamp = stamp
+            return self._index
+
+    def _write_index(self, index):
+        self._atomic_write(self._index_path, lambda f: f.write(json.dumps(index, indent=1, default=json_default).encode("utf-8")))
+        with self._index_lock:
+            self._index = index
+            self._index_stamp = self._stamp()
+
+    def _atomic_write(self, path, writer):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                writer(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def array_path(self, scan_id):
+        return self._array_path(scan_id, self._read_index().get(scan_id) or {})
+
+    def _array_path(self, scan_id, meta):
+        """The .npy file named in the scan's metadata; entries written before hashed names use the bare sanitized ID."""
+        return os.path.join(self.root, meta.get("spectrogram_file") or _SAFE_ID.sub("_", scan_id) + ".npy")
+
+    def _new_array_path(self, scan_id):
+        digest = hashlib.sha1(scan_id.encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.root, f"{_SAFE_ID.sub('_', scan_id)}-{digest}.npy")
+
+    @property
+    def version(self):
+        """Changes whenever the index file changes (used to detect writes from other processes)."""
+        return self._stamp()
+
+    # --- Read side ---
+
+    def __contains__(self, scan_id):
+        return scan_id in self._read_index()
+
+    def __len__(self):
+        return len(self._read_index())
+
+    def ids(self):
+        return list(self._read_index())
+
+    def metadata(self, scan_id):
+        meta = self._read_index().get(scan_id)
+        return dict(meta) if meta is not None else None
+
+    def iter_metadata(self):
+        for meta in list(self._read_index().values()):
+            yield dict(meta)
+
+    def load_spectrogram(self, scan_id):
+        """Opens the scan's spectrogram as a read-only memory map (no copy into RAM); None if it was stored without one."""
+        meta = self._read_index().get(scan_id)
+        if meta is None:
+            raise KeyError(scan_id)
+        if not meta.get("spectrogram_shape"):
+            return None
+        return np.load(self._array_path(scan_id, meta), mmap_mode="r")
+
+    def get(self, scan_id, default=None):
+        meta = self.metadata(scan_id)
+        if meta is None:
+            return default
+        meta["spectrogram_data"] = self.load_spectrogram(scan_id)
+        return meta
+
+    # --- Write side ---
+
+    def put(self, scan):
+        """Persists a scan dict. The array is written first, so readers never see an index entry without its file."""
+        scan_id = scan["scan_id"]
+        meta = {k: v for k, v in scan.items() if k != "spectrogram_data"}
+        spectrogram = scan.get("spectrogram_data")
+        if spectrogram is not None:
+            array_path = self._new_array_path(scan_id)
+            self._atomic_write(array_path, lambda f: np.save(f, np.asarray(spectrogram), allow_pickle=False))
+            meta["spectrogram_shape"] = list(np.shape(spectrogram))
+            meta["spectrogram_dtype"] = np.asarray(spectrogram).dtype.str
+            meta["spectrogram_file"] = os.path.basename(array_path)
+        meta["data_version"] = f"npy-{time.time_ns():x}"
+        meta = json.loads(json.dumps(meta, default=json_default)) # Normalize NumPy scalars before they reach the index
+        with self._locked():
+            index = dict(self._read_index(force=True)) # Always re-read under the lock
+            previous = index.get(scan_id)
+            index[scan_id] = meta
+            self._write_index(index)
+        if previous is not None and previous.get("spectrogram_file") != meta.get("spectrogram_file"):
+            self._remove_array(scan_id, previous) # Pre-hash file name, or the scan no longer has a spectrogram
+        return meta
+
+    def delete(self, scan_id):
+        with self._locked():
+            index = dict(self._read_index(force=True))
+            meta = index.pop(scan_id, None)
+            if meta is None:
+                return False
+            self._write_index(index)
+        self._remove_array(scan_id, meta)
+        return True
+
+    def _remove_array(self, scan_id, meta):
+        if not meta.get("spectrogram_shape"):
+            return
+        try:
+            os.remove(self._array_path(scan_id, meta)) # Open memory maps keep working on POSIX until they are closed
+        except FileNotFoundError:
+            pass
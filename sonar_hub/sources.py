@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable scan sources behind get__scan_details.
+Fetches run as coroutines on one shared background event loop, so a Streamlit script thread only waits when
+the scan it needs is not already prefetched.
+
+Sources:
+- InMemoryScanSource: the process-wide ScanRegistry (pre-loaded scans + store-backed simulations).
+- LocalDirectoryScanSource: a ScanStore directory (index.json + .npy files), opened memory-mapped.
+- HttpScanSource: a remote scan API over a pooled httpx.AsyncClient.
+- ChainedScanSource: tries several sources in order.
+
+HTTP protocol (implemented by `serve_scan_store` below, which doubles as a local stand-in server):
+    GET /scans                     -> JSON list of scan IDs (or of metadata dicts with a "scan_id" key)
+    GET /scans/<id>                -> JSON metadata, 404 if unknown
+    GET /scans/<id>/spectrogram    -> .npy bytes, 404 if the scan has no spectrogram
+"""
+
+import abc
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import json
+import threading
+import time
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from sonar_hub.cache import LRUCache
+from sonar_hub.scan_store import ScanStore, json_default
+
+try:
+    import httpx
+except ImportError: # Only HttpScanSource needs it
+    httpx = None
+
+# What a failing or unreachable source raises from fetch()/list_ids(), for callers that report instead of crashing
+SOURCE_ERRORS = (concurrent.futures.TimeoutError, TimeoutError, OSError) + ((httpx.HTTPError,) if httpx is not None else ())
+
+
+# --- Shared background event loop ---
+
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+
+
+def background_loop():
+    """Returns the process-wide asyncio loop running in a daemon thread, starting it on first use."""
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="scan-source-loop", daemon=True).start()
+        return _LOOP
+
+
+def submit(coro):
+    """Schedules `coro` on the background loop and returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, background_loop())
+
+
+# --- Base interface ---
+
+class ScanSource(abc.ABC):
+    """Base scan source. Subclasses implement `list_ids` and `fetch_async`; fetched scans are kept in a small TTL/LRU cache."""
+
+    listing_error = None # Last error from refreshing the ID list in the background, None while healthy
+
+    def __init__(self, cache_size=16, cache_ttl_s=120.0):
+        self._ready = LRUCache(max_entries=cache_size) # scan_id -> (fetched_at, scan)
+        self._inflight = {} # scan_id -> concurrent.futures.Future
+        self._lock = threading.Lock()
+        self.cache_ttl_s = cache_ttl_s
+
+    @abc.abstractmethod
+    def list_ids(self):
+        """Returns the IDs of every scan this source can fetch."""
+
+    @abc.abstractmethod
+    async def fetch_async(self, scan_id):
+        """Returns the full scan dict (including "spectrogram_data") or None if unknown."""
+
+    def _cached(self, scan_id):
+        hit = self._ready.get(scan_id)
+        if hit is not None and time.monotonic() - hit[0] <= self.cache_ttl_s:
+            return hit[1]
+        return None
+
+    async def _fetch_and_store(self, scan_id):
+        try:
+            scan = await self.fetch_async(scan_id)
+            if scan is not None:
+                self._ready.put(scan_id, (time.monotonic(), scan))
+            return scan
+        finally:
+            with self._lock:
+                self._inflight.pop(scan_id, None)
+
+    def _submit(self, scan_id):
+        with self._lock:
+            future = self._inflight.get(scan_id)
+            if future is None or future.done():
+                future = submit(self._fetch_and_store(scan_id))
+                self._inflight[scan_id] = future
+        return future
+
+    def fetch(self, scan_id, timeout=30.0):
+        """Returns a scan, reusing a prefetched copy or an in-flight request when there is one."""
+        scan = self._cached(scan_id)
+        if scan is not None:
+            return scan
+        return self._submit(scan_id).result(timeout)
+
+    def prefetch(self, scan_ids):
+        """Starts background fetches for `scan_ids` without waiting for them."""
+        for scan_id in scan_ids:
+            if scan_id and self._cached(scan_id) is None:
+                self._submit(scan_id)
+
+    def invalidate(self, scan_id=None):
+        if scan_id is None:
+            self._ready.clear()
+        else:
+            self._ready.pop(scan_id)
+
+    def close(self):
+        pass
+
+
+# --- Implementations ---
+
+class InMemoryScanSource(ScanSource):
+    """Serves scans from a ScanRegistry. The registry memoizes spectrograms itself, so prefetch just warms it."""
+
+    def __init__(self, registry):
+        super().__init__(cache_size=1)
+        self.registry = registry
+
+    def list_ids(self):
+        return self.registry.ids()
+
+    async def fetch_async(self, scan_id):
+        return await asyncio.get_running_loop().run_in_executor(None, self.registry.get, scan_id)
+
+    def fetch(self, scan_id, timeout=30.0):
+        return self.registry.get(scan_id)
+
+    def prefetch(self, scan_ids):
+        for scan_id in scan_ids:
+            if scan_id in self.registry:
+                submit(self.fetch_async(scan_id))
+
+
+class LocalDirectoryScanSource(ScanSource):
+    """Serves scans from a ScanStore directory; spectrograms come back as read-only memory maps."""
+
+    def __init__(self, root, **kwargs):
+        super().__init__(**kwargs)
+        self.store = ScanStore(root)
+
+    def list_ids(self):
+        return self.store.ids()
+
+    async def fetch_async(self, scan_id):
+        return await asyncio.get_running_loop().run_in_executor(None, self.store.get, scan_id)
+
+
+class HttpScanSource(ScanSource):
+    """Serves scans from a remote API (see module docstring) through one pooled httpx.AsyncClient.
+
+    `list_ids` never waits on the network: it returns the last fetched ID list (empty until the first one arrives)
+    and refreshes it on the background loop once it is `ids_ttl_s` old. A failed refresh is retried after
+    `ids_retry_s`, doubling per consecutive failure up to `ids_retry_max_s`, and kept in `listing_error`.
+    `transport` is passed to httpx, e.g. httpx.MockTransport for offline use; pointing `base_url` at
+    `python -m sonar_hub.sources --serve DIR` gives a local stand-in server.
+    """
+
+    def __init__(self, base_url, api_key=None, timeout_s=30.0, max_connections=10, ids_ttl_s=30.0, list_timeout_s=5.0,
+                 ids_retry_s=15.0, ids_retry_max_s=300.0, transport=None, **kwargs):
+        if httpx is None:
+            raise ImportError("HttpScanSource requires the 'httpx' package (pip install httpx).")
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout_s = timeout_s
+        self.max_connections = max_connections
+        self.ids_ttl_s = ids_ttl_s
+        self.list_timeout_s = list_timeout_s
+        self.ids_retry_s = ids_retry_s
+        self.ids_retry_max_s = ids_retry_max_s
+        self._transport = transport
+        self._client = None
+        self._ids = (0.0, None)
+        self._ids_refresh = None # concurrent.futures.Future of the running refresh
+        self._ids_failures = 0
+        self._ids_retry_at = 0.0
+
+    def _get_client(self):
+        # Only called from coroutines, i.e. on the background loop the client is bound to.
+        if self._client is None:
+            headers = {"Accept": "application/json"}
+            if self.api_key:
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, headers=headers, timeout=self.timeout_s, transport=self._transport,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections))
+        return self._client
+
+    async def list_ids_async(self):
+        response = await self._get_client().get("/scans")
+        response.raise_for_status()
+        return [item["scan_id"] if isinstance(item, dict) else str(item) for item in response.json()]
+
+    async def _refresh_ids_async(self):
+        try:
+            ids = await asyncio.wait_for(self.list_ids_async(), self.list_timeout_s)
+        except Exception as e_list: # Anything from a bad response too; nobody waits on this future to see it
+            self._ids_failures += 1
+            self._ids_retry_at = time.monotonic() + min(self.ids_retry_max_s, self.ids_retry_s * 2 ** (self._ids_failures - 1))
+            self.listing_error = e_list if str(e_list) else TimeoutError(f"no scan list within {self.list_timeout_s:g} s")
+            print(f"Listing scans at {self.base_url} failed ({self._ids_failures}x): {self.listing_error!r}")
+            return None
+        self._ids = (time.monotonic(), ids)
+        self._ids_failures = 0
+        self.listing_error = None
+        return ids
+
+    def list_ids(self):
+        fetched_at, ids = self._ids
+        now = time.monotonic()
+        if (ids is None or now - fetched_at > self.ids_ttl_s) and now >= self._ids_retry_at:
+            with self._lock:
+                if self._ids_refresh is None or self._ids_refresh.done():
+                    self._ids_refresh = submit(self._refresh_ids_async())
+        return list(ids or [])
+
+    async def fetch_async(self, scan_id):
+        client = self._get_client()
+        path = f"/scans/{quote(scan_id, safe='')}"
+        meta_response, spectrogram_response = await asyncio.gather(client.get(path), client.get(path + "/spectrogram"))
+        if meta_response.status_code == 404:
+            return None
+        meta_response.raise_for_status()
+        scan = meta_response.json()
+        if spectrogram_response.status_code != 404:
+            spectrogram_response.raise_for_status()
+            scan["spectrogram_data"] = np.load(io.BytesIO(spectrogram_response.content), allow_pickle=False)
+        return scan
+
+    def close(self):
+        if self._client is not None:
+            submit(self._client.aclose()).result(self.timeout_s)
+            self._client = None
+
+
+class ChainedScanSource(ScanSource):
+    """Combines sources: IDs are their ordered union, and each scan comes from the first source that lists it.
+    The ID -> source mapping is cached; sources are asked again only about scans missing from it (or gone from their source)."""
+
+    def __init__(self, *sources):
+        super().__init__(cache_size=1)
+        self.sources = sources
+        self._owners = {} # scan_id -> first source listing it
+
+    def _refresh_owners(self):
+        owners = {}
+        for source in self.sources:
+            for scan_id in source.list_ids():
+                owners.setdefault(scan_id, source)
+        self._owners = owners
+        return owners
+
+    def _owner(self, scan_id, refresh=False):
+        if not refresh and scan_id in self._owners:
+            return self._owners[scan_id]
+        for source in self.sources: # In order, so later (remote) sources are only asked about scans earlier ones lack
+            if scan_id in source.list_ids():
+                self._owners[scan_id] = source
+                return source
+        self._owners.pop(scan_id, None)
+        return None
+
+    def list_ids(self):
+        return list(self._refresh_owners())
+
+    @property
+    def listing_error(self):
+        return next((source.listing_error for source in self.sources if source.listing_error is not None), None)
+
+    async def fetch_async(self, scan_id):
+        for source in self.sources:
+            scan = await source.fetch_async(scan_id)
+            if scan is not None:
+                return scan
+        return None
+
+    def fetch(self, scan_id, timeout=30.0):
+        cached = self._owners.get(scan_id)
+        source = self._owner(scan_id)
+        scan = source.fetch(scan_id, timeout) if source is not None else None
+        if scan is None and cached is not None: # Stale mapping: the scan moved or went away since the last refresh
+            source = self._owner(scan_id, refresh=True)
+            scan = source.fetch(scan_id, timeout) if source is not None else None
+        return scan
+
+    def prefetch(self, scan_ids):
+        for scan_id in scan_ids:
+            source = self._owner(scan_id)
+            if source is not None:
+                source.prefetch([scan_id])
+
+    def invalidate(self, scan_id=None):
+        for source in self.sources:
+            source.invalidate(scan_id)
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+
+# --- Local stand-in server for the HTTP protocol ---
+
+def serve_scan_store(root, host="127.0.0.1", port=8765, api_key=None):
+    """Serves a ScanStore directory over the HTTP protocol above (stdlib only). Blocks until interrupted."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    store = ScanStore(root)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body=b"", content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if api_key and self.headers.get("Authorization") != f"Bearer {api_key}":
+                return self._send(401, b'{"error": "unauthorized"}')
+            parts = [unquote(p) for p in self.path.split("?")[0].strip("/").split("/")]
+            if parts == ["scans"]:
+                return self._send(200, json.dumps(store.ids()).encode("utf-8"))
+            if len(parts) in (2, 3) and parts[0] == "scans" and parts[1] in store:
+                if len(parts) == 2:
+                    return self._send(200, json.dumps(store.metadata(parts[1]), default=json_default).encode("utf-8"))
+                if parts[2] == "spectrogram":
+                    try:
+                        with open(store.array_path(parts[1]), "rb") as f:
+                            return self._send(200, f.read(), "application/octet-stream")
+                    except FileNotFoundError:
+                        pass
+            return self._send(404, b'{"error": "not found"}')
+
+        def log_message(self, fmt, *args):
+            print(f"scan server: {fmt % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving scan store {store.root} on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a scan store directory over the Sonar Hub scan API.")
+    parser.add_argument("--serve", required=True, metavar="DIR", help="ScanStore directory to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--api-key", default=None)
+    args = parser.parse_args()
+    serve_scan_store(args.serve, args.host, args.port, args.api_key)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Spectrogram / radargram synthesis engine.
+All randomness comes from a single np.random.Generator, so (target_type, shape, seed) always gives the same array.
+Target shapes are drawn as batched array operations: no per-pixel or per-blob Python loops.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+TARGET_TYPES = ("clear", "object_strong", "object_faint", "layered_gpr", "utility_gpr", "small_objects_sea", "cluttered_air")
+
+
+def make_rng(seed=None):
+    """Returns a Generator for an int seed, SeedSequence, existing Generator or None (fresh entropy)."""
+    return np.random.default_rng(seed)
+
+
+def _rand(rng, shape, dtype):
+    return rng.random(shape, dtype=dtype)
+
+
+# --- Target painters (each adds its signature to `data` in place) ---
+
+def _paint_object_strong(data, rng):
+    """Large, clear object in the middle of the scan."""
+    height, width = data.shape
+    y_center, x_center = height // 2, width // 2
+    y_range, x_range = height // 7, width // 5
+    data[y_center - y_range : y_center + y_range, x_center - x_range : x_center + x_range] += _rand(rng, (2 * y_range, 2 * x_range), data.dtype) * 0.75
+
+
+def _paint_object_faint(data, rng):
+    """Smaller, less distinct object at a randomized position."""
+    height, width = data.shape
+    y_center, x_center = height // int(rng.choice([2, 3, 4])), width // int(rng.choice([2, 3, 4]))
+    y_range, x_range = height // int(rng.choice([10, 12, 15])), width // int(rng.choice([6, 8, 10]))
+    data[y_center - y_range : y_center + y_range, x_center - x_range : x_center + x_range] += _rand(rng, (2 * y_range, 2 * x_range), data.dtype) * 0.35
+
+
+def _paint_layered_gpr(data, rng):
+    """2 to 4 horizontal GPR layers; a row mask per layer is built with broadcasting."""
+    height, width = data.shape
+    num_layers = int(rng.integers(2, 5))
+    layer_idx = np.arange(num_layers)
+    layer_depth = (height * (0.2 + layer_idx * 0.2 + rng.uniform(-0.05, 0.05, num_layers))).astype(np.intp)
+    thickness = (height * (0.04 + rng.random(num_layers) * 0.06)).astype(np.intp)
+    valid = (layer_depth + thickness < height) & (layer_depth >= 0)
+    rows = np.arange(height)
+    in_layer = (rows >= layer_depth[valid, None]) & (rows < (layer_depth + thickness)[valid, None])
+    layer_count = in_layer.sum(axis=0)
+    hit_rows = np.flatnonzero(layer_count)
+    if hit_rows.size:
+        count = layer_count[hit_rows, None].astype(data.dtype)
+        data[hit_rows] += count * 0.25 + _rand(rng, (hit_rows.size, width), data.dtype) * (count * 0.2)
+
+
+def _paint_utility_gpr(data, rng):
+    """1 to 3 hyperbolic utility signatures, scatter-added in one pass."""
+    height, width = data.shape
+    num_utilities = int(rng.integers(1, 4))
+    center_x = rng.integers(width // 4, 3 * width // 4, num_utilities)
+    apex_y = rng.integers(height // 4, height // 2, num_utilities)
+    x_offset = np.arange(-width // 8, width // 8)
+    y_offset = (0.05 * x_offset.astype(np.float64) ** 2 / (width / 32)).astype(np.intp) # Exaggerate hyperbola for visibility
+    ys = apex_y[:, None] + y_offset[None, :]
+    xs = center_x[:, None] + x_offset[None, :]
+    on_grid = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    ys, xs = ys[on_grid], xs[on_grid]
+    np.add.at(data, (ys, xs), 0.6)
+    thick = ys + 1 < height # Thicken
+    np.add.at(data, (ys[thick] + 1, xs[thick]), 0.4)
+
+
+def _scatter_blobs(data, rng, y_center, x_center, y_radius, x_radius, amplitude):
+    """Adds rectangular noise blobs given as parallel arrays, using one scatter-add over all their pixels."""
+    height, width = data.shape
+    y_start, y_end = np.maximum(0, y_center - y_radius), np.minimum(height, y_center + y_radius)
+    x_start, x_end = np.maximum(0, x_center - x_radius), np.minimum(width, x_center + x_radius)
+    blob_h = np.clip(y_end - y_start, 0, None)
+    blob_w = np.clip(x_end - x_start, 0, None)
+    sizes = blob_h * blob_w
+    total = int(sizes.sum())
+    if total == 0:
+        return
+    blob = np.repeat(np.arange(sizes.size), sizes)
+    local = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    blob_w_px = blob_w[blob]
+    flat_idx = (y_start[blob] + local // blob_w_px) * width + x_start[blob] + local % blob_w_px
+    values = _rand(rng, total, data.dtype)
+    values *= amplitude.astype(data.dtype)[blob]
+    np.add.at(data.reshape(-1), flat_idx, values)
+
+
+def _paint_small_objects_sea(data, rng):
+    """3 to 6 small, faint objects anywhere in the scan."""
+    height, width = data.shape
+    num_objects = int(rng.integers(3, 7))
+    _scatter_blobs(data, rng,
+                   rng.integers(0, height, num_objects), rng.integers(0, width, num_objects),
+                   height // rng.integers(18, 30, num_objects), width // rng.integers(12, 20, num_objects),
+                   rng.uniform(0.25, 0.45, num_objects))
+
+
+def _paint_cluttered_air(data, rng):
+    """5 to 14 faint reflections, kept away from the top/left edge."""
+    height, width = data.shape
+    num_echoes = int(rng.integers(5, 15))
+    _scatter_blobs(data, rng,
+                   rng.integers(height // 4, height, num_echoes), rng.integers(width // 4, width, num_echoes),
+                   height // rng.integers(15, 25, num_echoes), width // rng.integers(10, 18, num_echoes),
+                   rng.uniform(0.2, 0.4, num_echoes))
+
+
+def _paint_seabed(data, rng):
+    """Seabed reflection band near the bottom of a sea scan."""
+    height, width = data.shape
+    row_start, row_end = int(height * 0.8), int(height * 0.95)
+    data[row_start:row_end, :] += 0.25 + _rand(rng, (row_end - row_start, width), data.dtype) * 0.1
+
+
+_PAINTERS = {
+    "object_strong": _paint_object_strong,
+    "object_faint": _paint_object_faint,
+    "layered_gpr": _paint_layered_gpr,
+    "utility_gpr": _paint_utility_gpr,
+    "small_objects_sea": _paint_small_objects_sea,
+    "cluttered_air": _paint_cluttered_air,
+}
+
+
+# --- Public API ---
+
+def synthesize_spectrogram(target_type="clear", height=128, width=256, seed=None, seabed_reflection=False, dtype=np.float64):
+    """Generates a noisy spectrogram in [0, 1] with the requested target signature.
+
+    `seed` may be an int, SeedSequence or Generator. `seabed_reflection` adds the sea-floor band to "object_strong" scans.
+    Use dtype=np.float32 for large batch jobs to halve memory.
+    """
+    rng = make_rng(seed)
+    data = _rand(rng, (height, width), dtype)
+    data *= 0.3 # Background noise
+    painter = _PAINTERS.get(target_type)
+    if painter is not None:
+        painter(data, rng)
+    if seabed_reflection and target_type == "object_strong" and height > 50:
+        _paint_seabed(data, rng)
+    np.clip(data, 0, 1, out=data)
+    return data
+
+
+def synthesize_batch(specs, seed=None, dtype=np.float32):
+    """Yields one spectrogram per (target_type, height, width) spec, each from an independent child stream of `seed`."""
+    specs = list(specs)
+    for (target_type, height, width), child in zip(specs, np.random.SeedSequence(seed).spawn(len(specs))):
+        yield synthesize_spectrogram(target_type, height, width, seed=child, dtype=dtype)
+
+
+class SpectrogramRecipe(namedtuple("SpectrogramRecipe", "target_type height width seed seabed_reflection")):
+    """Hashable, picklable description of a synthetic spectrogram; calling it builds the array."""
+    __slots__ = ()
+
+    def __new__(cls, target_type="clear", height=128, width=256, seed=None, seabed_reflection=False):
+        return super().__new__(cls, target_type, height, width, seed, seabed_reflection)
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def __call__(self):
+        return synthesize_spectrogram(self.target_type, self.height, self.width, seed=self.seed, seabed_reflection=self.seabed_reflection)
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Global, columnar catalog of detected targets across all scans.
+Every target is one row of parallel numpy columns: scan, target type, confidence, range (range_m / depth_m_approx /
+distance_m, whichever the target has) and the scan's timestamp. Confidence and range have sorted indexes (sorted keys
+plus the row order), so a bounded query starts from a binary-searched slice of the most selective index and only
+checks the remaining filters on that slice.
+Updates are incremental: follow(registry) subscribes to the scan registry, added scans are buffered and merged into
+the columns and indexes on the next query (O(rows) merge, no re-sort), and removed scans are masked out; the columns
+are compacted once a quarter of the rows are dead.
+
+Benchmark: python -m sonar_hub.target_catalog
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from sonar_hub.timestamps import parse_timestamp
+
+RANGE_KEYS = ("range_m", "depth_m_approx", "distance_m") # Along-beam distance, by sonar family
+INDEXED_COLUMNS = ("confidence", "range_m")
+ORDER_COLUMNS = ("confidence", "range_m", "time")
+COMPACT_FRACTION = 0.25 # Dead-row share that triggers a compaction
+
+_DTYPES = {"scan": np.int32, "target": np.int32, "type": np.int32, "confidence": np.float32, "range_m": np.float32,
+           "time": np.float64}
+
+
+def target_range(target):
+    """The target's distance along the beam in metres (first of RANGE_KEYS present), or NaN."""
+    for key in RANGE_KEYS:
+        value = target.get(key)
+        if value is not None:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return np.nan
+    return np.nan
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _epoch(value):
+    """datetime, timestamp string or epoch seconds -> epoch seconds (NaN if missing)."""
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = parse_timestamp(value)
+        return value.timestamp() if value else np.nan
+    return value.timestamp()
+
+
+def _empty_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in _DTYPES.items()}
+
+
+class TargetCatalog:
+    """Columnar target table with sorted confidence/range indexes; see select() and query()."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._columns = _empty_columns()
+        self._live = np.empty(0, dtype=bool)
+        self._dead = 0
+        self._indexes = {name: (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.intp)) for name in INDEXED_COLUMNS}
+        self._pending = [] # Column dicts of added scans, merged on the next read
+        # Scan codes only grow (a replaced scan gets a new one), so rows stay sorted by scan code
+        self._scan_codes = {} # scan_id -> current code
+        self._scan_ids = [] # code -> scan_id
+        self._scan_sonar = [] # code -> sonar type code
+        self._scan_targets = [] # code -> list of target dicts (for target ids)
+        self._type_names, self._type_codes = [], {}
+        self._sonar_names, self._sonar_codes = [], {}
+
+    # --- Updates ---
+
+    def follow(self, registry):
+        """Loads every scan already in `registry` and keeps the catalog in step with it through a registry listener."""
+        registry.add_listener(self.on_registry_change)
+        for meta in registry.iter_metadata():
+            self.add_scan(meta)
+
+    def on_registry_change(self, scan_id, meta):
+        if meta is None:
+            self.remove_scan(scan_id)
+        else:
+            self.add_scan(meta)
+
+    def _code(self, names, codes, name):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def add_scan(self, meta):
+        """Adds (or replaces) the targets of one scan, given its metadata dict."""
+        targets = list(meta.get("detected_targets") or [])
+        with self._lock:
+            self.remove_scan(meta["scan_id"])
+            code = len(self._scan_ids)
+            self._scan_codes[meta["scan_id"]] = code
+            self._scan_ids.append(meta["scan_id"])
+            self._scan_sonar.append(self._code(self._sonar_names, self._sonar_codes, meta.get("sonar_type") or "Unknown"))
+            self._scan_targets.append(targets)
+            if targets:
+                self._pending.append({
+                    "scan": np.full(len(targets), code, dtype=np.int32),
+                    "target": np.arange(len(targets), dtype=np.int32),
+                    "type": np.array([self._code(self._type_names, self._type_codes, t.get("type") or "Unknown") for t in targets], dtype=np.int32),
+                    "confidence": np.array([_as_float(t.get("confidence")) for t in targets], dtype=np.float32),
+                    "range_m": np.array([target_range(t) for t in targets], dtype=np.float32),
+                    "time": np.full(len(targets), _epoch(meta.get("timestamp")), dtype=np.float64),
+                })
+
+    def remove_scan(self, scan_id):
+        """Drops a scan's targets; returns False if the scan was not in the catalog."""
+        with self._lock:
+            code = self._scan_codes.pop(scan_id, None)
+            if code is None:
+                return False
+            self._scan_targets[code] = None
+            self._pending = [chunk for chunk in self._pending if chunk["scan"][0] != code]
+            scans = self._columns["scan"]
+            start, stop = np.searchsorted(scans, code, "left"), np.searchsorted(scans, code, "right")
+            if stop > start:
+                self._live[start:stop] = False
+                self._dead += int(stop - start)
+                if self._dead > COMPACT_FRACTION * len(self._live):
+                    self._compact()
+            return True
+
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        added = {name: np.concatenate([chunk[name] for chunk in self._pending]) for name in _DTYPES}
+        self._pending = []
+        first_row = len(self._live)
+        for name in INDEXED_COLUMNS:
+            keys, rows = self._indexes[name]
+            order = np.argsort(added[name], kind="stable")
+            new_keys = added[name][order]
+            positions = np.searchsorted(keys, new_keys, "right") # NaN keys sort last, as in np.sort
+            self._indexes[name] = (np.insert(keys, positions, new_keys), np.insert(rows, positions, order + first_row))
+        self._columns = {name: np.concatenate((self._columns[name], added[name])) for name in _DTYPES}
+        self._live = np.concatenate((self._live, np.ones(len(added["scan"]), dtype=bool)))
+
+    def _compact(self):
+        keep = self._live
+        self._columns = {name: column[keep] for name, column in self._columns.items()}
+        self._live = np.ones(len(self._columns["scan"]), dtype=bool)
+        self._dead = 0
+        for name in INDEXED_COLUMNS:
+            order = np.argsort(self._columns[name], kind="stable")
+            self._indexes[name] = (self._columns[name][order], order)
+
+    # --- Queries ---
+
+    def __len__(self):
+        with self._lock:
+            return len(self._live) - self._dead + sum(len(chunk["scan"]) for chunk in self._pending)
+
+    def target_types(self):
+        """Target types with at least one live target, sorted."""
+        with self._lock:
+            self._merge_pending()
+            codes = np.unique(self._columns["type"][self._live])
+            return sorted(self._type_names[code] for code in codes)
+
+    def sonar_types(self):
+        with self._lock:
+            return sorted(self._sonar_names)
+
+    def _index_slice(self, name, low, high):
+        keys, rows = self._indexes[name]
+        start = np.searchsorted(keys, low, "left") if low is not None else 0
+        stop = np.searchsorted(keys, high, "right") if high is not None else np.searchsorted(keys, np.inf, "right")
+        return rows[start:stop]
+
+    def select(self, types=None, min_confidence=None, max_confidence=None, min_range=None, max_range=None, since=None,
+               until=None, sonar_types=None, scan_ids=None, order_by="confidence", descending=True):
+        """Row numbers of the matching targets, ordered by `order_by` (one of ORDER_COLUMNS, or None for catalog order).
+        Bounds are inclusive; since/until take datetimes, timestamp strings or epoch seconds. Targets without a
+        range only match queries that do not bound the range."""
+        with self._lock:
+            self._merge_pending()
+            columns = self._columns
+            # Bounds compared in the columns' float32, so 0.8 matches a stored 0.8 on every path
+            bounds = {name: tuple(None if v is None else np.float32(v) for v in pair) for name, pair in
+                      (("confidence", (min_confidence, max_confidence)), ("range_m", (min_range, max_range)))}
+            # Start from the narrowest index slice; it is already sorted by its key
+            slices = {name: self._index_slice(name, *bounds[name]) for name in INDEXED_COLUMNS if bounds[name] != (None, None)}
+            start_from = min(slices, key=lambda name: len(slices[name])) if slices else None
+            rows = slices[start_from] if start_from else np.flatnonzero(self._live)
+            mask = self._live[rows]
+            for name, (low, high) in bounds.items():
+                if name != start_from and (low is not None or high is not None):
+                    values = columns[name][rows]
+                    if low is not None:
+                        mask &= values >= low
+                    if high is not None:
+                        mask &= values <= high
+            if types is not None:
+                codes = [self._type_codes[t] for t in types if t in self._type_codes]
+                mask &= np.isin(columns["type"][rows], codes)
+            if since is not None:
+                mask &= columns["time"][rows] >= _epoch(since)
+            if until is not None:
+                mask &= columns["time"][rows] <= _epoch(until)
+            if sonar_types is not None:
+                wanted = np.isin(np.asarray(self._scan_sonar, dtype=np.int32),
+                                 [self._sonar_codes[t] for t in sonar_types if t in self._sonar_codes])
+                mask &= wanted[columns["scan"][rows]]
+            if scan_ids is not None:
+                mask &= np.isin(columns["scan"][rows], [self._scan_codes[s] for s in scan_ids if s in self._scan_codes])
+            rows = rows[mask]
+            if order_by is None:
+                return np.sort(rows) if start_from else rows
+            if order_by != start_from:
+                rows = rows[np.argsort(columns[order_by][rows], kind="stable")]
+            if descending: # Missing values (NaN) stay last either way
+                finite = np.isfinite(columns[order_by][rows])
+                rows = np.concatenate((rows[finite][::-1], rows[~finite]))
+            return rows
+
+    def frame(self, rows):
+        """DataFrame of the given rows (from select): scan_id, sonar_type, timestamp, target_id, type, confidence, range_m."""
+        with self._lock:
+            columns = {name: column[rows] for name, column in self._columns.items()}
+            scan_ids = np.asarray(self._scan_ids, dtype=object)
+            sonar_names = np.asarray(self._sonar_names, dtype=object)
+            targets = self._scan_targets
+            return pd.DataFrame({
+                "scan_id": scan_ids[columns["scan"]],
+                "sonar_type": sonar_names[np.asarray(self._scan_sonar, dtype=np.int32)[columns["scan"]]],
+                "timestamp": pd.to_datetime(columns["time"], unit="s", utc=True),
+                "target_id": [targets[s][t].get("id") for s, t in zip(columns["scan"], columns["target"])],
+                "type": np.asarray(self._type_names, dtype=object)[columns["type"]],
+                "confidence": columns["confidence"],
+                "range_m": columns["range_m"],
+            })
+
+    def query(self, limit=None, **filters):
+        """select() followed by frame() on the first `limit` rows."""
+        return self.frame(self.select(**filters)[:limit])
+
+
+if __name__ == "__main__":
+    import time
+    from datetime import datetime, timedelta, timezone
+
+    rng = np.random.default_rng(0)
+    type_names = ["Submerged Object", "Seabed Feature", "Unknown Anomaly", "Buried Utility Line", "Generic Anomaly"]
+    now = datetime.now(timezone.utc)
+    catalog = TargetCatalog()
+    start = time.perf_counter()
+    for i in range(20_000): # 20k scans x 15 targets = 300k rows
+        catalog.add_scan({
+            "scan_id": f"SCAN{i:05d}", "sonar_type": ["Sea", "Land", "Air"][i % 3],
+            "timestamp": (now - timedelta(hours=int(rng.integers(0, 24 * 60)))).strftime("%Y-%m-%d %H:%M UTC"),
+            "detected_targets": [{"id": f"T{j}", "type": type_names[int(rng.integers(0, 5))],
+                                  "confidence": round(float(rng.random()), 2), "range_m": float(rng.random() * 200)}
+                                 for j in range(15)],
+        })
+    catalog.select(min_confidence=0.0) # First read merges the pending scans
+    print(f"Loaded {len(catalog):,} targets in {time.perf_counter() - start:.2f} s")
+    start = time.perf_counter()
+    for _ in range(100):
+        rows = catalog.select(types=["Submerged Object"], min_confidence=0.8, since=now - timedelta(days=7))
+    print(f"Submerged Object, confidence >= 0.8, last 7 days: {len(rows):,} targets in "
+          f"{(time.perf_counter() - start) * 10:.2f} ms per query")
+    start = time.perf_counter()
+    for _ in range(100):
+        rows = catalog.select(min_range=50, max_range=51, order_by="range_m", descending=False)
+    print(f"Range 50-51 m: {len(rows):,} targets in {(time.perf_counter() - start) * 10:.2f} ms per query")
+    start = time.perf_counter()
+    for i in range(100):
+        catalog.remove_scan(f"SCAN{i:05d}")
+        catalog.add_scan({"scan_id": f"NEW{i:05d}", "sonar_type": "Sea", "timestamp": now.strftime("%Y-%m-%d %H:%M UTC"),
+                          "detected_targets": [{"type": "Submerged Object", "confidence": 0.9, "range_m": 10.0}]})
+        catalog.select(min_confidence=0.85)
+    print(f"Remove + add + query: {(time.perf_counter() - start) * 10:.2f} ms per update")
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Scan timestamp format shared by the catalog modules ("2026-01-31 14:05 UTC"), kept free of heavier dependencies.
+"""
+
+from datetime import datetime, timezone
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M UTC"
+
+
+def parse_timestamp(value):
+    """Scan timestamp string -> aware datetime, or None if it does not parse."""
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
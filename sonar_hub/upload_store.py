@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-bounded store for uploaded images and raw binary files.
+An image upload is decoded once: a downscaled thumbnail (PNG bytes) is returned for the session to keep and display, and
+the full-resolution pixels are spilled to a .npy file that load() memory-maps on demand. The store itself holds no
+pixels. Binary uploads (put_file) are copied as they are, keeping their extension, for readers that memory-map files.
+Uploads are keyed by content (e.g. a hash of the file), so sessions uploading the same file share one spilled copy:
+attach() adds a session's reference without decoding anything. Spilled bytes are bounded per session (counting every
+file it references) and globally (counting each file once); the least recently used references are dropped when a quota
+would be exceeded, and a file is deleted with its last reference. Uploads larger than the quotas are not spilled at all.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from PIL import Image
+
+THUMBNAIL_SIZE = (800, 800) # Bounding box of the in-session preview
+DEFAULT_SESSION_QUOTA = 256 * 1024 ** 2
+DEFAULT_GLOBAL_QUOTA = 2 * 1024 ** 3
+
+UploadEntry = namedtuple("UploadEntry", "name path nbytes shape mode")
+UploadEntry.__doc__ = """A spilled upload: file name, path, size in bytes, full-resolution (height, width[, bands])
+shape and PIL mode (both None for raw files)."""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError: # e.g. PermissionError: the process exists but belongs to someone else
+        pass
+    return True
+
+
+def remove_stale_spill_dirs(parent, min_age_s=60.0):
+    """Deletes `uploads_*` directories under `parent` left by stores whose process exited without close() (a crash or
+    kill). A directory is stale when the process in its owner.pid is gone, or when it has no owner.pid and is older
+    than `min_age_s` (so a store being created right now is left alone); min_age_s=None keeps directories without
+    owner.pid, for parents shared with other programs. Returns the number removed."""
+    removed = 0
+    for entry in os.scandir(parent) if os.path.isdir(parent) else ():
+        if not (entry.name.startswith("uploads_") and entry.is_dir(follow_symlinks=False)):
+            continue
+        try:
+            with open(os.path.join(entry.path, "owner.pid")) as f:
+                stale = not _pid_alive(int(f.read().strip()))
+        except (OSError, ValueError):
+            if min_age_s is None:
+                continue
+            try:
+                stale = time.time() - entry.stat(follow_symlinks=False).st_mtime > min_age_s
+            except FileNotFoundError:
+                continue
+        if stale:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    """PNG bytes of `image` scaled down to fit `size` (never scaled up)."""
+    thumbnail = image.copy()
+    thumbnail.thumbnail(size)
+    if thumbnail.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"): # e.g. 16-bit or CMYK scans
+        thumbnail = thumbnail.convert("RGB")
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def decode_image(fileobj, thumbnail_size=THUMBNAIL_SIZE):
+    """Decodes an image file once; returns (thumbnail PNG bytes, full-resolution pixel array, PIL mode)."""
+    with Image.open(fileobj) as image:
+        image.load()
+        return make_thumbnail(image, thumbnail_size), np.asarray(image), image.mode
+
+
+class UploadStore:
+    """Content-keyed spilled uploads referenced by sessions, under LRU session and global byte quotas."""
+
+    def __init__(self, spill_dir=None, session_quota=DEFAULT_SESSION_QUOTA, global_quota=DEFAULT_GLOBAL_QUOTA,
+                 thumbnail_size=THUMBNAIL_SIZE):
+        parent = spill_dir or tempfile.gettempdir()
+        os.makedirs(parent, exist_ok=True)
+        removed = remove_stale_spill_dirs(parent, min_age_s=60.0 if spill_dir else None) # The bare temp dir is shared
+        if removed:
+            print(f"Removed {removed} upload spill director{'y' if removed == 1 else 'ies'} left by exited processes in {parent}")
+        self._dir = tempfile.mkdtemp(prefix="uploads_", dir=parent) # Private to this store, removed by close()
+        with open(os.path.join(self._dir, "owner.pid"), "w") as f: # Tells later stores whether this one is still alive
+            f.write(str(os.getpid()))
+        self.session_quota = session_quota
+        self.global_quota = global_quota
+        self.thumbnail_size = thumbnail_size
+        self._files = {} # key -> UploadEntry
+        self._holders = {} # key -> set of session ids referencing it
+        self._refs = OrderedDict() # (session_id, key) -> None, least recently used first
+        self._session_bytes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def session_bytes(self, session_id):
+        return self._session_bytes.get(session_id, 0)
+
+    def get(self, session_id, key):
+        """The entry for an upload this session references (marking it recently used), or None."""
+        with self._lock:
+            if (session_id, key) not in self._refs:
+                return None
+            self._refs.move_to_end((session_id, key))
+            return self._files[key]
+
+    def attach(self, session_id, key):
+        """References an already spilled upload from this session (no decoding); returns its entry, or None if the
+        content is not in the store."""
+        with self._lock:
+            entry = self._files.get(key)
+            if entry is not None:
+                self._add_ref(session_id, key)
+                self._enforce_quotas(session_id)
+                entry = entry if (session_id, key) in self._refs else None # Did not fit this session's quota after all
+            return entry
+
+    def put_pixels(self, session_id, key, name, pixels, mode):
+        """Spills decoded pixels under content `key` (or attaches to an existing copy) and references them from this
+        session. Returns the UploadEntry, or None if the image alone exceeds the quotas."""
+        existing = self.attach(session_id, key)
+        if existing is not None:
+            return existing
+        if pixels.nbytes > min(self.session_quota, self.global_quota):
+            print(f"Upload '{name}' ({pixels.nbytes / 1024 ** 2:.0f} MB decoded) exceeds the upload quota; keeping its thumbnail only")
+            return None
+        path = self._path(key, ".npy")
+        partial_path = f"{path}.{threading.get_ident()}.part.npy" # Per thread, so concurrent spills never share a file
+        np.save(partial_path, pixels)
+        return self._adopt(session_id, key, UploadEntry(name, path, pixels.nbytes, pixels.shape, mode), partial_path)
+
+    def put_file(self, session_id, key, name, fileobj, nbytes):
+        """Copies a raw upload of `nbytes` bytes under `key` (or attaches to an existing copy), keeping the extension of
+        `name`, and references it from this session. Returns the UploadEntry, or None if the file exceeds the quotas."""
+        existing = self.attach(session_id, key)
+        if existing is not None:
+            return existing
+        if nbytes > min(self.session_quota, self.global_quota):
+            print(f"Upload '{name}' ({nbytes / 1024 ** 2:.0f} MB) exceeds the upload quota; not spilled")
+            return None
+        path = self._path(key, os.path.splitext(name)[1].lower())
+        partial_path = f"{path}.{threading.get_ident()}.part"
+        fileobj.seek(0)
+        with open(partial_path, "wb") as f:
+            shutil.copyfileobj(fileobj, f, 1024 ** 2)
+        return self._adopt(session_id, key, UploadEntry(name, path, nbytes, None, None), partial_path)
+
+    def _path(self, key, ext):
+        return os.path.join(self._dir, hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20] + ext)
+
+    def _adopt(self, session_id, key, entry, partial_path):
+        """Moves a freshly written file into place as `entry` and references it from this session."""
+        with self._lock:
+            if key in self._files: # Another session spilled the same content meanwhile
+                os.remove(partial_path)
+            else:
+                os.replace(partial_path, entry.path)
+                self._files[key] = entry
+                self._holders[key] = set()
+                self._total_bytes += entry.nbytes
+            self._add_ref(session_id, key)
+            self._enforce_quotas(session_id)
+            return self._files[key] if (session_id, key) in self._refs else None
+
+    def put_image(self, session_id, key, name, fileobj):
+        """Decodes an image upload and spills it under content `key`.
+        Returns (thumbnail PNG bytes, UploadEntry or None if the decoded image exceeds the quotas)."""
+        thumbnail, pixels, mode = decode_image(fileobj, self.thumbnail_size)
+        return thumbnail, self.put_pixels(session_id, key, name, pixels, mode)
+
+    def load(self, session_id, key):
+        """Full-resolution pixels of a referenced upload as a read-only memory map, or None if evicted or never spilled."""
+        entry = self.get(session_id, key)
+        if entry is None:
+            return None
+        try:
+            return np.load(entry.path, mmap_mode="r")
+        except FileNotFoundError: # Last reference dropped by another thread between get() and load()
+            return None
+
+    def discard(self, session_id, key):
+        """Drops this session's reference; the file goes when no session references it."""
+        with self._lock:
+            return self._drop_ref(session_id, key)
+
+    def discard_session(self, session_id):
+        with self._lock:
+            for ref_session, key in [ref for ref in self._refs if ref[0] == session_id]:
+                self._drop_ref(ref_session, key)
+
+    def _add_ref(self, session_id, key):
+        if (session_id, key) in self._refs:
+            self._refs.move_to_end((session_id, key))
+            return
+        self._refs[(session_id, key)] = None
+        self._holders[key].add(session_id)
+        self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + self._files[key].nbytes
+
+    def _drop_ref(self, session_id, key):
+        if (session_id, key) not in self._refs:
+            return False
+        del self._refs[(session_id, key)]
+        entry = self._files[key]
+        self._session_bytes[session_id] -= entry.nbytes
+        if not self._session_bytes[session_id]:
+            del self._session_bytes[session_id]
+        self._holders[key].discard(session_id)
+        if not self._holders[key]:
+            del self._files[key], self._holders[key]
+            self._total_bytes -= entry.nbytes
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def _enforce_quotas(self, session_id):
+        """Drops least recently used references: the session's own while it is over its quota, then any while the
+        spilled files are over the global one."""
+        while self._session_bytes.get(session_id, 0) > self.session_quota:
+            self._evict(next(ref for ref in self._refs if ref[0] == session_id))
+        while self._total_bytes > self.global_quota:
+            self._evict(next(iter(self._refs)))
+
+    def _evict(self, ref):
+        entry = self._files[ref[1]]
+        self._drop_ref(*ref)
+        self.evictions += 1
+        print(f"Evicted upload '{entry.name}' ({entry.nbytes / 1024 ** 2:.1f} MB) for session {ref[0][:8]} from the upload store")
+
+    def close(self):
+        with self._lock:
+            self._files.clear()
+            self._holders.clear()
+            self._refs.clear()
+            self._session_bytes.clear()
+            self._total_bytes = 0
+        shutil.rmtree(self._dir, ignore_errors=True)